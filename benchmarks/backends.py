@@ -0,0 +1,70 @@
+import argparse
+import time
+
+from benchmarks.suite import WORKLOADS
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+from src.evaluator import BACKENDS, TREE
+from src.expressions import Expression
+
+
+def measure(workload_name: str, size: int, backend: str, rounds: int, exact_integers: bool = False) -> float:
+    """
+    Вычисляет заранее разобранные (и скомпилированные, кроме TREE) выражения нагрузки.
+    Объявления из нагрузки выполняются до измерения и в измерение не входят.
+    :param exact_integers: Режим целых чисел (см. EvaluationOptions.exact_integers)
+    :return: Вычислений в секунду
+    """
+    setup, lines = WORKLOADS[workload_name].build(size)
+    calculator = Calculator(backend=backend, exact_integers=exact_integers)
+    for line in setup:
+        calculator.execute(line)
+
+    expressions = []
+    for line in lines:
+        prepared = Calculator.prepare(line)
+        if calculator.nt_manager.is_declaration(prepared):
+            calculator.execute(line)
+            continue
+        expression = Expression(prepared)
+        expression.parse()
+        if backend != TREE:
+            expression.compile(calculator.options.compensated_sum, backend, exact_integers)
+        expressions.append(expression)
+
+    name_table = calculator.nt_manager.name_table
+    options = calculator.options
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for expression in expressions:
+            try:
+                expression.evaluate(name_table, options)
+            except UserFriendlyException:
+                pass
+    elapsed = time.perf_counter() - started
+    return len(expressions) * rounds / elapsed
+
+
+def main() -> None:
+    """
+    Сравнивает скорость вычисления разобранных выражений разными способами (ускорение - относительно обхода дерева)
+    """
+    parser = argparse.ArgumentParser(description="Сравнение способов вычисления выражений")
+    parser.add_argument("--scale", type=float, default=0.1, help="Множитель размеров нагрузок")
+    parser.add_argument("--rounds", type=int, default=3, help="Сколько раз вычислять каждое выражение")
+    parser.add_argument("--exact-integers", action="store_true", help="Режим точных целых чисел")
+    args = parser.parse_args()
+
+    compiled = [backend for backend in BACKENDS if backend != TREE]
+    print(f"{'нагрузка':<26} " + " ".join(f"{backend + ', оп/с':>12}" for backend in BACKENDS)
+          + "".join(f" {'x ' + backend:>10}" for backend in compiled))
+    for name, workload in WORKLOADS.items():
+        for size in workload.sizes:
+            size = max(1, int(size * args.scale))
+            speeds = {backend: measure(name, size, backend, args.rounds, args.exact_integers) for backend in BACKENDS}
+            print(f"{name + '/' + str(size):<26} " + " ".join(f"{speeds[backend]:>12.0f}" for backend in BACKENDS)
+                  + "".join(f" {speeds[backend] / speeds[TREE]:>10.2f}" for backend in compiled))
+
+
+if __name__ == "__main__":
+    main()
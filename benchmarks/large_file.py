@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.calculator import Calculator
+
+
+IDLE = "idle"
+"""
+Только запуск интерпретатора и импорт калькулятора: от этого пика памяти отсчитывается прирост
+"""
+STREAM = "stream"
+"""
+Calculator.evaluate_file: файл отображается в память и вычисляется по мере чтения лексем
+"""
+EXECUTE = "execute"
+"""
+Файл читается в строку и выполняется через Calculator.execute (нормализация ввода, разбор, обход дерева)
+"""
+MODES = (IDLE, STREAM, EXECUTE)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TERMS_PER_BLOCK = 10_000
+
+
+def write_expression(path: str, size: int) -> int:
+    """
+    Записывает в файл одно выражение - сумму произведений (как у сгенерированных выражений), блоками,
+    чтобы генератор сам не держал выражение в памяти
+    :param size: Примерный размер файла в байтах
+    :return: Количество слагаемых
+    """
+    terms = 0
+    written = 0
+    with open(path, "w", encoding="utf-8") as file:
+        while written < size:
+            block = " + ".join(f"{i % 97 + 1} * {i % 13}.5" for i in range(terms, terms + _TERMS_PER_BLOCK))
+            file.write(block if terms == 0 else " + " + block)
+            terms += _TERMS_PER_BLOCK
+            written += len(block) + 3
+    return terms
+
+
+def peak_rss_kib() -> float:
+    """
+    Пик резидентной памяти текущего процесса, КиБ
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform == "darwin" else peak    # на macOS ru_maxrss - в байтах
+
+
+def run(mode: str, path: str) -> dict:
+    """
+    Вычисляет выражение из файла в текущем процессе
+    :return: Время, пик памяти процесса и результат
+    """
+    result: float | None = None
+    started = time.perf_counter()
+    if mode == STREAM:
+        result = Calculator(cache_size=0).evaluate_file(path)
+    elif mode == EXECUTE:
+        with open(path, encoding="utf-8") as file:
+            result = Calculator(cache_size=0).execute(file.read())
+    return {"seconds": time.perf_counter() - started, "peak_rss_kib": peak_rss_kib(), "result": result}
+
+
+def measure(mode: str, path: str) -> dict:
+    """
+    Выполняет run в отдельном процессе: пик памяти процесса не сбрасывается, поэтому каждый режим измеряется отдельно
+    """
+    completed = subprocess.run([sys.executable, "-m", "benchmarks.large_file", "--child", mode, path],
+                               cwd=_ROOT, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Сравнивает время и пик памяти (RSS) вычисления одного большого выражения из файла
+    потоково (Calculator.evaluate_file) и через чтение в строку (Calculator.execute)
+    """
+    parser = argparse.ArgumentParser(description="Вычисление очень большого выражения из файла")
+    parser.add_argument("--megabytes", type=float, default=20, help="Размер сгенерированного выражения")
+    parser.add_argument("--modes", nargs="+", choices=MODES[1:], default=list(MODES[1:]))
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run(*args.child)))
+        return
+
+    handle, path = tempfile.mkstemp(suffix=".txt")
+    os.close(handle)
+    try:
+        terms = write_expression(path, int(args.megabytes * (1 << 20)))
+        print(f"файл: {os.path.getsize(path) / (1 << 20):.1f} МиБ, слагаемых: {terms}")
+
+        idle = measure(IDLE, path)["peak_rss_kib"]
+        print(f"{'режим':>10} {'время, с':>10} {'пик RSS, МиБ':>14} {'прирост, МиБ':>14}")
+        for mode in args.modes:
+            result = measure(mode, path)
+            peak = result["peak_rss_kib"]
+            print(f"{mode:>10} {result['seconds']:>10.3f} {peak / 1024:>14.1f} {(peak - idle) / 1024:>14.1f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
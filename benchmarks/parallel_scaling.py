@@ -0,0 +1,46 @@
+import argparse
+import os
+import time
+
+from src.calculator import Calculator
+from src.scripts import execute_script
+
+
+def build_script(lines: int, terms: int) -> list[str]:
+    """
+    Сценарий из независимых объявлений с длинными выражениями и одной итоговой строки, зависящей от всех
+    """
+    body = "+".join(f"({i}*2-1)/3" for i in range(terms))
+    script = [f"x{line} = {line} + {body}" for line in range(lines)]
+    script.append("+".join(f"x{line}" for line in range(min(lines, 100))))
+    return script
+
+
+def measure(script: list[str], workers: int) -> float:
+    started = time.perf_counter()
+    execute_script(Calculator(), script, workers=workers)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    """
+    Измеряет ускорение scripts.execute_script в зависимости от количества процессов
+    """
+    parser = argparse.ArgumentParser(description="Масштабирование параллельного выполнения сценария")
+    parser.add_argument("--lines", type=int, default=1_000)
+    parser.add_argument("--terms", type=int, default=50, help="Количество слагаемых в каждой строке")
+    args = parser.parse_args()
+
+    script = build_script(args.lines, args.terms)
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+
+    baseline = measure(script, 1)
+    print(f"{'процессов':>10} {'время, с':>10} {'строк/с':>10} {'ускорение':>10}")
+    for workers in counts:
+        elapsed = baseline if workers == 1 else measure(script, workers)
+        print(f"{workers:>10} {elapsed:>10.3f} {len(script) / elapsed:>10.0f} {baseline / elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
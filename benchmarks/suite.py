@@ -0,0 +1,319 @@
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Iterable
+
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+from src.evaluator import BACKENDS, TREE
+from src.expressions import Expression
+
+
+BASELINE_VERSION = 1
+DEFAULT_THRESHOLD = 0.25
+"""
+Допустимое ухудшение относительно базовой линии (0.25 - на 25%)
+"""
+
+
+class Workload:
+    """
+    Воспроизводимая нагрузка: для размера n строит объявления (не измеряются) и измеряемые строки
+    """
+
+    name: str
+    sizes: tuple[int, ...]
+    """
+    Размеры входных данных по умолчанию (по возрастанию)
+    """
+    api: str
+    """
+    "execute" - строки выполняются Calculator.execute (без кэша разобранных выражений),
+    "evaluate" - Expression(строка).evaluate с таблицей имен калькулятора
+    """
+    build: Callable[[int], tuple[list[str], list[str]]]
+
+    def __init__(self, name: str, sizes: tuple[int, ...], api: str, build: Callable[[int], tuple[list[str], list[str]]]):
+        self.name = name
+        self.sizes = sizes
+        self.api = api
+        self.build = build
+
+
+class Measurement:
+    """
+    Результат одной нагрузки одного размера
+    """
+
+    __slots__ = ("ops", "ops_per_sec", "p50_us", "p99_us", "peak_kib")
+
+    ops: int
+    ops_per_sec: float
+    p50_us: float
+    p99_us: float
+    peak_kib: float
+    """
+    Пик памяти, выделенной во время измеряемых строк (tracemalloc), КиБ
+    """
+
+    def __init__(self, ops: int, ops_per_sec: float, p50_us: float, p99_us: float, peak_kib: float):
+        self.ops = ops
+        self.ops_per_sec = ops_per_sec
+        self.p50_us = p50_us
+        self.p99_us = p99_us
+        self.peak_kib = peak_kib
+
+    def to_dict(self) -> dict[str, float]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict[str, float]) -> "Measurement":
+        return cls(**{field: data[field] for field in cls.__slots__})    # type: ignore
+
+
+def _repeats(n: int) -> int:
+    """
+    Количество повторов одной строки: для маленьких строк больше, чтобы p99 не определялся единственным замером
+    """
+    return max(20, 20_000 // n)
+
+
+def _plus_chain(n: int) -> tuple[list[str], list[str]]:
+    return [], ["+".join(str(i) for i in range(n))] * _repeats(n)
+
+
+def _deep_brackets(n: int) -> tuple[list[str], list[str]]:
+    return [], ["(" * n + "1+2" + ")" * n] * _repeats(n)
+
+
+def _many_arguments(n: int) -> tuple[list[str], list[str]]:
+    args = ",".join(str((i * 7919) % n) for i in range(n))
+    return [], [f"max({args})", f"min({args})"] * (_repeats(n) // 2)
+
+
+def _nested_calls(n: int) -> tuple[list[str], list[str]]:
+    setup = ["f0 = lambda(x): x + 1"]
+    setup += [f"f{i} = lambda(x): f{i - 1}(x) * 1" for i in range(1, n)]
+    return setup, [f"f{n - 1}({i})" for i in range(50)]
+
+
+def _large_name_table(n: int) -> tuple[list[str], list[str]]:
+    rng = random.Random(n)
+    setup = [f"v{i} = {i} * 0.5" for i in range(n)]
+    lines = ["+".join(f"v{rng.randrange(n)}" for _ in range(10)) for _ in range(200)]
+    return setup, lines
+
+
+def _repl_trace(n: int) -> tuple[list[str], list[str]]:
+    """
+    Смесь объявлений, выражений, вызовов функций и ошибок, как в сессии REPL
+    """
+    rng = random.Random(n)
+    lines = ["a = 1", "sq = lambda(x): x * x"]
+    for i in range(n):
+        kind = rng.random()
+        if kind < 0.3:
+            lines.append(f"a = a + {rng.randint(1, 9)}")
+        elif kind < 0.6:
+            lines.append(f"{rng.randint(1, 99)} * (a - {rng.randint(1, 9)}) / 3")
+        elif kind < 0.85:
+            lines.append(f"sq(a + {i % 10}) - max(a, {rng.randint(1, 50)}, 7)")
+        elif kind < 0.95:
+            lines.append(f"{rng.randint(1, 99)} // {rng.randint(1, 9)} ** 2")
+        else:
+            lines.append("1 / (a - a)")
+    return [], lines
+
+
+def _integer_ops(n: int) -> tuple[list[str], list[str]]:
+    """
+    Целочисленные операторы (//, %, степени) - быстрый путь режима целых чисел
+    """
+    rng = random.Random(n)
+    lines = [f"{rng.randint(1, 10 ** 6)} // {rng.randint(1, 99)} % {rng.randint(2, 999)} "
+             f"+ {rng.randint(1, 99)} ** {rng.randint(2, 5)} - {rng.randint(1, 10 ** 4)} * {rng.randint(1, 99)}"
+             for _ in range(n)]
+    return [], lines
+
+
+def _big_integers(n: int) -> tuple[list[str], list[str]]:
+    """
+    Результаты за пределами float: в режиме целых чисел - точные, иначе - ошибка переполнения
+    """
+    rng = random.Random(n)
+    lines = [f"{rng.randint(2, 9)} ** {rng.randint(300, 900)} * {rng.randint(2, 9)} ** {rng.randint(300, 900)} "
+             f"// 7 ** {rng.randint(100, 300)} % {rng.randint(10 ** 8, 10 ** 9)}"
+             for _ in range(n)]
+    return [], lines
+
+
+WORKLOADS = {workload.name: workload for workload in (
+    Workload("plus_chain", (100, 1_000, 10_000), "evaluate", _plus_chain),
+    Workload("deep_brackets", (10, 100, 1_000), "evaluate", _deep_brackets),
+    Workload("many_arguments", (10, 100, 1_000), "evaluate", _many_arguments),
+    Workload("nested_calls", (10, 50, 200), "execute", _nested_calls),
+    Workload("large_name_table", (100, 10_000, 100_000), "execute", _large_name_table),
+    Workload("repl_trace", (100, 1_000, 10_000), "execute", _repl_trace),
+    Workload("integer_ops", (100, 1_000, 10_000), "evaluate", _integer_ops),
+    Workload("big_integers", (10, 100, 1_000), "evaluate", _big_integers),
+)}
+
+
+def _runner(workload: Workload, setup: list[str], backend: str = TREE,
+            exact_integers: bool = False) -> Callable[[str], object]:
+    calculator = Calculator(cache_size=0, backend=backend, exact_integers=exact_integers)
+    for line in setup:
+        calculator.execute(line)
+
+    if workload.api == "execute":
+        return calculator.execute
+
+    name_table = calculator.nt_manager.name_table
+    options = calculator.options
+    return lambda line: Expression(Calculator.prepare(line)).evaluate(name_table=name_table, options=options)
+
+
+def _run_lines(run: Callable[[str], object], lines: list[str]) -> list[int]:
+    """
+    :return: Время выполнения каждой строки, нс. Ошибки калькулятора - тоже результат (например, в repl_trace).
+    """
+    timings = []
+    clock = time.perf_counter_ns
+    for line in lines:
+        started = clock()
+        try:
+            run(line)
+        except UserFriendlyException:
+            pass
+        timings.append(clock() - started)
+    return timings
+
+
+def _percentile(ordered: list[int], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(workload: Workload, size: int, backend: str = TREE, exact_integers: bool = False) -> Measurement:
+    """
+    Выполняет нагрузку дважды: для времени (без трассировки памяти) и для пика памяти (с tracemalloc)
+    :param backend: Способ вычисления (см. EvaluationOptions.backend)
+    :param exact_integers: Режим целых чисел (см. EvaluationOptions.exact_integers)
+    """
+    setup, lines = workload.build(size)
+
+    timings = _run_lines(_runner(workload, setup, backend, exact_integers), lines)
+    ordered = sorted(timings)
+
+    run = _runner(workload, setup, backend, exact_integers)
+    tracemalloc.start()
+    try:
+        _run_lines(run, lines)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Measurement(ops=len(lines), ops_per_sec=len(lines) / (sum(timings) / 1e9 or 1e-9),
+                       p50_us=_percentile(ordered, 0.5) / 1e3, p99_us=_percentile(ordered, 0.99) / 1e3,
+                       peak_kib=peak / 1024)
+
+
+def run_suite(names: Iterable[str], scale: float = 1.0, backend: str = TREE,
+              exact_integers: bool = False) -> dict[str, Measurement]:
+    """
+    :param names: Названия нагрузок из WORKLOADS
+    :param scale: Множитель размеров (например, 0.1 для быстрой проверки)
+    :param backend: Способ вычисления (см. EvaluationOptions.backend)
+    :param exact_integers: Режим целых чисел (см. EvaluationOptions.exact_integers)
+    :return: "нагрузка/размер" -> результат
+    """
+    results: dict[str, Measurement] = {}
+    for name in names:
+        workload = WORKLOADS[name]
+        for size in workload.sizes:
+            size = max(1, int(size * scale))
+            results[f"{name}/{size}"] = measure(workload, size, backend, exact_integers)
+    return results
+
+
+def compare(results: dict[str, Measurement], baseline: dict[str, Measurement],
+            threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    Сравнивает результаты с базовой линией. Нагрузки, которых нет в базовой линии, не сравниваются.
+    :param threshold: Допустимое относительное ухудшение ops/s, p99 и пика памяти
+    :return: Описания регрессий (пустой список - регрессий нет)
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+
+        if current.ops_per_sec < previous.ops_per_sec * (1 - threshold):
+            regressions.append(f"{key}: ops/s {previous.ops_per_sec:.0f} -> {current.ops_per_sec:.0f}")
+        if current.p99_us > previous.p99_us * (1 + threshold):
+            regressions.append(f"{key}: p99 {previous.p99_us:.1f} -> {current.p99_us:.1f} мкс")
+        if current.peak_kib > previous.peak_kib * (1 + threshold):
+            regressions.append(f"{key}: память {previous.peak_kib:.0f} -> {current.peak_kib:.0f} КиБ")
+    return regressions
+
+
+def save_baseline(results: dict[str, Measurement], path: str) -> None:
+    data = {"version": BASELINE_VERSION, "python": sys.version.split()[0],
+            "results": {key: measurement.to_dict() for key, measurement in results.items()}}
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=2, ensure_ascii=False)
+
+
+def load_baseline(path: str) -> dict[str, Measurement]:
+    """
+    :raises ValueError: Файл записан другой версией формата
+    """
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    if data.get("version") != BASELINE_VERSION:
+        raise ValueError(f"Неподдерживаемая версия базовой линии: {data.get('version')}")
+    return {key: Measurement.from_dict(measurement) for key, measurement in data["results"].items()}
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Запускает нагрузки, печатает таблицу результатов, сохраняет и сравнивает базовую линию.
+    Код возврата 1 - есть регрессии относительно --compare.
+    """
+    parser = argparse.ArgumentParser(prog="python3 -m benchmarks.suite", description="Нагрузочные тесты калькулятора")
+    parser.add_argument("workloads", nargs="*", help=f"Нагрузки (по умолчанию все): {', '.join(WORKLOADS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="Множитель размеров входных данных")
+    parser.add_argument("--save", metavar="PATH", help="Сохранить результаты как базовую линию (JSON)")
+    parser.add_argument("--compare", metavar="PATH", help="Сравнить с базовой линией (JSON)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимое относительное ухудшение (по умолчанию %(default)s)")
+    parser.add_argument("--backend", choices=BACKENDS, default=TREE, help="Способ вычисления выражений")
+    parser.add_argument("--exact-integers", action="store_true", help="Режим точных целых чисел")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"Неизвестные нагрузки: {', '.join(unknown)}")
+
+    results = run_suite(args.workloads or list(WORKLOADS), args.scale, args.backend, args.exact_integers)
+
+    print(f"{'нагрузка':<26} {'операций':>9} {'оп/с':>11} {'p50, мкс':>10} {'p99, мкс':>10} {'память, КиБ':>12}")
+    for key, result in results.items():
+        print(f"{key:<26} {result.ops:>9} {result.ops_per_sec:>11.0f} {result.p50_us:>10.1f} {result.p99_us:>10.1f} "
+              f"{result.peak_kib:>12.1f}")
+
+    if args.save:
+        save_baseline(results, args.save)
+
+    if args.compare:
+        regressions = compare(results, load_baseline(args.compare), args.threshold)
+        for regression in regressions:
+            print(f"Регрессия: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
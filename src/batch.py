@@ -0,0 +1,330 @@
+from functools import reduce
+from typing import Any, Callable, Mapping
+
+try:
+    import numpy as np
+    HAVE_NUMPY = True
+except ImportError:    # numpy - необязательная зависимость, нужна только для пакетного вычисления
+    np = None    # type: ignore[assignment]
+    HAVE_NUMPY = False
+
+from src.common import UserFriendlyException, NameLookup
+from src.functions import Function, ConditionalFunction
+from src.name_tables import BUILTINS
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.operators import BinaryOperator
+from src.user_functions import UserDefinedFunction
+
+
+OK = 0
+DIVISION_BY_ZERO = 1
+NOT_INTEGER = 2
+OVERFLOW = 3
+INVALID_ARGUMENT = 4
+
+ERROR_MESSAGES = {
+    DIVISION_BY_ZERO: "деление на ноль",
+    NOT_INTEGER: "операция допустима только над целыми числами",
+    OVERFLOW: "переполнение",
+    INVALID_ARGUMENT: "недопустимый аргумент",
+}
+"""
+Описание кодов ошибок, которые пакетное вычисление записывает для каждого элемента
+"""
+
+
+class BatchResult:
+    """
+    Результат пакетного вычисления выражения.
+    Ошибки (деление на ноль, нецелые операнды // и % и т. п.) не прерывают вычисление, а записываются для каждого элемента:
+    в values на месте ошибки стоит nan, а в errors - код первой возникшей ошибки (см. ERROR_MESSAGES).
+    """
+
+    values: Any
+    """
+    numpy.ndarray значений (float64)
+    """
+    errors: Any
+    """
+    numpy.ndarray кодов ошибок (int8), OK для успешно вычисленных элементов
+    """
+
+    def __init__(self, values: Any, errors: Any):
+        self.values = values
+        self.errors = errors
+
+    @property
+    def error_mask(self) -> Any:
+        """
+        Маска элементов, при вычислении которых возникла ошибка
+        """
+        return self.errors != OK
+
+    def error_message(self, index: Any) -> str | None:
+        """
+        :param index: Индекс элемента
+        :return: Описание ошибки элемента или None, если ошибки нет
+        """
+        return ERROR_MESSAGES.get(int(self.errors[index]))
+
+
+def evaluate_batch(tree: Node, bindings: Mapping[str, Any], name_table: NameLookup) -> BatchResult:
+    """
+    Вычисляет выражение сразу для множества значений переменных с помощью numpy.
+    Операторы и встроенные функции применяются к целым массивам (ufunc), а не к каждому элементу по отдельности.
+    Семантика совпадает с Expression.evaluate, включая округление до 2 знаков после каждого оператора.
+    :param tree: Корень синтаксического дерева
+    :param bindings: Значения переменных: имя -> массив (или число). Массивы должны быть совместимы по форме (broadcasting).
+    :param name_table: Таблица имен для остальных переменных и функций
+    :raises UserFriendlyException: numpy не установлен, либо ошибка, не зависящая от значений (неизвестный идентификатор и т. п.)
+    :return: Значения и коды ошибок для каждого элемента
+    """
+    if not HAVE_NUMPY:
+        raise UserFriendlyException("Для пакетного вычисления требуется установить numpy")
+
+    arrays = {name: np.asarray(value, dtype=np.float64) for name, value in bindings.items()}
+    shape = np.broadcast_shapes(*(array.shape for array in arrays.values()))
+
+    errors = np.zeros(shape, dtype=np.int8)
+    values = _BatchEvaluator(name_table, errors).evaluate(tree, arrays)
+
+    values = np.array(np.broadcast_to(values, shape), dtype=np.float64)
+    values[errors != OK] = np.nan
+    return BatchResult(values, errors)
+
+
+_EXACT = 2.0 ** 52
+"""
+float с модулем не меньше этого - целые числа, и round их не меняет
+"""
+
+
+def _round(values: Any) -> Any:
+    """
+    Округление до 2 знаков после запятой с тем же результатом, что и round(value, 2) (см. BinaryOperator.__call__).
+    np.round(values, 2) делит на 100 округленное произведение values * 100: при большом модуле произведение теряет
+    точность, а значение, близкое к половине сотой, может округлиться в другую сторону.
+    Такие элементы округляются поэлементно через round.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    result = np.rint(scaled) / 100
+    magnitude = np.abs(scaled)
+    # погрешность произведения - не больше половины единицы последнего разряда, т. е. magnitude * 2 ** -53
+    exact = np.abs(values) >= _EXACT
+    doubtful = ((np.abs(scaled - np.floor(scaled) - 0.5) <= magnitude * 2.0 ** -50) | (magnitude >= _EXACT)) & ~exact
+    result = np.where(exact, values, result)
+    if np.any(doubtful):
+        result[doubtful] = [round(float(value), 2) for value in values[doubtful]]
+    return result
+
+
+_BRANCH = object()
+"""
+Состояние узла вызова if на стеке обхода: условие вычислено (см. evaluator._BRANCH)
+"""
+
+
+class _BatchEvaluator:
+    """
+    Вычисляет синтаксическое дерево над массивами numpy. Как и evaluator.evaluate, обходит дерево с явным стеком.
+    Обе ветки if вычисляются для всех элементов, а ошибки каждого элемента берутся только из выбранной им ветки.
+    Поэтому рекурсивные пользовательские функции пакетно не вычисляются (превышается лимит рекурсии).
+    """
+
+    __name_table: NameLookup
+    __errors: Any
+    __operators: dict[BinaryOperator, Callable[[Any, Any], Any]]
+    __builtins: dict[Function, Callable[[Call, list[Any]], Any]]
+
+    def __init__(self, name_table: NameLookup, errors: Any):
+        self.__name_table = name_table
+        self.__errors = errors
+
+        op = BinaryOperator.from_symbol
+        self.__operators = {
+            op("+"): np.add,
+            op("-"): np.subtract,
+            op("*"): np.multiply,
+            op("/"): self.__true_divide,
+            op("#"): self.__floor_divide,
+            op("%"): self.__mod,
+            op("^"): self.__power,
+            op("<"): self.__comparison(np.less),
+            op(">"): self.__comparison(np.greater),
+            op("{"): self.__comparison(np.less_equal),
+            op("}"): self.__comparison(np.greater_equal),
+            op("~"): self.__comparison(np.equal),
+            op("!"): self.__comparison(np.not_equal),
+        }
+        self.__builtins = {
+            BUILTINS["sqrt"]: self.__sqrt,
+            BUILTINS["abs"]: lambda call, args: np.abs(*self.__exact_args(call, args, 1)),
+            BUILTINS["pow"]: lambda call, args: self.__power(*self.__exact_args(call, args, 2)),
+            BUILTINS["min"]: lambda call, args: reduce(np.minimum, self.__at_least_args(call, args, 2)),
+            BUILTINS["max"]: lambda call, args: reduce(np.maximum, self.__at_least_args(call, args, 2)),
+        }
+
+    def evaluate(self, tree: Node, local_names: dict[str, Any]) -> Any:
+        """
+        :param tree: Корень синтаксического дерева
+        :param local_names: Переменные-массивы (значения пакета или аргументы пользовательской функции)
+        :return: Массив значений (или число, если выражение не зависит от массивов)
+        """
+        values: list[Any] = []
+        pending: list[tuple[Node, object]] = [(tree, False)]
+
+        while pending:
+            node, expanded = pending.pop()
+
+            if isinstance(node, Number):
+                values.append(np.float64(node.value))
+
+            elif isinstance(node, Name):
+                if node.identifier in local_names:
+                    values.append(local_names[node.identifier])
+                else:
+                    values.append(np.float64(node.resolve(self.__name_table)))
+
+            elif isinstance(node, OperatorChain):
+                if expanded:
+                    first_operand = len(values) - len(node.operands)
+                    result = self.__fold(node, values[first_operand:])
+                    del values[first_operand:]
+                    values.append(result)
+                else:
+                    pending.append((node, True))
+                    pending.extend((operand, False) for operand in reversed(node.operands))
+
+            elif isinstance(node, Call):
+                if expanded is _BRANCH:
+                    values.append(self.__branch(node, values.pop(), local_names))
+                elif expanded:
+                    first_arg = len(values) - len(node.args)
+                    args = values[first_arg:]
+                    del values[first_arg:]
+                    values.append(self.__call(node, args, local_names))
+                else:
+                    target = node.resolve(self.__name_table)    # проверка идентификатора до вычисления аргументов
+                    if isinstance(target, ConditionalFunction) and len(node.args) == target.ARGUMENTS:
+                        pending.append((node, _BRANCH))
+                        pending.append((node.args[0], False))
+                        continue
+                    pending.append((node, True))
+                    pending.extend((arg, False) for arg in reversed(node.args))
+
+            else:
+                raise TypeError(f"Неизвестный тип узла: {type(node).__name__}")
+
+        return values[0]
+
+    def __fail(self, mask: Any, code: int) -> None:
+        """
+        Записывает код ошибки для элементов из маски, у которых еще нет ошибки
+        """
+        if np.any(mask):
+            self.__errors[(self.__errors == OK) & mask] = code
+
+    def __fold(self, chain: OperatorChain, values: list[Any]) -> Any:
+        operators = chain.operators
+        with np.errstate(all="ignore"):
+            if chain.right_associative:
+                result = values[-1]
+                for index in range(len(operators) - 1, -1, -1):
+                    result = _round(self.__operators[operators[index]](values[index], result))
+            else:
+                result = values[0]
+                for index, operator in enumerate(operators):
+                    result = _round(self.__operators[operator](result, values[index + 1]))
+        return result
+
+    def __branch(self, call: Call, condition: Any, local_names: dict[str, Any]) -> Any:
+        """
+        if(cond, a, b) над массивами: обе ветки вычисляются целиком, значения и ошибки выбираются по условию
+        """
+        chosen = np.broadcast_to(condition != 0, self.__errors.shape)
+        errors_before = self.__errors.copy()
+        if_true = self.evaluate(call.args[1], local_names)
+        errors_if_true = self.__errors.copy()
+        self.__errors[...] = errors_before
+        if_false = self.evaluate(call.args[2], local_names)
+        self.__errors[...] = np.where(chosen, errors_if_true, self.__errors)
+        return np.where(condition != 0, if_true, if_false)
+
+    def __call(self, call: Call, args: list[Any], local_names: dict[str, Any]) -> Any:
+        target = call.resolve(self.__name_table)
+
+        if target in self.__builtins:
+            with np.errstate(all="ignore"):
+                return self.__builtins[target](call, args)
+
+        if isinstance(target, UserDefinedFunction):
+            self.__exact_args(call, args, len(target.arg_names))
+            # как и при обычном вызове, аргументы видны поверх имен вызывающего выражения
+            return self.evaluate(target.body, local_names | dict(zip(target.arg_names, args)))
+
+        # произвольная функция - поэлементно
+        def apply(*elements: float) -> float:
+            try:
+                return call.invoke(target, list(elements), self.__name_table)
+            except UserFriendlyException:
+                return np.nan
+
+        result = np.vectorize(apply, otypes=[np.float64])(*args)
+        self.__fail(np.isnan(result), INVALID_ARGUMENT)
+        return result
+
+    @staticmethod
+    def __exact_args(call: Call, args: list[Any], count: int) -> list[Any]:
+        if len(args) != count:
+            raise UserFriendlyException(f"Ошибка в вызове функции: {call.text}\n"
+                                        f"Неверное количество аргументов: ожидалось {count}, передано {len(args)}")
+        return args
+
+    @staticmethod
+    def __at_least_args(call: Call, args: list[Any], count: int) -> list[Any]:
+        if len(args) < count:
+            raise UserFriendlyException(f"Ошибка в вызове функции: {call.text}\n"
+                                        f"Неверное количество аргументов: ожидалось не менее {count}, передано {len(args)}")
+        return args
+
+    def __true_divide(self, left: Any, right: Any) -> Any:
+        zero = right == 0
+        self.__fail(zero, DIVISION_BY_ZERO)
+        return np.true_divide(left, np.where(zero, np.nan, right))
+
+    def __check_integer_operands(self, left: Any, right: Any) -> Any:
+        """
+        Проверки операторов // и %: сначала деление на ноль, затем целочисленность (как assert_right_is_non_zero/assert_integers)
+        :return: Правый операнд, в котором нули заменены на nan
+        """
+        zero = right == 0
+        self.__fail(zero, DIVISION_BY_ZERO)
+        self.__fail((np.mod(left, 1) != 0) | (np.mod(right, 1) != 0), NOT_INTEGER)
+        return np.where(zero, np.nan, right)
+
+    def __floor_divide(self, left: Any, right: Any) -> Any:
+        return np.floor_divide(left, self.__check_integer_operands(left, right))
+
+    def __mod(self, left: Any, right: Any) -> Any:
+        return np.mod(left, self.__check_integer_operands(left, right))
+
+    def __power(self, left: Any, right: Any) -> Any:
+        result = np.power(left, right)
+        finite_operands = np.isfinite(left) & np.isfinite(right)
+        self.__fail(finite_operands & (left == 0) & (right < 0), DIVISION_BY_ZERO)
+        self.__fail(finite_operands & np.isinf(result), OVERFLOW)
+        self.__fail(finite_operands & np.isnan(result), INVALID_ARGUMENT)
+        return result
+
+    @staticmethod
+    def __comparison(compare: Callable[[Any, Any], Any]) -> Callable[[Any, Any], Any]:
+        """
+        Сравнение дает 1.0 или 0.0, как и BinaryOperator
+        """
+        return lambda left, right: np.asarray(compare(left, right), dtype=np.float64)
+
+    def __sqrt(self, call: Call, args: list[Any]) -> Any:
+        (value, ) = self.__exact_args(call, args, 1)
+        self.__fail(value < 0, INVALID_ARGUMENT)
+        return np.sqrt(value)
@@ -0,0 +1,107 @@
+import time
+from contextvars import ContextVar, Token
+
+from src.common import UserFriendlyException
+
+
+CLOCK_CHECK_INTERVAL = 64
+"""
+Через сколько списанных операций и вызовов проверяется время (чтение часов дороже проверки счетчиков)
+"""
+
+
+class BudgetExceededError(UserFriendlyException):
+    """
+    Вычисление прервано: исчерпан бюджет операций, вызовов или времени, либо вычисление отменено
+    """
+    pass
+
+
+class Budget:
+    """
+    Ограничения одного вычисления: количество операций, количество вызовов пользовательских функций и время.
+    Активируется как контекстный менеджер (with budget: ...) и действует на все вложенные вычисления,
+    включая тела вызываемых функций. При каждой активации счетчики и отсчет времени начинаются заново.
+    cancel() можно вызвать из другого потока или обработчика сигнала: вычисление прервется в ближайшей точке проверки.
+    """
+
+    __slots__ = ("max_operations", "max_calls", "max_seconds", "operations", "calls", "cancelled",
+                 "__deadline", "__until_clock_check", "__token")
+
+    max_operations: int | None
+    """
+    Максимальное количество операторов и вызовов встроенных функций. None - без ограничения.
+    """
+    max_calls: int | None
+    """
+    Максимальное количество вызовов пользовательских функций. None - без ограничения.
+    """
+    max_seconds: float | None
+    operations: int
+    calls: int
+    cancelled: bool
+
+    __deadline: float | None
+    __until_clock_check: int
+    __token: Token | None
+
+    def __init__(self, max_operations: int | None = None, max_calls: int | None = None,
+                 max_seconds: float | None = None):
+        self.max_operations = max_operations
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self.operations = 0
+        self.calls = 0
+        self.cancelled = False
+        self.__deadline = None
+        self.__until_clock_check = CLOCK_CHECK_INTERVAL
+        self.__token = None
+
+    def __enter__(self) -> "Budget":
+        self.operations = 0
+        self.calls = 0
+        self.cancelled = False
+        self.__deadline = time.monotonic() + self.max_seconds if self.max_seconds is not None else None
+        self.__until_clock_check = CLOCK_CHECK_INTERVAL
+        self.__token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self.__token is not None:
+            _current.reset(self.__token)
+            self.__token = None
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def charge(self, operations: int = 0, calls: int = 0) -> None:
+        """
+        Списывает операции и вызовы функций
+        :raises BudgetExceededError: Бюджет исчерпан или вычисление отменено
+        """
+        self.operations += operations
+        self.calls += calls
+
+        if self.cancelled:
+            raise BudgetExceededError("Вычисление отменено")
+        if self.max_operations is not None and self.operations > self.max_operations:
+            raise BudgetExceededError(f"Превышен лимит операций: {self.max_operations}")
+        if self.max_calls is not None and self.calls > self.max_calls:
+            raise BudgetExceededError(f"Превышен лимит вызовов функций: {self.max_calls}")
+
+        if self.__deadline is not None:
+            self.__until_clock_check -= operations + calls
+            if self.__until_clock_check <= 0:
+                self.__until_clock_check = CLOCK_CHECK_INTERVAL
+                if time.monotonic() > self.__deadline:
+                    raise BudgetExceededError(f"Превышен лимит времени: {self.max_seconds} с")
+
+
+_current: ContextVar[Budget | None] = ContextVar("budget", default=None)
+
+
+def current() -> Budget | None:
+    """
+    Бюджет, активный в текущем контексте (потоке, задаче asyncio)
+    """
+    return _current.get()
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from typing import Generic, TypeVar, Hashable
+
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Ограниченный по размеру кэш, вытесняющий давно не использованные записи.
+    Считает попадания и промахи, чтобы можно было оценить эффективность кэша.
+    """
+
+    maxsize: int
+    hits: int
+    misses: int
+
+    __entries: OrderedDict[K, V]
+
+    def __init__(self, maxsize: int):
+        """
+        :param maxsize: Максимальное количество записей. 0 - кэш отключен (всегда промах).
+        """
+        if maxsize < 0:
+            raise ValueError("Размер кэша не может быть отрицательным")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        """
+        Возвращает значение по ключу и помечает запись как недавно использованную.
+        :return: Значение или None, если записи нет
+        """
+        try:
+            value = self.__entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: K, value: V) -> None:
+        """
+        Добавляет запись. Если кэш переполнен, вытесняет самую давно использованную запись.
+        """
+        if self.maxsize == 0:
+            return
+
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        """
+        Удаляет запись, если она есть
+        """
+        self.__entries.pop(key, None)
+
+    def clear(self, reset_stats: bool = True) -> None:
+        """
+        Удаляет все записи
+        :param reset_stats: Сбросить также счетчики попаданий и промахов
+        """
+        self.__entries.clear()
+        if reset_stats:
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Доля попаданий среди всех обращений (0, если обращений не было)
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self.__entries
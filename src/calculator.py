@@ -1,6 +1,18 @@
+import mmap
+import os
+from typing import Any, Mapping
+
+from src import profiling
+from src.batch import BatchResult, evaluate_batch
+from src.budgets import Budget, BudgetExceededError
+from src.cache import LRUCache
+from src.evaluator import EvaluationOptions, TREE, MAX_CALL_DEPTH
 from src.expressions import Expression
+from src.interning import NodeInterner
 from src.common import UserFriendlyException
-from src.name_tables import NametableManager
+from src.name_tables import NametableManager, SharedNames
+from src.operators import as_integer, translate_spellings
+from src.streaming import evaluate_buffer
 
 
 class Calculator:
@@ -8,41 +20,216 @@ class Calculator:
     Калькулятор)
     Очищает пользовательский ввод, преобразует некоторые операторы.
     Управляет объявлением переменных, которые могут быть использованы в выражении.
+    Разобранные выражения кэшируются, поэтому повторяющийся ввод не разбирается заново.
+    Одинаковые подвыражения хранятся одним узлом (interning.py), чистые повторы вычисляются один раз за вычисление.
     """
 
+    DEFAULT_CACHE_SIZE = 1024
+
     nt_manager: NametableManager
+    expression_cache: LRUCache[str, Expression]
+    """
+    Кэш разобранных выражений. Ключ - нормализованный ввод (после __clean и __translate_operators)
+    """
+
+    max_depth: int | None
+    """
+    Максимальная глубина вложенности скобок и вызовов функций. None - ограничена только памятью.
+    """
+
+    options: EvaluationOptions
+
+    interner: NodeInterner
+    """
+    Таблица уникальных узлов сессии: одинаковые подвыражения всех выражений, тел функций и формул
+    хранятся одним объектом (см. interning.py)
+    """
 
-    def __init__(self):
-        self.nt_manager = NametableManager()
+    __settings: dict[str, Any]
 
-    def execute(self, user_input: str) -> float | None:
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE, max_depth: int | None = None,
+                 compensated_sum: bool = False, memo_size: int = 0, formula_mode: bool = False,
+                 fold_globals: bool = False, base: SharedNames | None = None, backend: str = TREE,
+                 max_call_depth: int = MAX_CALL_DEPTH, exact_integers: bool = False):
+        """
+        :param cache_size: Максимальное количество разобранных выражений в кэше. 0 - кэш отключен.
+        :param max_depth: Максимальная глубина вложенности скобок и вызовов функций. None - без ограничения.
+        :param compensated_sum:
+            Суммировать цепочки сложений/вычитаний точно, с одним округлением в конце (см. EvaluationOptions)
+        :param memo_size:
+            Сколько результатов запоминать для каждой пользовательской функции (см. UserDefinedFunction.memo). 0 - не запоминать.
+        :param formula_mode:
+            Запоминать выражения переменных и пересчитывать зависимые переменные при переобъявлении (см. NametableManager)
+        :param fold_globals:
+            Подставлять в тела объявляемых функций значения глобальных переменных на момент объявления
+        :param base:
+            Общая неизменяемая таблица имен (например, библиотека констант и функций), разделяемая между калькуляторами.
+            None - только встроенные функции.
+        :param backend:
+            Способ вычисления: TREE - обход синтаксического дерева, VM - стековая машина (см. vm.py),
+            PYTHON - сгенерированная функция Python (см. codegen.py)
+        :param max_call_depth:
+            Максимальная глубина вызовов пользовательских функций (рекурсии), включая хвостовые вызовы
+        :param exact_integers:
+            Вычислять над целыми числами точно (int произвольной длины, см. BinaryOperator.exact).
+            Целый результат возвращается как int. На пакетное вычисление (evaluate_batch) не влияет.
+        """
+        self.options = EvaluationOptions(compensated_sum=compensated_sum, backend=backend,
+                                         max_call_depth=max_call_depth, exact_integers=exact_integers)
+        self.interner = NodeInterner()
+        self.nt_manager = NametableManager(max_depth=max_depth, options=self.options, memo_size=memo_size,
+                                           formula_mode=formula_mode, fold_globals=fold_globals, base=base,
+                                           interner=self.interner)
+        self.expression_cache = LRUCache(cache_size)
+        self.max_depth = max_depth
+        self.__settings = dict(cache_size=cache_size, max_depth=max_depth, compensated_sum=compensated_sum,
+                               memo_size=memo_size, formula_mode=formula_mode, fold_globals=fold_globals, base=base,
+                               backend=backend, max_call_depth=max_call_depth, exact_integers=exact_integers)
+
+    def settings(self) -> dict[str, Any]:
+        """
+        Параметры, с которыми создан калькулятор: Calculator(**calculator.settings()) создает калькулятор
+        с теми же настройками, но с пустой таблицей имен (например, в дочернем процессе, см. scripts.py)
+        """
+        return dict(self.__settings)
+
+    def execute(self, user_input: str, budget: Budget | None = None) -> float | None:
         """
         Обрабатывает пользовательский ввод.
         Вычисляет значение выражения или задает значение переменной в зависимости от ввода.
         :param user_input: Произвольная строка
+        :param budget:
+            Ограничения на количество операций, вызовов функций и время (в том числе при пересчете формул).
+            None - без ограничений.
         :return: Число, если значение вычислено; None, если было успешно выполнено действие (объявлена переменная)
         :raises UserFriendlyException: Ввод некорректен. Подробности в исключении.
+        :raises BudgetExceededError: Бюджет исчерпан или вычисление отменено (объявление при этом не выполняется)
         """
-        prepared = self.__clean(user_input)
-        prepared = self.__translate_operators(prepared)
+        if budget is None:
+            return self.__execute(user_input)
+        with budget:
+            return self.__execute(user_input)
+
+    def __execute(self, user_input: str) -> float | None:
+        profile = profiling.enabled
+        started = profiling.clock() if profile else 0
+        prepared = self.prepare(user_input)
+        if profile:
+            profiling.PROFILER.add(profiling.PREPARE, profiling.clock() - started)
 
-        if not prepared:
-            raise UserFriendlyException("Пустой ввод")
+        expression = self.expression_cache.get(prepared)
+        if expression is None:
+            if not prepared:
+                raise UserFriendlyException("Пустой ввод")
 
-        if self.nt_manager.is_declaration(prepared):
-            try:
-                self.nt_manager.declare_from_string(prepared)
-            except Exception as e:
-                raise UserFriendlyException(f"Ошибка при объявлении переменной: {str(e)}") from e
+            if self.nt_manager.is_declaration(prepared):
+                # объявления выполняются сразу и не должны оставаться в кэше
+                self.expression_cache.invalidate(prepared)
+                started = profiling.clock() if profile else 0
+                try:
+                    self.nt_manager.declare_from_string(prepared)
+                except BudgetExceededError:
+                    raise
+                except Exception as e:
+                    raise UserFriendlyException(f"Ошибка при объявлении переменной: {str(e)}") from e
+                finally:
+                    if profile:
+                        profiling.PROFILER.add(profiling.DECLARE, profiling.clock() - started)
 
-            return None
+                return None
+
+            expression = self.__parse(prepared)
 
-        expression = Expression(prepared)
         try:
-            return expression.evaluate(name_table=self.nt_manager.name_table)
+            result = expression.evaluate(name_table=self.nt_manager.name_table, options=self.options)
         except RecursionError:
             raise UserFriendlyException("Достигнут лимит рекурсии")
 
+        return self.__result(result)
+
+    def evaluate_file(self, path: str, budget: Budget | None = None) -> float:
+        """
+        Вычисляет одно выражение, записанное в файле целиком (например, сгенерированное выражение в сотни мегабайт).
+        Файл отображается в память (mmap) и вычисляется по мере чтения лексем (см. streaming.evaluate_buffer),
+        без полной копии ввода, списка всех лексем и синтаксического дерева, поэтому дополнительная память не растет
+        с длиной выражения. Пробелы и переводы строк убираются, как пробелы в execute. Выражение не кэшируется.
+        :param path: Путь к файлу в кодировке UTF-8
+        :param budget: Ограничения вычисления (см. execute)
+        :return: Значение выражения
+        :raises UserFriendlyException: Выражение некорректно. Подробности в исключении.
+        :raises BudgetExceededError: Бюджет исчерпан или вычисление отменено
+        :raises OSError: Файл не удалось прочитать
+        """
+        if budget is None:
+            return self.__evaluate_file(path)
+        with budget:
+            return self.__evaluate_file(path)
+
+    def __evaluate_file(self, path: str) -> float:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                raise UserFriendlyException("Пустой ввод")    # пустой файл нельзя отобразить в память
+
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                try:
+                    result = evaluate_buffer(data, self.nt_manager.name_table, self.options, self.max_depth)
+                except RecursionError:
+                    raise UserFriendlyException("Достигнут лимит рекурсии")
+
+        return self.__result(result)
+
+    def __result(self, result: float) -> float:
+        """
+        В режиме целых чисел целый результат возвращается как int
+        """
+        if self.options.exact_integers:
+            integer = as_integer(result)
+            if integer is not None:
+                return integer
+        return result
+
+    def evaluate_batch(self, user_input: str, bindings: Mapping[str, Any]) -> BatchResult:
+        """
+        Вычисляет выражение для множества значений переменных за один проход по массивам numpy (см. batch.py).
+        Переменные, которых нет в bindings, берутся из таблицы имен калькулятора.
+        :param user_input: Выражение (объявления не поддерживаются)
+        :param bindings: Значения переменных: имя -> массив значений
+        :return: Значения и коды ошибок для каждого элемента
+        :raises UserFriendlyException: Ввод некорректен или numpy не установлен. Подробности в исключении.
+        """
+        prepared = self.prepare(user_input)
+
+        expression = self.expression_cache.get(prepared)
+        if expression is None:
+            if not prepared:
+                raise UserFriendlyException("Пустой ввод")
+
+            if self.nt_manager.is_declaration(prepared):
+                raise UserFriendlyException("Пакетно можно вычислять только выражения")
+
+            expression = self.__parse(prepared)
+
+        try:
+            return evaluate_batch(expression.parse(), bindings, self.nt_manager.name_table)
+        except RecursionError:
+            raise UserFriendlyException("Достигнут лимит рекурсии")
+
+    def __parse(self, prepared: str) -> Expression:
+        """
+        Разбирает нормализованный ввод и помещает выражение в кэш
+        """
+        expression = Expression(prepared, max_depth=self.max_depth, interner=self.interner)
+        expression.parse(self.nt_manager.name_table)
+        self.expression_cache.put(prepared, expression)
+        return expression
+
+    @classmethod
+    def prepare(cls, user_input: str) -> str:
+        """
+        Нормализует ввод: убирает незначащие символы и преобразует операторы (ключ кэша выражений)
+        """
+        return cls.__translate_operators(cls.__clean(user_input))
+
     @staticmethod
     def __clean(user_input: str) -> str:
         """
@@ -55,6 +242,4 @@ class Calculator:
         """
         Преобразует операторы к виду, с которым работают внутренние функции
         """
-        return user_input \
-                .replace("//", "#") \
-                .replace("**", "^")
+        return translate_spellings(user_input)
@@ -0,0 +1,319 @@
+import math
+from typing import Callable
+
+from src import budgets
+from src.common import UserFriendlyException, NameLookup
+from src.evaluator import EvaluationOptions, evaluate
+from src.functions import CodeBasedFunction, ConditionalFunction
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.operators import BinaryOperator, OperationError
+from src.vm import call
+
+
+_EXPRESSIONS = {
+    "+": "{left} + {right}",
+    "-": "{left} - {right}",
+    "*": "{left} * {right}",
+    "/": "{left} / {right}",
+    "#": "{left} // {right}",
+    "%": "{left} % {right}",
+    "^": "{left} ** {right}",
+    "<": "{left} < {right}",
+    ">": "{left} > {right}",
+    "{": "{left} <= {right}",
+    "}": "{left} >= {right}",
+    "~": "{left} == {right}",
+    "!": "{left} != {right}",
+}
+"""
+Выражение Python для каждого оператора из _OP_MAP (до приведения к float и округления, как в BinaryOperator.__call__)
+"""
+
+_NON_ZERO = frozenset("/#%")
+"""
+Операторы с проверкой assert_right_is_non_zero
+"""
+_INTEGERS = frozenset("#%")
+"""
+Операторы с проверкой assert_integers (выполняется после проверки на ноль)
+"""
+
+
+class GeneratedFunction:
+    """
+    Выражение, скомпилированное в функцию Python: каждый узел дерева - одна строка кода
+    с результатом во временной переменной, поэтому глубина вложенности выражения не ограничивает компилятор Python.
+    Проверки и округление операторов встроены в код; переменные, вызовы функций и точное суммирование выполняются
+    методами узлов, поэтому результаты и сообщения об ошибках совпадают с evaluator.evaluate.
+    """
+
+    __slots__ = ("source", "run")
+
+    source: str
+    """
+    Сгенерированный исходный код (для отладки)
+    """
+    run: Callable[[NameLookup, EvaluationOptions], float]
+    """
+    Выполняет выражение: run(name_table, options)
+    """
+
+    def __init__(self, source: str, run: Callable[[NameLookup, EvaluationOptions], float]):
+        self.source = source
+        self.run = run
+
+
+def generate(tree: Node, compensated_sum: bool = False, exact_integers: bool = False) -> GeneratedFunction:
+    """
+    Генерирует и компилирует функцию Python, вычисляющую дерево (обход дерева без рекурсии).
+    Порядок вычисления совпадает с обходом дерева: операнды и операторы цепочки - в порядке OperatorChain,
+    идентификатор функции проверяется до вычисления аргументов. Вызов с тремя аргументами генерируется как if/else,
+    если функция - if (вычисляется только выбранная ветка), иначе аргументы вычисляются обходом дерева.
+    Тела пользовательских функций выполняются стековой машиной (vm.call), поэтому рекурсия не занимает стек Python.
+    Если вложенность if слишком велика для компилятора Python, выражение вычисляется обходом дерева.
+    :param compensated_sum: Цепочки сложений сворачиваются точно (OperatorChain.fold)
+    :param exact_integers: Операторы применяются в режиме целых чисел (BinaryOperator.exact)
+    """
+    namespace: dict[str, object] = {
+        "_current": budgets.current, "_builtin": CodeBasedFunction, "_conditional": ConditionalFunction,
+        "_evaluate": evaluate, "_call": call, "_OperationError": OperationError, "_error": _chain_error, "_float": float,
+        "_round": round,
+    }
+    lines = ["def _run(_nt, _options):", "    _budget = _current()"]
+    indent = "    "
+    results: list[str] = []    # имена временных переменных (или литералы) с уже вычисленными значениями
+    targets: list[tuple[str, str]] = []    # (переменная с функцией, узел) раскрытых вызовов
+    branches: list[tuple[str, str, str, str]] = []    # (функция, узел, результат, условие) вызовов с тремя аргументами
+    pending: list[tuple[Node, object]] = [(tree, False)]
+    counter = 0
+
+    def site(node: Node) -> str:
+        name = f"_s{len(namespace)}"
+        namespace[name] = node
+        return name
+
+    while pending:
+        node, expanded = pending.pop()
+
+        if isinstance(node, Number):
+            value = node.value
+            if isinstance(value, float) and not math.isfinite(value):
+                results.append(site(node) + ".value")
+            else:
+                results.append(repr(value))
+
+        elif isinstance(node, Name):
+            counter += 1
+            target, node_site = f"_t{counter}", site(node)
+            lines += [
+                f"{indent}try:",
+                f"{indent}    {target} = _nt[{node.identifier!r}]",
+                f"{indent}except KeyError:",
+                f"{indent}    {target} = {node_site}.resolve(_nt)",
+                f"{indent}if {target}.__class__ is not float:",
+                f"{indent}    {target} = {node_site}.resolve(_nt)",
+            ]
+            results.append(target)
+
+        elif isinstance(node, OperatorChain):
+            if expanded is False:
+                if not node.stepwise or (compensated_sum and node.additive):
+                    pending.append((node, True))
+                    pending.extend((operand, False) for operand in reversed(node.operands))
+                else:
+                    pending.extend((item, False) if isinstance(item, Node) else (node, item)
+                                   for item in reversed(node.order()))
+                continue
+
+            if expanded is not True:
+                # один оператор цепочки, вычисляемой по шагам (OperatorChain.stepwise)
+                operator = node.operators[expanded]    # type: ignore
+                right, left = results.pop(), results.pop()
+                if node.right_associative and expanded != len(node.operators) - 1:
+                    left, right = right, left    # правый операнд - результат уже примененных операторов
+                counter += 1
+                target, node_site = f"_t{counter}", site(node)
+                lines += [f"{indent}if _budget is not None:", f"{indent}    _budget.charge(operations=1)"]
+                if exact_integers:
+                    namespace[f"_x{ord(operator.symbol)}"] = operator.exact
+                    lines += _apply_exact(operator, left, right, target, node_site, indent)
+                else:
+                    lines += _apply(operator, left, right, target, node_site, indent)
+                results.append(target)
+                continue
+
+            values = results[len(results) - len(node.operands):]
+            del results[len(results) - len(node.operands):]
+            counter += 1
+            target, node_site = f"_t{counter}", site(node)
+            lines += [f"{indent}if _budget is not None:", f"{indent}    _budget.charge(operations={len(node.operators)})"]
+
+            if compensated_sum and node.additive:
+                lines.append(f"{indent}{target} = {node_site}.fold([{', '.join(values)}], True, {exact_integers})")
+            elif exact_integers:
+                for operator in node.operators:
+                    namespace[f"_x{ord(operator.symbol)}"] = operator.exact
+                if node.right_associative:
+                    lines.append(f"{indent}{target} = {values[-1]}")
+                    for index in range(len(node.operators) - 1, -1, -1):
+                        lines += _apply_exact(node.operators[index], values[index], target, target, node_site, indent)
+                else:
+                    lines.append(f"{indent}{target} = {values[0]}")
+                    for index, operator in enumerate(node.operators):
+                        lines += _apply_exact(operator, target, values[index + 1], target, node_site, indent)
+            elif node.right_associative:
+                lines.append(f"{indent}{target} = {values[-1]}")
+                for index in range(len(node.operators) - 1, -1, -1):
+                    lines += _apply(node.operators[index], values[index], target, target, node_site, indent)
+            else:
+                lines.append(f"{indent}{target} = {values[0]}")
+                for index, operator in enumerate(node.operators):
+                    lines += _apply(operator, target, values[index + 1], target, node_site, indent)
+            results.append(target)
+
+        elif isinstance(node, Call):
+            if expanded is _TEST:
+                # условие вычислено: if/else для if, иначе - остальные аргументы обходом дерева и обычный вызов
+                function, node_site = targets.pop()
+                counter += 1
+                target, condition = f"_t{counter}", results.pop()
+                branches.append((function, node_site, target, condition))
+                lines += [
+                    f"{indent}if {function}.__class__ is _conditional:",
+                    f"{indent}    if _budget is not None:",
+                    f"{indent}        _budget.charge(operations=1)",
+                    f"{indent}    if {condition}:",
+                ]
+                indent += "        "
+                pending.append((node, _ELSE))
+                pending.append((node.args[1], False))
+                continue
+
+            if expanded is _ELSE:
+                _, _, target, _ = branches[-1]
+                lines.append(f"{indent}{target} = {results.pop()}")
+                lines.append(f"{indent[:-4]}else:")
+                pending.append((node, _END))
+                pending.append((node.args[2], False))
+                continue
+
+            if expanded is _END:
+                function, node_site, target, condition = branches.pop()
+                lines.append(f"{indent}{target} = {results.pop()}")
+                indent = indent[:-8]
+                lines += [
+                    f"{indent}else:",
+                    f"{indent}    {target}_1 = _evaluate({node_site}.args[1], _nt, _options)",
+                    f"{indent}    {target}_2 = _evaluate({node_site}.args[2], _nt, _options)",
+                ]
+                lines += _invoke(function, node_site, target, [condition, f"{target}_1", f"{target}_2"], indent + "    ")
+                results.append(target)
+                continue
+
+            if not expanded:
+                counter += 1
+                function, node_site = f"_f{counter}", site(node)
+                lines.append(f"{indent}{function} = {node_site}.resolve(_nt)")
+                targets.append((function, node_site))
+                if len(node.args) == ConditionalFunction.ARGUMENTS:
+                    pending.append((node, _TEST))
+                    pending.append((node.args[0], False))
+                else:
+                    pending.append((node, True))
+                    pending.extend((arg, False) for arg in reversed(node.args))
+                continue
+
+            args = results[len(results) - len(node.args):]
+            del results[len(results) - len(node.args):]
+            function, node_site = targets.pop()
+            counter += 1
+            target = f"_t{counter}"
+            lines += _invoke(function, node_site, target, args, indent)
+            results.append(target)
+
+        else:
+            raise TypeError(f"Неизвестный тип узла: {type(node).__name__}")
+
+    lines.append(f"    return {results[0]}")
+    source = "\n".join(lines) + "\n"
+    try:
+        code = compile(source, "<expression>", "exec")
+    except (SyntaxError, RecursionError, MemoryError):    # слишком глубокая вложенность блоков if
+        return GeneratedFunction(source, lambda name_table, options: evaluate(tree, name_table, options))
+    exec(code, namespace)
+    return GeneratedFunction(source, namespace["_run"])    # type: ignore
+
+
+_TEST = object()
+_ELSE = object()
+_END = object()
+"""
+Состояния вызова с тремя аргументами при генерации: вычислено условие / первая ветка / вторая ветка
+"""
+
+
+def _invoke(function: str, node_site: str, target: str, args: list[str], indent: str) -> list[str]:
+    """
+    Код вызова функции со списанием из бюджета, как при обходе дерева.
+    Пользовательские функции выполняются стековой машиной (vm.call), чтобы рекурсия не занимала стек Python.
+    """
+    return [
+        f"{indent}if _budget is not None:",
+        f"{indent}    if isinstance({function}, _builtin):",
+        f"{indent}        _budget.charge(operations=1)",
+        f"{indent}    else:",
+        f"{indent}        _budget.charge(calls=1)",
+        f"{indent}if {function}.inline:",
+        f"{indent}    {target} = _call({node_site}, {function}, [{', '.join(args)}], _nt, _options)",
+        f"{indent}else:",
+        f"{indent}    {target} = {node_site}.invoke({function}, [{', '.join(args)}], _nt, options=_options)",
+    ]
+
+
+def _apply(operator: BinaryOperator, left: str, right: str, target: str, node_site: str, indent: str) -> list[str]:
+    """
+    Код применения оператора: проверки из assert_right_is_non_zero и assert_integers, приведение к float,
+    округление и переполнение, как в BinaryOperator.__call__. Операнды сохраняются во временных переменных,
+    чтобы попасть в текст ошибки.
+    """
+    symbol = operator.symbol
+    lines = [f"{indent}_l, _r = {left}, {right}"]
+    if symbol in _NON_ZERO:
+        lines += [f"{indent}if _r == 0:",
+                  f"{indent}    raise _error({node_site}, _OperationError(_l, {str(operator)!r}, _r, 'деление на ноль'))"]
+    if symbol in _INTEGERS:
+        lines += [f"{indent}if not _r.is_integer() or not _l.is_integer():",
+                  f"{indent}    raise _error({node_site}, _OperationError(_l, {str(operator)!r}, _r, "
+                  f"'операция допустима только над целыми числами'))"]
+    lines += [
+        f"{indent}try:",
+        f"{indent}    {target} = _round(_float({_EXPRESSIONS[symbol].format(left='_l', right='_r')}), 2)",
+        f"{indent}except OverflowError as _e:",
+        f"{indent}    raise _error({node_site}, _OperationError(_l, {str(operator)!r}, _r, 'переполнение'), _e)",
+    ]
+    return lines
+
+
+def _apply_exact(operator: BinaryOperator, left: str, right: str, target: str, node_site: str,
+                 indent: str) -> list[str]:
+    """
+    Код применения оператора в режиме целых чисел: вызов BinaryOperator.exact (_x<код символа>)
+    """
+    return [
+        f"{indent}try:",
+        f"{indent}    {target} = _x{ord(operator.symbol)}({left}, {right})",
+        f"{indent}except _OperationError as _e:",
+        f"{indent}    raise _error({node_site}, _e, _e.__cause__)",
+    ]
+
+
+def _chain_error(chain: OperatorChain, error: OperationError, cause: Exception | None = None) -> UserFriendlyException:
+    """
+    Ошибка оператора с тем же текстом, что и в OperatorChain.fold
+    :param cause: Исходное исключение (например, OverflowError)
+    """
+    error.__cause__ = cause
+    exception = UserFriendlyException(f"Ошибка вычисления выражения: {chain.text}\n{str(error)}")
+    exception.__cause__ = error
+    return exception
+
@@ -1,4 +1,4 @@
-from typing import TypeAlias, Union, TYPE_CHECKING
+from typing import TypeAlias, Union, TYPE_CHECKING, Iterator, Mapping
 import string
 
 if TYPE_CHECKING:
@@ -15,12 +15,71 @@ class InvalidIdentifierError(Exception):
 
 Nametable: TypeAlias = dict[str, Union[float, "Function"]]
 
+NameLookup: TypeAlias = Mapping[str, Union[float, "Function"]]
+"""
+Любая таблица имен, из которой выражение может только читать: Nametable или Scope
+"""
+
 IDENTIFIER_ALLOWED_CHARACTERS = set(string.ascii_lowercase + string.digits + "_")
 """
 Символы, разрешенные для использования в идентификаторах
 """
 
 
+class BracketIndex:
+    """
+    Сопоставление парных скобок строки, вычисляемое один раз за линейное время.
+    Позволяет вспомогательным функциям работать с участками (start, end) исходной строки
+    и находить парную скобку за O(1) вместо повторного подсчета баланса скобок.
+    """
+
+    __slots__ = ("expression", "balanced", "__pairs")
+
+    expression: str
+    balanced: bool
+    """
+    True, если у каждой скобки есть пара
+    """
+    __pairs: dict[int, int]
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.__pairs = {}
+
+        open_brackets: list[int] = []
+        balanced = True
+        for index, sym in enumerate(expression):
+            if sym == "(":
+                open_brackets.append(index)
+            elif sym == ")":
+                if not open_brackets:    # лишняя закрывающая скобка
+                    balanced = False
+                    continue
+                pair = open_brackets.pop()
+                self.__pairs[pair] = index
+                self.__pairs[index] = pair
+
+        self.balanced = balanced and not open_brackets
+
+    def partner(self, position: int) -> int:
+        """
+        :param position: Индекс скобки в строке
+        :return: Индекс парной скобки или -1, если пары нет (или в позиции не скобка)
+        """
+        return self.__pairs.get(position, -1)
+
+    def strip(self, start: int, end: int) -> tuple[int, int]:
+        """
+        Убирает все лишние (внешние) парные скобки из участка строки.
+        Пример: (((-1) * 2 + 3 + (5 - 6))) -> (-1) * 2 + 3 + (5 - 6)
+        :return: Участок (start, end) без внешних скобок
+        """
+        while end - start >= 2 and self.expression[start] == "(" and self.partner(start) == end - 1:
+            start += 1
+            end -= 1
+        return start, end
+
+
 def remove_extra_brackets(expression: str) -> str:
     """
     Убирает все лишние (внешние) парные скобки из выражения.
@@ -30,32 +89,55 @@ def remove_extra_brackets(expression: str) -> str:
         Входная строка, но без внешних скобок. Если баланс скобок не соблюден, то возвращает
         исходное выражение без изменений
     """
-    while True:  # цикл, т. к. может быть несколько пар скобок
-        if not expression.startswith("(") or not expression.endswith(")"):
-            return expression
+    index = BracketIndex(expression)
+    if not index.balanced:
+        return expression
 
-        brackets = 0  # счетчик баланса скобок
-        for index, sym in enumerate(expression):
-            if sym == "(":
-                brackets += 1
-            elif sym == ")":
-                brackets -= 1
-
-            # лишняя закрывающая скобка
-            if brackets < 0:
-                return expression
-
-            # проверяем, где закрылась первая открывающая скобка
-            if brackets == 0:
-                # если на конце, значит их можно убрать
-                if index == len(expression) - 1:
-                    expression = expression[1:-1]
-                    break
-                # иначе скобка закрывается внутри выражения
-                # более внешних скобок быть не может
-                else:
-                    return expression
-
-        # недостаточно открывающих скобок
-        if brackets > 0:
-            return expression
+    start, end = index.strip(0, len(expression))
+    return expression[start:end]
+
+
+class Scope(Mapping[str, Union[float, "Function"]]):
+    """
+    Локальная таблица имен вызова пользовательской функции.
+    Хранит только собственные привязки (аргументы), остальные имена ищутся во внешней таблице.
+    Позволяет не копировать всю глобальную таблицу при каждом вызове.
+    """
+
+    __slots__ = ("local_names", "global_names")
+
+    local_names: Nametable
+    global_names: NameLookup
+
+    def __init__(self, local_names: Nametable, global_names: NameLookup):
+        self.local_names = local_names
+        self.global_names = global_names
+
+    @classmethod
+    def extend(cls, outer: NameLookup, local_names: Nametable) -> "Scope":
+        """
+        Создает область видимости поверх внешней таблицы.
+        Если внешняя таблица сама является Scope (вложенный вызов), то ее привязки копируются в новую область,
+        чтобы цепочка не росла с глубиной вложенности и поиск глобальных имен оставался O(1).
+        Аргументов у функции немного, поэтому копирование дешевое.
+        """
+        if isinstance(outer, Scope):
+            return cls(outer.local_names | local_names, outer.global_names)
+        return cls(local_names, outer)
+
+    def __getitem__(self, key: str) -> Union[float, "Function"]:
+        if key in self.local_names:
+            return self.local_names[key]
+        return self.global_names[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.local_names or key in self.global_names
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.local_names
+        for key in self.global_names:
+            if key not in self.local_names:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self.local_names) + sum(1 for key in self.global_names if key not in self.local_names)
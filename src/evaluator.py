@@ -0,0 +1,386 @@
+import weakref
+from typing import Iterable
+
+from src import budgets, profiling
+from src.budgets import BudgetExceededError
+from src.common import UserFriendlyException, NameLookup
+from src.functions import Function, CodeBasedFunction, ConditionalFunction, FunctionSyntaxError, FunctionExecutionError
+from src.nodes import Node, Number, Name, Call, OperatorChain, shared_subtrees
+
+
+TREE = "tree"
+"""
+Вычисление обходом синтаксического дерева (evaluate)
+"""
+VM = "vm"
+"""
+Вычисление на стековой машине: дерево один раз компилируется в байт-код (см. vm.py)
+"""
+PYTHON = "python"
+"""
+Вычисление функцией Python, сгенерированной по дереву и скомпилированной через compile() (см. codegen.py)
+"""
+BACKENDS = (TREE, VM, PYTHON)
+
+MAX_CALL_DEPTH = 100_000
+"""
+Глубина вызовов пользовательских функций по умолчанию (см. EvaluationOptions.max_call_depth)
+"""
+
+TRACE_REPEATS = 10
+"""
+Сколько одинаковых вызовов подряд показывать в тексте ошибки, возникшей глубоко в рекурсии; остальные сокращаются
+"""
+
+
+class EvaluationOptions:
+    """
+    Настройки вычисления. Передаются и в вызовы пользовательских функций.
+    """
+
+    __slots__ = ("compensated_sum", "backend", "max_call_depth", "exact_integers")
+
+    compensated_sum: bool
+    """
+    Длинные цепочки сложений/вычитаний суммируются точно (math.fsum) с одним округлением в конце,
+    а не с округлением до 2 знаков после каждого оператора
+    """
+
+    backend: str
+    """
+    Способ вычисления выражений и тел пользовательских функций: TREE, VM или PYTHON
+    """
+
+    max_call_depth: int
+    """
+    Максимальная глубина вызовов пользовательских функций, включая хвостовые вызовы.
+    При превышении вычисление прерывается RecursionError, как при переполнении стека Python.
+    """
+
+    exact_integers: bool
+    """
+    Операторы над целыми операндами вычисляются в int точно и без округления (см. BinaryOperator.exact),
+    float используется, только если операнд или результат не целый
+    """
+
+    def __init__(self, compensated_sum: bool = False, backend: str = TREE, max_call_depth: int = MAX_CALL_DEPTH,
+                 exact_integers: bool = False):
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный способ вычисления: {backend}")
+
+        self.compensated_sum = compensated_sum
+        self.backend = backend
+        self.max_call_depth = max_call_depth
+        self.exact_integers = exact_integers
+
+
+DEFAULT_OPTIONS = EvaluationOptions()
+
+
+class CallFrame:
+    """
+    Вызов пользовательской функции, тело которой вычисляется в том же цикле, что и вызывающее выражение.
+    Вызов в хвостовой позиции (последнее действие тела) не создает новый кадр, а продолжает текущий,
+    поэтому хвостовая рекурсия не расходует память. Вызовы запоминаются только для текста ошибок.
+    """
+
+    __slots__ = ("caller_names", "function", "memo_key", "calls", "depth", "started")
+
+    caller_names: NameLookup
+    """
+    Таблица имен вызывающего выражения, восстанавливается после возврата
+    """
+    function: Function
+    memo_key: tuple | None
+    calls: list[list]
+    """
+    Вызовы кадра (с учетом хвостовых) в порядке выполнения: [узел Call, сколько раз подряд]
+    """
+    depth: int
+    """
+    Количество вызовов в кадре (с учетом хвостовых)
+    """
+    started: int
+
+    def __init__(self, call: Call, caller_names: NameLookup, function: Function, memo_key: tuple | None,
+                 started: int = 0):
+        self.caller_names = caller_names
+        self.function = function
+        self.memo_key = memo_key
+        self.calls = [[call, 1]]
+        self.depth = 1
+        self.started = started
+
+    def add_tail_call(self, call: Call) -> None:
+        last = self.calls[-1]
+        if last[0] is call:
+            last[1] += 1
+        else:
+            self.calls.append([call, 1])
+        self.depth += 1
+
+    def __iter__(self):
+        """
+        Вызовы кадра от последнего к первому (повторяющиеся - по одному разу с количеством)
+        """
+        return ((call, count) for call, count in reversed(self.calls))
+
+
+def call_stack_error(calls: Iterable[tuple[Call, int]], error: Exception) -> UserFriendlyException:
+    """
+    Ошибка, возникшая в теле вызванной функции, с текстом каждого незавершенного вызова - так же, как если бы
+    каждый вызов обернул ошибку в Call.invoke. Длинные серии одинаковых вызовов (рекурсия) сокращаются.
+    :param calls: Незавершенные вызовы от внутреннего к внешнему: (узел, сколько раз подряд)
+    """
+    runs: list[list] = []
+    for call, count in calls:
+        if runs and runs[-1][0] is call:
+            runs[-1][1] += count
+        else:
+            runs.append([call, count])
+
+    lines = []
+    for call, count in reversed(runs):
+        line = f"Ошибка в вызове функции: {call.text}"
+        if count > TRACE_REPEATS:
+            lines += [line] * TRACE_REPEATS
+            lines.append(f"[вызов повторяется еще {count - TRACE_REPEATS} раз]")
+        else:
+            lines += [line] * count
+    lines.append(str(error))
+    return UserFriendlyException("\n".join(lines))
+
+
+_BRANCH = object()
+"""
+Состояние узла вызова if на стеке обхода: условие вычислено, осталось выбрать ветку
+"""
+
+_STORE = object()
+"""
+Состояние повторяющегося узла на стеке обхода: значение вычислено и лежит на вершине values, его можно запомнить
+"""
+
+_SHARED: weakref.WeakKeyDictionary[Node, dict[Node, int]] = weakref.WeakKeyDictionary()
+"""
+Повторяющиеся поддеревья (nodes.shared_subtrees) по корню дерева: выражения или тела функции
+"""
+
+
+def _shared(tree: Node) -> dict[Node, int]:
+    shared = _SHARED.get(tree)
+    if shared is None:
+        shared = _SHARED[tree] = shared_subtrees(tree)
+    return shared
+
+
+def evaluate(tree: Node, name_table: NameLookup, options: EvaluationOptions = DEFAULT_OPTIONS) -> float:
+    """
+    Вычисляет значение синтаксического дерева без рекурсии: обход выполняется с явным стеком,
+    поэтому глубина вложенности выражения ограничена только памятью.
+    Операнды и операторы цепочек вычисляются в порядке OperatorChain, идентификатор функции проверяется
+    до вычисления аргументов.
+    Тела пользовательских функций вычисляются в том же цикле (см. CallFrame), поэтому рекурсия не занимает стек Python,
+    а глубина вызовов ограничена options.max_call_depth. У if(cond, a, b) вычисляется только выбранная ветка.
+    Повторяющееся чистое поддерево (после интернирования - один и тот же узел, см. interning.py) вычисляется один раз
+    в каждой области видимости: во время вычисления таблица имен не меняется, а встроенные функции не имеют
+    побочных эффектов, поэтому повтор дал бы тот же результат. Поддеревья с вызовами пользовательских функций
+    вычисляются каждый раз: такие вызовы учитываются бюджетом, глубиной вызовов и запоминанием результатов.
+    Если активен бюджет (budgets.Budget), каждый оператор и вызов функции списывается из него.
+    :param tree: Корень синтаксического дерева
+    :param name_table: Таблица имен, через которую в выражении могут быть задействованы переменные и функции.
+    :param options: Настройки вычисления
+    :raises UserFriendlyException: Ошибка при вычислении. Подробности в исключении.
+    :raises BudgetExceededError: Бюджет вычисления исчерпан или вычисление отменено
+    :raises RecursionError: Превышена глубина вызовов пользовательских функций
+    :return: Значение выражения
+    """
+    frames: list[CallFrame] = []
+    try:
+        return _evaluate(tree, name_table, options, frames)
+    except (RecursionError, BudgetExceededError):
+        raise
+    except Exception as e:
+        if not frames:
+            raise
+        raise call_stack_error((call for frame in reversed(frames) for call in frame), e) from e
+
+
+def _evaluate(tree: Node, name_table: NameLookup, options: EvaluationOptions, frames: list[CallFrame]) -> float:
+    """
+    :param frames: Незавершенные вызовы пользовательских функций (заполняется по ходу вычисления для текста ошибок)
+    """
+    compensated_sum = options.compensated_sum
+    exact_integers = options.exact_integers
+    max_call_depth = options.max_call_depth
+    depth = 0
+    budget = budgets.current()
+    profile = profiling.enabled
+    clock = profiling.clock
+    started = 0
+    values: list[float] = []
+    # (узел, состояние): у раскрытого (True) узла все операнды уже вычислены и лежат на вершине values;
+    # номер оператора цепочки - оба его операнда на вершине values (OperatorChain.stepwise);
+    # CallFrame - возврат из пользовательской функции
+    pending: list[tuple[Node | CallFrame, object]] = [(tree, False)]
+    # функции раскрытых вызовов; идентификатор проверяется до вычисления аргументов, как и раньше
+    targets: list[Function] = []
+    # повторяющиеся поддеревья текущей области видимости и их уже вычисленные значения
+    shared = _shared(tree)
+    computed: dict[Node, float] = {}
+    # начатые повторяющиеся узлы и количество вызовов пользовательских функций на момент начала их вычисления
+    stores: list[tuple[Node, int]] = []
+    user_calls = reused = skipped = 0
+
+    while pending:
+        node, expanded = pending.pop()
+
+        if expanded is False and shared and isinstance(node, Node) and node in shared:
+            value = computed.get(node)
+            if value is not None:
+                values.append(value)
+                reused += 1
+                skipped += shared[node]
+                continue
+            pending.append((node, _STORE))
+            stores.append((node, user_calls))
+
+        elif expanded is _STORE:
+            stored, calls = stores.pop()
+            if calls == user_calls:
+                computed[stored] = values[-1]
+            continue
+
+        if isinstance(node, Number):
+            values.append(node.value)
+
+        elif isinstance(node, Name):
+            if profile:
+                started = clock()
+            values.append(node.resolve(name_table))
+            if profile:
+                profiling.PROFILER.add(profiling.RESOLVE, clock() - started)
+
+        elif isinstance(node, OperatorChain):
+            if expanded is True:
+                first_operand = len(values) - len(node.operands)
+                if budget is not None:
+                    budget.charge(operations=len(node.operators))
+                if profile:
+                    started = clock()
+                result = node.fold(values[first_operand:], compensated_sum, exact_integers)
+                if profile:
+                    profiling.PROFILER.add(profiling.OPERATORS, clock() - started, len(node.operators))
+                del values[first_operand:]
+                values.append(result)
+            elif expanded is False:
+                if not node.stepwise or (compensated_sum and node.additive):
+                    pending.append((node, True))
+                    pending.extend((operand, False) for operand in reversed(node.operands))
+                else:
+                    pending.extend((item, False) if isinstance(item, Node) else (node, item)
+                                   for item in reversed(node.order()))
+            else:
+                if budget is not None:
+                    budget.charge(operations=1)
+                if profile:
+                    started = clock()
+                right = values.pop()
+                if node.right_associative and expanded != len(node.operators) - 1:
+                    # правый операнд - результат уже примененных операторов, он вычислен раньше левого
+                    values[-1] = node.apply(expanded, right, values[-1], exact_integers)    # type: ignore
+                else:
+                    values[-1] = node.apply(expanded, values[-1], right, exact_integers)    # type: ignore
+                if profile:
+                    profiling.PROFILER.add(profiling.OPERATORS, clock() - started)
+
+        elif isinstance(node, Call):
+            if expanded is _BRANCH:
+                condition = values.pop()
+                pending.append((node.args[1] if condition else node.args[2], False))
+
+            elif expanded:
+                first_arg = len(values) - len(node.args)
+                args = values[first_arg:]
+                del values[first_arg:]
+                target = targets.pop()
+                if budget is not None:
+                    if isinstance(target, CodeBasedFunction):
+                        budget.charge(operations=1)
+                    else:
+                        budget.charge(calls=1)
+
+                if not target.inline:
+                    if profile:
+                        started = clock()
+                    values.append(node.invoke(target, args, name_table, options=options))
+                    if profile:
+                        phase = profiling.BUILTIN_CALLS if isinstance(target, CodeBasedFunction) else profiling.USER_CALLS
+                        profiling.PROFILER.add(phase, clock() - started)
+                    continue
+
+                user_calls += 1
+                memo_key = target.memo_key(args, name_table, options)    # type: ignore
+                result = target.recall(memo_key)    # type: ignore
+                if result is not None:
+                    values.append(result)
+                    continue
+                try:
+                    scope = target.enter(args, name_table)    # type: ignore
+                except (FunctionSyntaxError, FunctionExecutionError) as e:
+                    raise node.call_error(e) from e
+
+                depth += 1
+                if depth > max_call_depth:
+                    raise RecursionError(f"Превышена глубина вызовов функций ({max_call_depth})")
+
+                caller = pending[-1][0] if pending else None
+                if isinstance(caller, CallFrame) and caller.memo_key is None and memo_key is None and not profile:
+                    # хвостовой вызов: текущему кадру после возврата больше нечего делать
+                    caller.add_tail_call(node)
+                else:
+                    frame = CallFrame(node, name_table, target, memo_key, clock() if profile else 0)
+                    frames.append(frame)
+                    # повторы вызывающей области видимости восстанавливаются после возврата
+                    pending.append((frame, (shared, computed)))
+                name_table = scope
+                shared = _shared(target.body)    # type: ignore
+                computed = {}
+                pending.append((target.body, False))    # type: ignore
+
+            else:
+                if profile:
+                    started = clock()
+                target = node.resolve(name_table)
+                if profile:
+                    profiling.PROFILER.add(profiling.RESOLVE, clock() - started)
+
+                if isinstance(target, ConditionalFunction) and len(node.args) == target.ARGUMENTS:
+                    if budget is not None:
+                        budget.charge(operations=1)
+                    pending.append((node, _BRANCH))
+                    pending.append((node.args[0], False))
+                    continue
+
+                targets.append(target)
+                pending.append((node, True))
+                pending.extend((arg, False) for arg in reversed(node.args))
+
+        elif isinstance(node, CallFrame):
+            # возврат из пользовательской функции: результат уже на вершине values
+            node.function.remember(node.memo_key, values[-1])    # type: ignore
+            name_table = node.caller_names
+            shared, computed = expanded    # type: ignore
+            depth -= node.depth
+            frames.pop()
+            if profile:
+                profiling.PROFILER.add(profiling.USER_CALLS, clock() - node.started, node.depth)
+
+        else:
+            raise TypeError(f"Неизвестный тип узла: {type(node).__name__}")
+
+    if profile and reused:
+        profiling.PROFILER.count(profiling.SHARED_REUSED, reused)
+        profiling.PROFILER.count(profiling.SHARED_SKIPPED, skipped)
+    return values[0]
+
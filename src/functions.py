@@ -1,7 +1,7 @@
 from typing import Iterator, Callable
 from abc import ABC, abstractmethod
 
-from src.common import remove_extra_brackets
+from src.common import BracketIndex
 
 
 class FunctionSyntaxError(Exception):
@@ -17,6 +17,12 @@ class Function(ABC):
     Базовый класс для мат. функций, которые пользователь может использовать в выражениях
     """
 
+    inline: bool = False
+    """
+    Тело функции вычисляется тем же обходом, что и вызывающее выражение, без вызова __call__
+    (см. UserDefinedFunction.enter и evaluator.evaluate)
+    """
+
     @abstractmethod
     def __call__(self, *args, **kwargs):
         raise NotImplementedError
@@ -28,6 +34,7 @@ class Function(ABC):
         Аргументы возвращаются строками, а не вычисленными выражениями по двум причинам:
         1) чтобы избежать рекурсивных зависимостей (функции уже вызываются из выражений)
         2) чтобы переиспользовать методы при объявлении польз. функций (там в качестве аргументов будут идентификаторы)
+        Скобки сопоставляются один раз (BracketIndex), дальше работа идет с участками исходной строки.
         :param expression: Строка формата <func_name>(<arg>[,<arg>]*)
         :return: (название функции, список строковых аргументов)
         """
@@ -35,80 +42,72 @@ class Function(ABC):
         if first_open_bracket == -1:
             return None, None
 
+        index = BracketIndex(expression)
         identifier = expression[:first_open_bracket]
-        args_string = cls.__grab_to_closing_bracket(expression, first_open_bracket)
-        args_string = remove_extra_brackets(args_string)
-        args = tuple(cls.__parse_args(args_string))
+        args_start, args_end = index.strip(*cls.__grab_to_closing_bracket(index, first_open_bracket))
+        args = tuple(cls.__parse_args(index, args_start, args_end))
 
         return identifier, args
 
     @staticmethod
-    def __grab_to_closing_bracket(expression: str, open_bracket_pos: int) -> str:
+    def __grab_to_closing_bracket(index: BracketIndex, open_bracket_pos: int) -> tuple[int, int]:
         """
-         Возвращает часть строки от открывающей скобки, до парной ей закрывающей (включая сами скобки).
-        :param expression: Произвольное строковое выражение
+        Находит участок строки от открывающей скобки, до парной ей закрывающей (включая сами скобки).
+        :param index: Сопоставление скобок произвольного строкового выражения
         :param open_bracket_pos: Индекс открывающей скобки в строке
-        :return: Часть строки от открывающей скобки, до парной ей закрывающей (включая сами скобки)
+        :return: Участок (start, end) от открывающей скобки, до парной ей закрывающей (включая сами скобки)
         :raises FunctionSyntaxError: Неверная конфигурация скобок
         """
-        if expression[open_bracket_pos] != "(":
+        if index.expression[open_bracket_pos] != "(":
             raise FunctionSyntaxError("Неверная позиция открывающей скобки")
 
-        brackets_counter = 0
-        for i, sym in enumerate(expression[open_bracket_pos:]):
-            if sym == "(":
-                brackets_counter += 1
-            elif sym == ")":
-                brackets_counter -= 1
+        close_bracket_pos = index.partner(open_bracket_pos)
+        if close_bracket_pos == -1:
+            raise FunctionSyntaxError("Отсутствует закрывающая скобка")
 
-            if brackets_counter < 0:
-                raise FunctionSyntaxError("Нарушен баланс скобок")
-
-            if brackets_counter == 0:
-                # проверяем, что скобка закрылась в конце выражения
-                # исключает случаи вроде max(1,2)abc
-                if open_bracket_pos+i+1 != len(expression):
-                    raise FunctionSyntaxError("Ошибка в синтаксисе вызова функции")
+        # проверяем, что скобка закрылась в конце выражения
+        # исключает случаи вроде max(1,2)abc
+        if close_bracket_pos + 1 != len(index.expression):
+            raise FunctionSyntaxError("Ошибка в синтаксисе вызова функции")
 
-                return expression[open_bracket_pos:open_bracket_pos+i+1]
-
-        raise FunctionSyntaxError("Отсутствует закрывающая скобка")
+        return open_bracket_pos, close_bracket_pos + 1
 
     @staticmethod
-    def __parse_args(args_string: str) -> Iterator[str]:
+    def __parse_args(index: BracketIndex, start: int, end: int) -> Iterator[str]:
         """
-        Выделяет из строки аргументы, разделенные запятой.
-        Отличие от split: учитывает скобки. Разделение происходит только на верхнем уровне.
+        Выделяет из участка строки аргументы, разделенные запятой.
+        Отличие от split: учитывает скобки. Разделение происходит только на верхнем уровне:
+        вложенные скобки перепрыгиваются целиком по индексу парных скобок.
         Позволяет использовать вызов другой функции как аргумент.
-        :param args_string: Строка без внешних скобок, где аргументы разделены запятыми
+        :param index: Сопоставление скобок строки
+        :param start: Начало участка без внешних скобок, где аргументы разделены запятыми
+        :param end: Конец участка
         :raises FunctionSyntaxError: Нарушен синтаксис аргументов
         :return: Поочередно возвращает каждый аргумент в виде строки
         """
-        brackets = 0
-        start_index = 0
-        for ind, sym in enumerate(args_string):
+        expression = index.expression
+        arg_start = start
+        position = start
+        while position < end:
+            sym = expression[position]
             if sym == "(":
-                brackets += 1
+                position = index.partner(position)
+                if not start <= position < end:
+                    raise FunctionSyntaxError("Нарушен баланс скобок")
             elif sym == ")":
-                brackets -= 1
-
-            if brackets < 0:
                 raise FunctionSyntaxError("Нарушен баланс скобок")
-
-            if sym == "," and brackets == 0:
-                arg = args_string[start_index:ind]
-
-                if not arg:
+            elif sym == ",":
+                if arg_start == position:
                     raise FunctionSyntaxError("Нарушен синтаксис аргументов")
 
-                yield arg
-                start_index = ind + 1
+                yield expression[arg_start:position]
+                arg_start = position + 1
+            position += 1
 
-        arg = args_string[start_index:]
-        if not arg:
+        if arg_start == end:
             raise FunctionSyntaxError("Нарушен синтаксис аргументов")
 
-        yield arg
+        yield expression[arg_start:end]
 
 
 class CodeBasedFunction(Function):
@@ -136,3 +135,20 @@ class CodeBasedFunction(Function):
             raise FunctionExecutionError(str(e)) from e
         except Exception as e:
             raise FunctionExecutionError(str(e)) from e
+
+
+class ConditionalFunction(Function):
+    """
+    Условие if(cond, a, b): a, если cond не 0, иначе b.
+    При вычислении выражения аргументы вычисляются лениво: сначала условие, затем только выбранная ветка
+    (см. evaluator.evaluate). __call__ используется, только если аргументы уже вычислены.
+    """
+
+    ARGUMENTS = 3
+
+    def __call__(self, *args: float, **kwargs) -> float:
+        if len(args) != self.ARGUMENTS:
+            raise FunctionSyntaxError(f"Неверные аргументы функции: if принимает условие и два варианта, "
+                                      f"передано аргументов: {len(args)}")
+        condition, if_true, if_false = args
+        return if_true if condition else if_false
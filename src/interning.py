@@ -0,0 +1,122 @@
+import sys
+import weakref
+
+from src.nodes import Node, Number, Name, Call, OperatorChain
+
+
+class NodeInterner:
+    """
+    Таблица уникальных узлов синтаксических деревьев (hash consing).
+    Одинаковые поддеревья - того же вида, с тем же текстом и теми же (уже уникальными) потомками - заменяются одним
+    объектом, поэтому повторяющиеся в сессии подвыражения хранятся один раз, а повтор внутри выражения можно
+    найти по идентичности узла и вычислить один раз (см. nodes.shared_subtrees, evaluator.evaluate).
+    Текст узла входит в ключ (для составных узлов - только текст между потомками, чтобы не копировать строку
+    глубоко вложенных выражений на каждом уровне), поэтому сообщения об ошибках не меняются.
+    Таблица хранит узлы по слабым ссылкам: узел, на который больше ничто не ссылается, удаляется из нее сам.
+    Счетчики (как у LRUCache) показывают, сколько узлов найдено в таблице и сколько памяти это сэкономило.
+    """
+
+    lookups: int
+    """
+    Сколько узлов было передано в intern
+    """
+    reused: int
+    """
+    Сколько из них заменено уже известным узлом
+    """
+    saved_bytes: int
+    """
+    Примерный размер замененных узлов (вместе с кортежами потомков), которые больше не нужно хранить
+    """
+    __nodes: weakref.WeakValueDictionary[tuple, Node]
+
+    def __init__(self):
+        self.__nodes = weakref.WeakValueDictionary()
+        self.lookups = 0
+        self.reused = 0
+        self.saved_bytes = 0
+
+    def __len__(self) -> int:
+        """
+        Количество уникальных узлов, на которые еще есть ссылки
+        """
+        return len(self.__nodes)
+
+    def intern(self, tree: Node) -> Node:
+        """
+        Заменяет узлы дерева уникальными (обход без рекурсии).
+        Узел, которого еще нет в таблице, добавляется в нее (если его потомки заменены - в виде копии с новыми потомками).
+        :return: Корень дерева из уникальных узлов
+        """
+        results: list[Node] = []
+        pending: list[tuple[Node, bool]] = [(tree, False)]
+
+        while pending:
+            node, expanded = pending.pop()
+
+            if isinstance(node, Number):
+                results.append(self.__unique(node, (Number, node.text, repr(node.value))))
+
+            elif isinstance(node, Name):
+                results.append(self.__unique(node, (Name, node.text, node.identifier)))
+
+            elif isinstance(node, Call):
+                if expanded:
+                    first_arg = len(results) - len(node.args)
+                    args = tuple(results[first_arg:])
+                    del results[first_arg:]
+                    key: tuple = (Call, node.identifier, args, _gaps(node, node.args))
+                    if args != node.args:
+                        node = Call(node.identifier, args, node.source, node.start, node.end)
+                    results.append(self.__unique(node, key, args))
+                else:
+                    pending.append((node, True))
+                    pending.extend((arg, False) for arg in reversed(node.args))
+
+            elif isinstance(node, OperatorChain):
+                if expanded:
+                    first_operand = len(results) - len(node.operands)
+                    operands = tuple(results[first_operand:])
+                    del results[first_operand:]
+                    key = (OperatorChain, operands, node.operators, _gaps(node, node.operands))
+                    if operands != node.operands:
+                        node = OperatorChain(operands, node.operators, node.source, node.start, node.end)
+                    results.append(self.__unique(node, key, operands))
+                else:
+                    pending.append((node, True))
+                    pending.extend((operand, False) for operand in reversed(node.operands))
+
+            else:
+                raise TypeError(f"Неизвестный тип узла: {type(node).__name__}")
+
+        return results[0]
+
+    def stats(self) -> dict[str, int]:
+        return {"unique": len(self), "lookups": self.lookups, "reused": self.reused, "saved_bytes": self.saved_bytes}
+
+    def __unique(self, node: Node, key: tuple, children: tuple[Node, ...] = ()) -> Node:
+        self.lookups += 1
+        unique = self.__nodes.get(key)
+        if unique is None:
+            self.__nodes[key] = node
+            return node
+
+        self.reused += 1
+        self.saved_bytes += sys.getsizeof(node) + (sys.getsizeof(children) if children else 0)
+        return unique
+
+
+def _gaps(node: Node, children: tuple[Node, ...]) -> tuple[str, ...]:
+    """
+    Участки текста узла вокруг и между потомками (скобки, операторы, запятые).
+    Вместе с текстом потомков однозначно задают текст узла.
+    :param children: Потомки из той же исходной строки, что и узел (до замены уникальными)
+    """
+    source = node.source
+    gaps = []
+    position = node.start
+    for child in children:
+        gaps.append(source[position:child.start])
+        position = child.end
+    gaps.append(source[position:node.end])
+    return tuple(gaps)
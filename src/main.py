@@ -1,30 +1,291 @@
+import argparse
+import json
+import signal
+import sys
+import time
+from typing import Iterable, TextIO
+
+from src import profiling
+from src.budgets import Budget
 from src.calculator import Calculator
 from src.common import UserFriendlyException
+from src.evaluator import BACKENDS, TREE
+from src.scripts import execute_script
+
+
+READ_BUFFER_SIZE = 1 << 20
+"""
+Размер буфера чтения файлов в пакетном режиме
+"""
+
+FLUSH_EVERY = 4096
+"""
+Количество строк результата, накапливаемых перед записью в вывод
+"""
+
+
+def execute_line(calculator: Calculator, line: str, budget: Budget | None = None) -> tuple[str, bool]:
+    """
+    Выполняет одну строку ввода и форматирует результат для вывода
+    :param budget: Ограничения вычисления строки (см. Calculator.execute)
+    :return: Текст результата или ошибки; True, если строка выполнена без ошибок
+    """
+    if line.lstrip().startswith(":"):
+        return execute_command(calculator, line.strip())
+    return execute_expression(calculator, line, budget)
+
+
+def execute_expression(calculator: Calculator, line: str, budget: Budget | None = None) -> tuple[str, bool]:
+    """
+    Выполняет выражение или объявление (без команд REPL) и форматирует результат для вывода
+    :return: Текст результата или ошибки; True, если строка выполнена без ошибок
+    """
+    try:
+        result = calculator.execute(line, budget)
+    except UserFriendlyException as e:
+        return str(e), False
+    except Exception as e:
+        return f"Произошла непредвиденная ошибка: {type(e).__name__}('{str(e)}')", False
+
+    if result is None:    # например, присвоение переменной
+        return "OK", True
+    return str(result), True
+
+
+def execute_command(calculator: Calculator, command: str) -> tuple[str, bool]:
+    """
+    Выполняет команду REPL:
+    - ":stats" - статистика по этапам обработки ввода (см. profiling.py);
+    - ":stats json [файл]" - то же в JSON (в вывод или в файл);
+    - ":stats on" / ":stats off" - включить / выключить сбор статистики;
+    - ":stats reset" - сбросить статистику.
+    :return: Текст результата или ошибки; True, если команда выполнена
+    """
+    name, *args = command[1:].split() or [""]
+    if name != "stats":
+        return f"Неизвестная команда: {command}", False
 
+    if not args:
+        cache = calculator.expression_cache
+        nodes = calculator.interner
+        return (f"{profiling.PROFILER.format()}\nкэш выражений: {cache.hits} попаданий, {cache.misses} промахов\n"
+                f"узлы: {len(nodes)} уникальных, {nodes.reused} из {nodes.lookups} заменены повторами "
+                f"(~{nodes.saved_bytes / 1024:.1f} КиБ)"), True
 
-def main() -> None:
+    if args[0] == "json" and len(args) <= 2:
+        text = json.dumps(stats_report(calculator), indent=2, ensure_ascii=False)
+        if len(args) == 1:
+            return text, True
+        try:
+            with open(args[1], "w", encoding="utf-8") as file:
+                file.write(text)
+        except OSError as e:
+            return f"Не удалось записать статистику: {e}", False
+        return "OK", True
+
+    actions = {"on": profiling.enable, "off": profiling.disable, "reset": profiling.PROFILER.reset}
+    if len(args) == 1 and args[0] in actions:
+        actions[args[0]]()
+        return "OK", True
+
+    return f"Неверные аргументы команды: {command}", False
+
+
+def stats_report(calculator: Calculator) -> dict:
+    """
+    Статистика по этапам обработки ввода, кэшу выражений и уникальным узлам калькулятора (для экспорта в JSON)
+    """
+    cache = calculator.expression_cache
+    report = profiling.PROFILER.to_dict()
+    report["expression_cache"] = {"hits": cache.hits, "misses": cache.misses, "hit_rate": cache.hit_rate}
+    report["nodes"] = calculator.interner.stats()
+    return report
+
+
+def run_batch(calculator: Calculator, lines: Iterable[str], output: TextIO, fail_fast: bool = False) -> tuple[int, int]:
     """
-    CLI. В бесконечном цикле принимает ввод из stdin, выполняет его в Calculator, выводит результаты и возникающие исключения в stdout.
+    Выполняет строки без приглашения ввода. На каждую непустую строку ввода выводится результат (или ошибка), пустые строки пропускаются.
+    Результаты копятся и записываются в output блоками, а не по одной строке.
+    :param lines: Строки ввода (с переводами строк или без)
+    :param fail_fast: Остановиться на первой ошибке
+    :return: Количество обработанных строк и количество ошибок
     """
+    buffer: list[str] = []
+    processed = 0
+    errors = 0
 
-    calculator = Calculator()
+    for line in lines:
+        if not line.strip():
+            continue
 
+        text, ok = execute_line(calculator, line.rstrip("\r\n"))
+        buffer.append(text)
+        processed += 1
+
+        if not ok:
+            errors += 1
+            if fail_fast:
+                break
+
+        if len(buffer) >= FLUSH_EVERY:
+            output.write("\n".join(buffer) + "\n")
+            buffer.clear()
+
+    if buffer:
+        output.write("\n".join(buffer) + "\n")
+    output.flush()
+
+    return processed, errors
+
+
+def run_parallel(calculator: Calculator, lines: Iterable[str], output: TextIO, workers: int | None,
+                 fail_fast: bool = False) -> tuple[int, int]:
+    """
+    Как run_batch, но независимые строки выполняются в нескольких процессах (см. scripts.execute_script).
+    Сценарий читается целиком; вывод - в порядке строк. Команды (':stats') выполняются в своем месте сценария
+    на самом калькуляторе: строки до команды выполняются раньше нее, строки после - позже.
+    :param workers: Количество процессов. None - по количеству ядер.
+    """
+    script = [line.rstrip("\r\n") for line in lines if line.strip()]
+    results: list[tuple[str, bool]] = []
+    start = 0
+
+    for end in range(len(script) + 1):
+        if end < len(script) and not script[end].lstrip().startswith(":"):
+            continue
+
+        results.extend((str(result), result.ok)
+                       for result in execute_script(calculator, script[start:end], workers=workers, fail_fast=fail_fast))
+        if fail_fast and results and not results[-1][1]:
+            break
+        if end < len(script):
+            results.append(execute_command(calculator, script[end].strip()))
+            if fail_fast and not results[-1][1]:
+                break
+        start = end + 1
+
+    for start in range(0, len(results), FLUSH_EVERY):
+        output.write("\n".join(text for text, _ in results[start:start + FLUSH_EVERY]) + "\n")
+    output.flush()
+
+    return len(results), sum(not ok for _, ok in results)
+
+
+def run_interactive(calculator: Calculator) -> None:
+    """
+    В бесконечном цикле принимает ввод из stdin, выполняет его в Calculator, выводит результаты и возникающие исключения в stdout.
+    Ctrl-C во время вычисления отменяет только его; в приглашении ввода (как и Ctrl-D) - завершает работу.
+    """
     while True:
         try:
             user_input = input(">>> ")
+        except (KeyboardInterrupt, EOFError):
+            exit()
+        print(execute_cancellable(calculator, user_input)[0])
 
-            result = calculator.execute(user_input)
 
-            if result is None:    # например, присвоение переменной
-                print("OK")
-            else:
-                print(result)
-        except UserFriendlyException as e:
-            print(e)
-        except KeyboardInterrupt:
-            exit()
-        except Exception as e:
-            print(f"Произошла непредвиденная ошибка: {type(e).__name__}('{str(e)}')")
+def execute_cancellable(calculator: Calculator, line: str) -> tuple[str, bool]:
+    """
+    Как execute_line, но Ctrl-C (SIGINT) не прерывает процесс, а отменяет вычисление через Budget.cancel:
+    вычисление останавливается в ближайшей точке проверки, объявление не выполняется, таблица имен не меняется.
+    """
+    budget = Budget()
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: budget.cancel())
+    try:
+        return execute_line(calculator, line, budget)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def run_expression_file(calculator: Calculator, path: str, output: TextIO) -> bool:
+    """
+    Вычисляет одно (возможно, очень большое) выражение из файла без чтения файла в память (см. Calculator.evaluate_file)
+    и выводит результат или ошибку
+    :return: True, если выражение вычислено без ошибок
+    :raises OSError: Файл не удалось прочитать
+    """
+    try:
+        text, ok = str(calculator.evaluate_file(path)), True
+    except UserFriendlyException as e:
+        text, ok = str(e), False
+    output.write(text + "\n")
+    output.flush()
+    return ok
+
+
+def read_lines(paths: list[str]) -> Iterable[str]:
+    """
+    Построчно читает файлы с большим буфером. "-" или пустой список - stdin.
+    """
+    if not paths:
+        paths = ["-"]
+
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin
+        else:
+            with open(path, encoding="utf-8", buffering=READ_BUFFER_SIZE) as file:
+                yield from file
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    CLI. Без аргументов - интерактивный режим. С --batch или с файлами - пакетный режим:
+    строки читаются из файлов (или stdin), результаты пишутся в stdout без приглашения ввода,
+    в конце в stderr выводится скорость обработки.
+    """
+    parser = argparse.ArgumentParser(prog="python3 -m src.main", description="Простой CLI калькулятор")
+    parser.add_argument("files", nargs="*", help="Файлы со строками для выполнения ('-' - stdin). Включают пакетный режим.")
+    parser.add_argument("--batch", action="store_true", help="Пакетный режим: читать stdin без приглашения ввода")
+    parser.add_argument("--fail-fast", action="store_true", help="Остановиться на первой ошибке (код возврата 1)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Количество процессов для независимых строк в пакетном режиме (0 - по количеству ядер)")
+    parser.add_argument("--stats", action="store_true",
+                        help="Собирать статистику по этапам обработки (':stats'); в пакетном режиме - вывести в stderr")
+    parser.add_argument("--backend", choices=BACKENDS, default=TREE,
+                        help="Способ вычисления: обход синтаксического дерева, стековая машина или сгенерированный код Python")
+    parser.add_argument("--exact-integers", action="store_true",
+                        help="Точные вычисления над целыми числами (int произвольной длины вместо float)")
+    parser.add_argument("--expression-file", metavar="FILE",
+                        help="Вычислить одно выражение, занимающее весь файл (файл отображается в память и не копируется)")
+    args = parser.parse_args(argv)
+
+    if args.stats:
+        profiling.enable()
+
+    calculator = Calculator(backend=args.backend, exact_integers=args.exact_integers)
+
+    if args.expression_file is not None:
+        try:
+            ok = run_expression_file(calculator, args.expression_file, sys.stdout)
+        except OSError as e:
+            sys.exit(f"Не удалось прочитать ввод: {e}")
+        if not ok:
+            sys.exit(1)
+        return
+
+    if not (args.batch or args.files):
+        run_interactive(calculator)
+        return
+
+    started = time.perf_counter()
+    try:
+        if args.jobs == 1:
+            processed, errors = run_batch(calculator, read_lines(args.files), sys.stdout, fail_fast=args.fail_fast)
+        else:
+            processed, errors = run_parallel(calculator, read_lines(args.files), sys.stdout,
+                                             workers=args.jobs or None, fail_fast=args.fail_fast)
+    except OSError as e:
+        sys.exit(f"Не удалось прочитать ввод: {e}")
+    elapsed = time.perf_counter() - started
+
+    speed = processed / elapsed if elapsed > 0 else float("inf")
+    print(f"Строк: {processed}, ошибок: {errors}, {elapsed:.3f} с ({speed:.0f} строк/с)", file=sys.stderr)
+    if args.stats:
+        print(profiling.PROFILER.format(), file=sys.stderr)
+
+    if errors and args.fail_fast:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,261 @@
+import heapq
 import math
+from typing import Iterator, Mapping, MutableMapping, Union
 
-from src.common import InvalidIdentifierError, Nametable, IDENTIFIER_ALLOWED_CHARACTERS
+from src.budgets import BudgetExceededError
+from src.cache import LRUCache
+from src.common import UserFriendlyException, InvalidIdentifierError, Nametable, NameLookup, \
+    IDENTIFIER_ALLOWED_CHARACTERS
+from src.evaluator import evaluate, EvaluationOptions, DEFAULT_OPTIONS
 from src.expressions import Expression
-from src.functions import Function, CodeBasedFunction
-from src.user_functions import UserFunctionDefiner
+from src.functions import Function, CodeBasedFunction, ConditionalFunction
+from src.interning import NodeInterner
+from src.nodes import Node, identifiers
+from src.user_functions import UserFunctionDefiner, UserDefinedFunction
+
+
+class CyclicDependencyError(Exception):
+    """
+    Объявление в режиме формул создает циклическую зависимость между переменными
+    """
+    pass
+
+
+_MISSING = object()
+
+
+class LineDependencies:
+    """
+    Идентификаторы, которые читает и записывает одна строка ввода (см. NametableManager.dependencies)
+    """
+
+    __slots__ = ("reads", "writes", "function_globals")
+
+    reads: frozenset[str]
+    """
+    Идентификаторы, значения которых нужны для выполнения строки
+    """
+    writes: frozenset[str]
+    """
+    Объявляемые строкой идентификаторы
+    """
+    function_globals: frozenset[str] | None
+    """
+    Для объявления функции - идентификаторы, к которым обращается ее тело (читаются не при объявлении, а при вызове)
+    """
+
+    def __init__(self, reads: frozenset[str] = frozenset(), writes: frozenset[str] = frozenset(),
+                 function_globals: frozenset[str] | None = None):
+        self.reads = reads
+        self.writes = writes
+        self.function_globals = function_globals
+
+
+class SharedNames(Mapping[str, Union[float, Function]]):
+    """
+    Неизменяемая общая таблица имен: встроенные функции и общая библиотека констант и функций.
+    Служит нижним слоем LayeredNametable и используется всеми сессиями одновременно, без копирования.
+    Перечень пользовательских функций и их обратные связи вычисляются один раз при создании.
+    Функции хранятся без запоминания результатов: результат зависит от таблицы сессии, из которой они вызваны.
+    """
+
+    __slots__ = ("__names", "functions", "function_readers")
+
+    functions: dict[str, UserDefinedFunction]
+    function_readers: dict[str, frozenset[str]]
+    """
+    Идентификатор -> функции, тела которых обращаются к нему напрямую
+    """
+
+    def __init__(self, names: NameLookup):
+        self.__names = {}
+        self.functions = {}
+        readers: dict[str, set[str]] = {}
+
+        for name, value in names.items():
+            if isinstance(value, UserDefinedFunction):
+                if value.memo is not None:
+                    value = UserDefinedFunction(value.body, value.arg_names)
+                self.functions[name] = value
+                for read in value.global_names:
+                    readers.setdefault(read, set()).add(name)
+            self.__names[name] = value
+
+        self.function_readers = {name: frozenset(functions) for name, functions in readers.items()}
+
+    def __getitem__(self, key: str) -> Union[float, Function]:
+        return self.__names[key]
+
+    def get(self, key: str, default=None):
+        return self.__names.get(key, default)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__names)
+
+    def __len__(self) -> int:
+        return len(self.__names)
+
+
+class LayeredNametable(MutableMapping[str, Union[float, Function]]):
+    """
+    Таблица имен сессии: общий неизменяемый слой (SharedNames) и небольшой собственный слой поверх него.
+    Запись попадает только в собственный слой, поэтому создание сессии не копирует общие имена.
+    snapshot() за O(1) возвращает независимую копию: собственный слой копируется только при первой записи после снимка.
+    Читать таблицу (и ее снимки) можно из нескольких потоков одновременно; записывает в таблицу только ее владелец.
+    Удалить можно только имя собственного слоя.
+    """
+
+    __slots__ = ("base", "__overlay", "__shared")
+
+    base: SharedNames
+    __overlay: Nametable
+    __shared: bool
+    """
+    Собственный слой используется и снимком: перед записью его нужно скопировать
+    """
+
+    def __init__(self, base: SharedNames, overlay: Nametable | None = None):
+        self.base = base
+        self.__overlay = overlay if overlay is not None else {}
+        self.__shared = False
+
+    @property
+    def overlay(self) -> NameLookup:
+        """
+        Собственные имена сессии (только для чтения)
+        """
+        return self.__overlay
+
+    def __getitem__(self, key: str) -> Union[float, Function]:
+        value = self.__overlay.get(key, _MISSING)
+        if value is _MISSING:
+            return self.base[key]
+        return value    # type: ignore
+
+    def get(self, key: str, default=None):
+        value = self.__overlay.get(key, _MISSING)
+        if value is _MISSING:
+            return self.base.get(key, default)
+        return value
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.__overlay or key in self.base
+
+    def __setitem__(self, key: str, value: Union[float, Function]) -> None:
+        self.__own_overlay()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.__own_overlay()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.__overlay
+        for key in self.base:
+            if key not in self.__overlay:
+                yield key
+
+    def __len__(self) -> int:
+        return len(self.base) + sum(1 for key in self.__overlay if key not in self.base)
+
+    def snapshot(self) -> "LayeredNametable":
+        """
+        Копия таблицы за O(1). Последующие изменения таблицы не влияют на копию и наоборот.
+        """
+        self.__shared = True
+        clone = LayeredNametable(self.base, self.__overlay)
+        clone.__shared = True
+        return clone
+
+    def freeze(self) -> SharedNames:
+        """
+        Общая таблица из всех имен (например, чтобы сделать объявления одной сессии общей библиотекой для других)
+        """
+        return SharedNames(self)
+
+    def __own_overlay(self) -> Nametable:
+        if self.__shared:
+            self.__overlay = dict(self.__overlay)
+            self.__shared = False
+        return self.__overlay
 
 
 class NametableManager:
 
-    name_table: Nametable
+    name_table: LayeredNametable
+    max_depth: int | None
+    """
+    Максимальная глубина вложенности скобок и вызовов функций в объявлениях. None - ограничена только памятью.
+    """
+
+    options: EvaluationOptions
+    """
+    Настройки вычисления значений в объявлениях
+    """
 
-    def __init__(self):
-        self.name_table = BUILTINS.copy()
+    memo_size: int
+    """
+    Размер таблицы запомненных результатов для объявляемых функций. 0 - результаты не запоминаются.
+    """
+
+    fold_globals: bool
+    """
+    Подставлять в тела объявляемых функций значения глобальных переменных на момент объявления.
+    Такие функции не зависят от последующих переобъявлений этих переменных.
+    """
+
+    formula_mode: bool
+    """
+    Режим формул: для переменных запоминаются выражения, и при переобъявлении переменной или функции
+    зависящие от нее переменные пересчитываются (как ячейки электронной таблицы)
+    """
+
+    interner: NodeInterner | None
+    """
+    Таблица уникальных узлов для тел функций и формул. None - деревья объявлений не интернируются.
+    """
+
+    formulas: dict[str, Node]
+    """
+    Выражения переменных, объявленных в режиме формул
+    """
+    __formula_reads: dict[str, frozenset[str]]
+    """
+    Идентификаторы, к которым напрямую обращается формула переменной
+    """
+    __dependents: dict[str, set[str]]
+    """
+    Обратные связи формул: идентификатор -> переменные, формулы которых обращаются к нему напрямую
+    """
+    __functions: dict[str, UserDefinedFunction]
+    """
+    Пользовательские функции собственного слоя таблицы имен (чтобы не перебирать всю таблицу при каждом объявлении).
+    Функции общего слоя перечислены в SharedNames.functions.
+    """
+    __function_readers: dict[str, set[str]]
+    """
+    Обратные связи функций собственного слоя: идентификатор -> функции, тела которых обращаются к нему напрямую
+    """
+
+    def __init__(self, max_depth: int | None = None, options: EvaluationOptions = DEFAULT_OPTIONS, memo_size: int = 0,
+                 formula_mode: bool = False, fold_globals: bool = False, base: SharedNames | None = None,
+                 interner: NodeInterner | None = None):
+        """
+        :param base: Общая таблица имен, поверх которой объявляются имена. None - только встроенные функции.
+        """
+        self.name_table = LayeredNametable(base if base is not None else DEFAULT_BASE)
+        self.max_depth = max_depth
+        self.options = options
+        self.memo_size = memo_size
+        self.fold_globals = fold_globals
+        self.formula_mode = formula_mode
+        self.interner = interner
+        self.formulas = {}
+        self.__formula_reads = {}
+        self.__dependents = {}
+        self.__functions = {}
+        self.__function_readers = {}
 
     @staticmethod
     def is_declaration(user_input: str) -> bool:
@@ -21,6 +265,39 @@ class NametableManager:
         """
         return "=" in user_input
 
+    def dependencies(self, user_input: str) -> LineDependencies:
+        """
+        Определяет без вычисления, какие идентификаторы читает и записывает строка (выражение или объявление).
+        Вызовы функций учитываются только по имени функции: к чему обращается тело, см. function_globals.
+        Строка с синтаксической ошибкой ничего не читает и не записывает - ее выполнение все равно завершится ошибкой.
+        :param user_input: Нормализованная строка ввода (как для is_declaration и declare_from_string)
+        """
+        try:
+            if not self.is_declaration(user_input):
+                return LineDependencies(reads=identifiers(Expression(user_input, max_depth=self.max_depth).parse()))
+
+            identifier, value_string = user_input.split("=")
+            self.__assert_identifier_valid(identifier)
+
+            if UserFunctionDefiner.is_function_definition(value_string):
+                function = UserFunctionDefiner.build_function_from_string(value_string, max_depth=self.max_depth,
+                                                                          name_table=self.name_table)
+                assert isinstance(function, UserDefinedFunction)
+                if not self.fold_globals:
+                    return LineDependencies(writes=frozenset((identifier, )), function_globals=function.global_names)
+
+                # значения глобальных переменных подставляются в тело при объявлении, т. е. читаются сразу
+                folded = UserFunctionDefiner.build_function_from_string(value_string, max_depth=self.max_depth,
+                                                                        name_table=self.name_table, fold_globals=True)
+                assert isinstance(folded, UserDefinedFunction)
+                return LineDependencies(reads=function.global_names, writes=frozenset((identifier, )),
+                                        function_globals=folded.global_names)
+
+            tree = Expression(value_string, max_depth=self.max_depth).parse()
+            return LineDependencies(reads=identifiers(tree), writes=frozenset((identifier, )))
+        except Exception:
+            return LineDependencies()
+
     def declare_from_string(self, user_input: str):
         """
         Объявляет переменную из строки вида "id=12+5". Объявленная переменная добавится в name_table с вычисленным значением {"id": 17}.
@@ -38,12 +315,210 @@ class NametableManager:
         self.__assert_identifier_valid(identifier)
 
         value: float | Function
+        formula = None
         if UserFunctionDefiner.is_function_definition(value_string):
-            value = UserFunctionDefiner.build_function_from_string(value_string)
+            value = UserFunctionDefiner.build_function_from_string(value_string, max_depth=self.max_depth,
+                                                                   memo_size=self.memo_size, name_table=self.name_table,
+                                                                   fold_globals=self.fold_globals, options=self.options,
+                                                                   interner=self.interner)
         else:
-            value = Expression(value_string).evaluate(name_table=self.name_table)
+            expression = Expression(value_string, max_depth=self.max_depth, interner=self.interner)
+            value = expression.evaluate(name_table=self.name_table, options=self.options)
+            if self.formula_mode:
+                formula = expression.parse()
 
-        self.name_table[identifier] = value
+        self.assign(identifier, value, formula)
+
+    def assign(self, identifier: str, value: float | Function, formula: Node | None = None) -> None:
+        """
+        Записывает значение в таблицу имен.
+        Запомненные результаты функций, которые (в том числе через другие функции) обращаются к identifier, сбрасываются.
+        В режиме формул затем пересчитываются зависящие от identifier переменные - только они и в порядке зависимостей.
+        Если пересчет невозможен, таблица имен остается в исходном состоянии.
+        :param formula: Выражение, значением которого является value (для режима формул)
+        :raises CyclicDependencyError: Объявление создает циклическую зависимость
+        :raises UserFriendlyException: Ошибка при пересчете зависимой переменной
+        """
+        if not self.formula_mode:
+            self.name_table[identifier] = value
+            self.__index_function(identifier, value)
+            self.__invalidate_memos([identifier])
+            return
+
+        undo: list[tuple[str, object, Node | None]] = []
+        has_memos = self.memo_size > 0 and bool(self.__functions)
+        try:
+            self.__write(identifier, value, formula, undo)
+            for name in self.__recomputation_order(identifier):
+                formula = self.formulas[name]
+                if has_memos:    # предыдущее значение могут прочитать запомненные функции в формуле
+                    self.__invalidate_memos([undo[-1][0]])
+                try:
+                    value = evaluate(formula, self.name_table, self.options)
+                except BudgetExceededError:
+                    raise
+                except Exception as e:
+                    raise UserFriendlyException(f"Ошибка при пересчете переменной '{name}':\n{str(e)}") from e
+                self.__write(name, value, formula, undo)
+        except Exception:
+            for name, old_value, old_formula in reversed(undo):
+                self.__write(name, old_value, old_formula)
+            raise
+        finally:
+            self.__invalidate_memos([entry[0] for entry in undo])
+
+    def __write(self, name: str, value: object, formula: Node | None,
+                undo: list[tuple[str, object, Node | None]] | None = None) -> None:
+        """
+        Записывает значение и формулу переменной, обновляя обратные связи формул.
+        :param value: Значение или _MISSING, чтобы удалить имя
+        :param undo: Список, в который сохраняется предыдущее состояние
+        """
+        if undo is not None:
+            undo.append((name, self.name_table.get(name, _MISSING), self.formulas.get(name)))
+
+        if self.formulas.pop(name, None) is not None:
+            for read in self.__formula_reads.pop(name):
+                self.__dependents[read].discard(name)
+        if formula is not None:
+            self.formulas[name] = formula
+            self.__formula_reads[name] = identifiers(formula)
+            for read in self.__formula_reads[name]:
+                self.__dependents.setdefault(read, set()).add(name)
+
+        if value is _MISSING:
+            self.name_table.pop(name, None)
+        else:
+            self.name_table[name] = value    # type: ignore
+        self.__index_function(name, value)
+
+    def __index_function(self, name: str, value: object) -> None:
+        """
+        Обновляет перечень пользовательских функций и их обратные связи после записи name
+        """
+        previous = self.__functions.pop(name, None)
+        if previous is not None:
+            for read in previous.global_names:
+                self.__function_readers[read].discard(name)
+        if isinstance(value, UserDefinedFunction):
+            self.__functions[name] = value
+            for read in value.global_names:
+                self.__function_readers.setdefault(read, set()).add(name)
+
+    def __recomputation_order(self, identifier: str) -> list[str]:
+        """
+        Находит переменные-формулы, которые зависят от identifier напрямую, через другие переменные или через тела функций,
+        и упорядочивает их так, чтобы каждая пересчитывалась после всех, от которых она зависит.
+        :raises CyclicDependencyError: Зависимости образуют цикл
+        """
+        affected: set[str] = set()
+        changed = {identifier}
+        pending = [identifier]
+        while pending:
+            name = pending.pop()
+            readers = self.__dependents.get(name, set()) | self.__readers(name)
+            for reader in readers:
+                if reader == identifier and identifier in self.formulas:
+                    raise CyclicDependencyError(f"Циклическая зависимость: '{identifier}' зависит от самой себя")
+                if reader not in changed:
+                    changed.add(reader)
+                    pending.append(reader)
+                    if reader in self.formulas:
+                        affected.add(reader)
+
+        # зависимости между затронутыми переменными с учетом тел вызываемых функций
+        depends_on: dict[str, set[str]] = {}
+        for name in affected:
+            reads = set(self.__formula_reads[name])
+            calls = [function for function in map(self.__function, reads) if function is not None]
+            while calls:
+                for read in calls.pop().global_names - reads:
+                    reads.add(read)
+                    function = self.__function(read)
+                    if function is not None:
+                        calls.append(function)
+            depends_on[name] = reads & affected
+
+        dependents: dict[str, list[str]] = {name: [] for name in affected}
+        for name, reads in depends_on.items():
+            for read in reads:
+                dependents[read].append(name)
+
+        order: list[str] = []
+        ready = [name for name, reads in depends_on.items() if not reads]
+        heapq.heapify(ready)    # порядок среди независимых переменных - по имени, чтобы пересчет был детерминированным
+        while ready:
+            name = heapq.heappop(ready)
+            order.append(name)
+            for dependent in dependents[name]:
+                reads = depends_on[dependent]
+                reads.discard(name)
+                if not reads:
+                    heapq.heappush(ready, dependent)
+
+        if len(order) != len(affected):
+            cycle = ", ".join(sorted(affected - set(order)))
+            raise CyclicDependencyError(f"Циклическая зависимость между переменными: {cycle}")
+
+        return order
+
+    def restore(self, names: Nametable, formulas: dict[str, Node] | None = None) -> None:
+        """
+        Заменяет все объявления сохраненными (например, из снимка, см. snapshots.py) без повторного вычисления.
+        Имена общей таблицы (встроенные функции и т. п.), не перекрытые в names, остаются доступны.
+        :param names: Объявленные переменные и функции
+        :param formulas: Выражения переменных для режима формул
+        """
+        self.name_table = LayeredNametable(self.name_table.base, dict(names))
+        self.formulas = {}
+        self.__formula_reads = {}
+        self.__dependents = {}
+        self.__functions = {}
+        self.__function_readers = {}
+        for name, value in names.items():
+            self.__index_function(name, value)
+        for name, formula in (formulas or {}).items():
+            self.__write(name, names[name], formula)
+
+    def memo_stats(self) -> dict[str, LRUCache]:
+        """
+        Таблицы запомненных результатов функций (со счетчиками hits/misses/hit_rate)
+        """
+        return {name: value.memo for name, value in self.__functions.items() if value.memo is not None}
+
+    def __invalidate_memos(self, names: list[str]) -> None:
+        """
+        Сбрасывает запомненные результаты функций, зависящих от names напрямую или через вызовы других функций
+        """
+        if self.memo_size == 0 or not self.__functions or not names:
+            return
+
+        changed = set(names)
+        pending = list(changed)
+        while pending:
+            for function_name in self.__readers(pending.pop()):
+                if function_name not in changed:
+                    self.__function(function_name).invalidate_memo()    # type: ignore
+                    changed.add(function_name)
+                    pending.append(function_name)
+
+    def __function(self, name: str) -> UserDefinedFunction | None:
+        """
+        Пользовательская функция с именем name из собственного или общего слоя таблицы имен
+        """
+        function = self.__functions.get(name)
+        if function is None and name not in self.name_table.overlay:
+            function = self.name_table.base.functions.get(name)
+        return function
+
+    def __readers(self, name: str) -> set[str]:
+        """
+        Функции (обоих слоев таблицы имен), тела которых обращаются к name напрямую
+        """
+        readers = set(self.__function_readers.get(name, ()))
+        overlay = self.name_table.overlay
+        readers.update(reader for reader in self.name_table.base.function_readers.get(name, ()) if reader not in overlay)
+        return readers
 
     @staticmethod
     def __assert_identifier_valid(identifier: str) -> None:
@@ -68,4 +543,10 @@ BUILTINS = {
     "abs": CodeBasedFunction(abs),    # type: ignore
     "sqrt": CodeBasedFunction(math.sqrt),    # type: ignore
     "pow": CodeBasedFunction(math.pow),
+    "if": ConditionalFunction(),
 }
+
+DEFAULT_BASE = SharedNames(BUILTINS)
+"""
+Общая таблица по умолчанию: только встроенные функции
+"""
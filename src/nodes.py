@@ -0,0 +1,383 @@
+import math
+from typing import Any
+
+from src.common import UserFriendlyException, NameLookup
+from src.functions import Function, FunctionSyntaxError, FunctionExecutionError
+from src.operators import BinaryOperator, OperationError, as_integer
+
+
+class Node:
+    """
+    Базовый класс узла синтаксического дерева мат. выражения.
+    Узлы неизменяемы: дерево строится парсером один раз и дальше только вычисляется (см. evaluator.py).
+    Каждый узел помнит свой участок исходной строки, чтобы сообщения об ошибках совпадали с исходным вводом.
+    """
+
+    __slots__ = ("source", "start", "end", "__weakref__")
+
+    _fields: tuple[str, ...] = ()
+    """
+    Собственные поля узла (без участка исходной строки). Используются для копирования узла.
+    """
+
+    source: str
+    start: int
+    end: int
+
+    def __init__(self, source: str, start: int, end: int):
+        object.__setattr__(self, "source", source)
+        object.__setattr__(self, "start", start)
+        object.__setattr__(self, "end", end)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"Узел '{type(self).__name__}' нельзя изменить")
+
+    @property
+    def text(self) -> str:
+        """
+        Участок исходной строки, из которого был получен узел
+        """
+        return self.source[self.start:self.end]
+
+    def respan(self, start: int, end: int) -> "Node":
+        """
+        Возвращает копию узла, привязанную к другому участку исходной строки.
+        Используется парсером, чтобы лишние скобки вокруг выражения попадали в текст ошибок, как раньше.
+        """
+        clone = object.__new__(type(self))
+        for field in self._fields:
+            object.__setattr__(clone, field, getattr(self, field))
+        Node.__init__(clone, self.source, start, end)
+        return clone
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.text!r})"
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in self._fields + _SPAN}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """
+        Восстановление при распаковке (pickle) в обход запрета на изменение узла
+        """
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
+
+_SPAN = ("source", "start", "end")
+"""
+Поля участка исходной строки (сохраняются при копировании и распаковке узла)
+"""
+
+
+class Number(Node):
+    """
+    Числовая константа
+    """
+
+    __slots__ = ("value", )
+    _fields = ("value", )
+
+    value: float
+
+    def __init__(self, value: float, source: str, start: int, end: int):
+        object.__setattr__(self, "value", value)
+        super().__init__(source, start, end)
+
+
+class Name(Node):
+    """
+    Обращение к переменной
+    """
+
+    __slots__ = ("identifier", )
+    _fields = ("identifier", )
+
+    identifier: str
+
+    def __init__(self, identifier: str, source: str, start: int, end: int):
+        object.__setattr__(self, "identifier", identifier)
+        super().__init__(source, start, end)
+
+    def resolve(self, name_table: NameLookup) -> float:
+        """
+        Возвращает значение переменной из таблицы имен
+        :raises UserFriendlyException: Идентификатор не найден или не является переменной
+        """
+        try:
+            target = name_table[self.identifier]
+        except KeyError:
+            raise UserFriendlyException(f"Ошибка в выражении: {self.text}\n"
+                                        f"Неизвестный идентификатор: {self.identifier}")
+
+        if not isinstance(target, (float, int)):
+            raise UserFriendlyException(f"Ошибка в выражении: {self.text}\n"
+                                        f"'{self.identifier}' не может использоваться как переменная")
+
+        return target
+
+
+class Call(Node):
+    """
+    Вызов функции из таблицы имен
+    """
+
+    __slots__ = ("identifier", "args")
+    _fields = ("identifier", "args")
+
+    identifier: str
+    args: tuple[Node, ...]
+
+    def __init__(self, identifier: str, args: tuple[Node, ...], source: str, start: int, end: int):
+        object.__setattr__(self, "identifier", identifier)
+        object.__setattr__(self, "args", args)
+        super().__init__(source, start, end)
+
+    def resolve(self, name_table: NameLookup) -> Function:
+        """
+        Возвращает вызываемую функцию из таблицы имен
+        :raises UserFriendlyException: Идентификатор не найден или не является функцией
+        """
+        try:
+            target = name_table[self.identifier]
+        except KeyError:
+            raise UserFriendlyException(f"Ошибка в выражении: {self.text}\n"
+                                        f"Неизвестный идентификатор: {self.identifier}")
+
+        if not isinstance(target, Function):
+            raise UserFriendlyException(f"Ошибка в выражении: {self.text}\n"
+                                        f"'{self.identifier}' не является функцией")
+
+        return target
+
+    def invoke(self, target: Function, args: list[float], name_table: NameLookup, **kwargs) -> float:
+        """
+        Вызывает функцию с уже вычисленными аргументами
+        :param kwargs: Дополнительные параметры вычисления, передаваемые функции (например, options)
+        :raises UserFriendlyException: Ошибка в вызове функции
+        """
+        try:
+            return target(*args, name_table=name_table, **kwargs)
+        except (FunctionSyntaxError, FunctionExecutionError) as e:
+            raise self.call_error(e) from e
+
+    def call_error(self, error: Exception) -> UserFriendlyException:
+        """
+        Ошибка, возникшая в вызываемой функции, с текстом вызова (как в invoke)
+        """
+        return UserFriendlyException(f"Ошибка в вызове функции: {self.text}\n{str(error)}")
+
+
+class OperatorChain(Node):
+    """
+    Цепочка операторов одного приоритета: operands[0] op[0] operands[1] op[1] ... operands[n].
+    Вся цепочка сворачивается за один проход (слева направо или справа налево для правоассоциативных операторов),
+    без промежуточных узлов для каждого оператора.
+    Порядок вычисления - как при вычислении по строкам: оператор применяется, как только вычислены оба его операнда.
+    Слева направо: operands[0], operands[1], op[0], operands[2], op[1], ...; справа налево (правоассоциативные):
+    operands[n-1], operands[n], op[n-1], operands[n-2], op[n-2], ... Так из нескольких ошибок возникает та же первая.
+    """
+
+    __slots__ = ("operands", "operators", "additive", "stepwise")
+    _fields = ("operands", "operators", "additive", "stepwise")
+
+    operands: tuple[Node, ...]
+    operators: tuple[BinaryOperator, ...]
+    additive: bool
+    """
+    True, если цепочка состоит только из сложений и вычитаний
+    """
+    stepwise: bool
+    """
+    True, если после первого оператора вычисляется операнд, который может завершиться ошибкой (не число):
+    операторы нужно применять между вычислениями операндов (apply), а не после всех (fold)
+    """
+
+    def __init__(self, operands: tuple[Node, ...], operators: tuple[BinaryOperator, ...],
+                 source: str, start: int, end: int):
+        if len(operands) != len(operators) + 1:
+            raise ValueError("Операндов должно быть на один больше, чем операторов")
+
+        object.__setattr__(self, "operands", operands)
+        object.__setattr__(self, "operators", operators)
+        object.__setattr__(self, "additive", all(op in _ADDITIVE for op in operators))
+        later = operands[:-2] if operators and operators[0].right_associative else operands[2:]
+        object.__setattr__(self, "stepwise", not all(isinstance(operand, Number) for operand in later))
+        super().__init__(source, start, end)
+
+    @property
+    def right_associative(self) -> bool:
+        # у операторов одного приоритета одинаковая ассоциативность
+        return self.operators[0].right_associative
+
+    def order(self) -> list[Node | int]:
+        """
+        Операнды и номера операторов цепочки в порядке вычисления (при вычислении по шагам, см. stepwise)
+        """
+        operands = self.operands
+        last = len(self.operators) - 1
+        order: list[Node | int]
+        if self.right_associative:
+            order = [operands[-2], operands[-1], last]
+            for index in range(last - 1, -1, -1):
+                order += [operands[index], index]
+        else:
+            order = [operands[0]]
+            for index in range(last + 1):
+                order += [operands[index + 1], index]
+        return order
+
+    def apply(self, index: int, left: float, right: float, exact_integers: bool = False) -> float:
+        """
+        Применяет один оператор цепочки (при вычислении по шагам, см. stepwise)
+        :param index: Номер оператора
+        :raises UserFriendlyException: Недопустимая операция
+        """
+        operator = self.operators[index]
+        try:
+            return operator.exact(left, right) if exact_integers else operator(left, right)
+        except OperationError as e:
+            raise UserFriendlyException(f"Ошибка вычисления выражения: {self.text}\n{str(e)}") from e
+
+    def fold(self, values: list[float], compensated_sum: bool = False, exact_integers: bool = False) -> float:
+        """
+        Применяет операторы цепочки к уже вычисленным значениям операндов
+        :param values: Значения операндов в порядке записи
+        :param compensated_sum:
+            Для цепочек из сложений и вычитаний - суммировать точно (math.fsum) и округлять один раз в конце,
+            вместо округления после каждого оператора
+        :param exact_integers: Операторы над целыми операндами вычисляются точно в int (BinaryOperator.exact)
+        :raises UserFriendlyException: Недопустимая операция (деление на ноль, переполнение и т. п.)
+        """
+        if exact_integers:
+            return self.__fold_exact(values, compensated_sum)
+
+        if compensated_sum and self.additive:
+            terms = [values[0]]
+            terms.extend(value if op is _ADD else -value for op, value in zip(self.operators, values[1:]))
+            try:
+                return round(math.fsum(terms), 2)
+            except (OverflowError, ValueError):
+                pass    # бесконечности и переполнение обрабатываются обычным способом
+
+        operators = self.operators
+        if self.right_associative:
+            result = values[-1]
+            for index in range(len(operators) - 1, -1, -1):
+                result = self.__apply(operators[index], values[index], result)
+        else:
+            result = values[0]
+            for index, operator in enumerate(operators):
+                result = self.__apply(operator, result, values[index + 1])
+
+        return result
+
+    def __fold_exact(self, values: list[float], compensated_sum: bool) -> float:
+        if compensated_sum and self.additive and not all(as_integer(value) is not None for value in values):
+            return self.fold(values, compensated_sum)    # сумма целых и так точная
+
+        operators = self.operators
+        try:
+            if self.right_associative:
+                result = values[-1]
+                for index in range(len(operators) - 1, -1, -1):
+                    result = operators[index].exact(values[index], result)
+            else:
+                result = values[0]
+                for index, operator in enumerate(operators):
+                    result = operator.exact(result, values[index + 1])
+        except OperationError as e:
+            raise UserFriendlyException(f"Ошибка вычисления выражения: {self.text}\n{str(e)}") from e
+
+        return result
+
+    def __apply(self, operator: BinaryOperator, left: float, right: float) -> float:
+        try:
+            return operator(left, right)
+        except OperationError as e:
+            raise UserFriendlyException(f"Ошибка вычисления выражения: {self.text}\n{str(e)}") from e
+
+
+_ADD = BinaryOperator.from_symbol("+")
+_ADDITIVE = frozenset((_ADD, BinaryOperator.from_symbol("-")))
+
+
+def identifiers(tree: Node) -> frozenset[str]:
+    """
+    Собирает все идентификаторы (переменные и вызываемые функции), к которым обращается дерево.
+    Обход выполняется без рекурсии.
+    """
+    names: set[str] = set()
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Name):
+            names.add(node.identifier)
+        elif isinstance(node, Call):
+            names.add(node.identifier)
+            pending.extend(node.args)
+        elif isinstance(node, OperatorChain):
+            pending.extend(node.operands)
+
+    return frozenset(names)
+
+
+def children(node: Node) -> tuple[Node, ...]:
+    """
+    Непосредственные потомки узла: аргументы вызова или операнды цепочки
+    """
+    if isinstance(node, Call):
+        return node.args
+    if isinstance(node, OperatorChain):
+        return node.operands
+    return ()
+
+
+def child_offsets(node: Node) -> list[int]:
+    """
+    Смещения непосредственных потомков относительно начала участка узла.
+    После интернирования (см. interning.py) потомок может быть взят из другой исходной строки с тем же текстом
+    или быть повтором более раннего потомка. Тогда его смещение находится поиском по тексту узла:
+    потомки идут в нем по порядку и не пересекаются.
+    """
+    offsets: list[int] = []
+    text: str | None = None
+    cursor = 0
+    for child in children(node):
+        offset = child.start - node.start
+        if child.source is not node.source or offset < cursor:
+            if text is None:
+                text = node.text
+            if isinstance(node, Call) and not offsets:    # аргументы начинаются после 'имя(' (узел может быть в скобках)
+                cursor = text.find(node.identifier + "(") + len(node.identifier) + 1
+            offset = text.find(child.text, cursor)
+        offsets.append(offset)
+        cursor = offset + child.end - child.start
+    return offsets
+
+
+def shared_subtrees(tree: Node) -> dict[Node, int]:
+    """
+    Составные узлы (цепочки и вызовы), на которые дерево ссылается больше одного раза.
+    После интернирования одинаковые поддеревья - один объект, поэтому повторы находятся по идентичности узлов.
+    Повторы внутри повторяющегося поддерева не учитываются: достаточно вычислить его один раз.
+    Обход выполняется без рекурсии, каждый узел просматривается один раз.
+    :return: Узел -> количество узлов в поддереве (сколько узлов не придется обходить при повторе)
+    """
+    references: dict[Node, int] = {}
+    sizes: dict[Node, int] = {}
+    started: set[Node] = set()
+    pending: list[tuple[Node, bool]] = [(tree, False)]
+    while pending:
+        node, expanded = pending.pop()
+        if expanded:
+            sizes[node] = 1 + sum(sizes.get(child, 1) for child in children(node))
+        elif node not in started:
+            started.add(node)
+            pending.append((node, True))
+            for child in children(node):
+                references[child] = references.get(child, 0) + 1
+                if isinstance(child, (Call, OperatorChain)) and child not in started:
+                    pending.append((child, False))
+
+    return {node: sizes[node] for node, count in references.items() if count > 1 and node in sizes}
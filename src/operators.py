@@ -3,6 +3,17 @@ import operator as ops
 from functools import wraps
 
 
+MAX_INTEGER_BITS = 10_000
+"""
+Максимальный размер точного целого результата (около 3000 десятичных знаков, см. BinaryOperator.exact).
+Больший результат - ошибка переполнения, как и для float.
+"""
+
+_MAX_EXACT_FLOAT = 2 ** 53
+"""
+Целые float по модулю не больше этого значения представлены точно и считаются целыми операндами
+"""
+
 class OperationError(Exception):
     """
     Ошибка при выполнении оператора
@@ -32,10 +43,19 @@ class BinaryOperator:
     Экземпляр оператора является callable, т. е. используется как op_instance(left, right).
     """
     __func: Callable[[float, float], float]
+    __integer: Callable[[int, int], int | None] | None
+    """
+    Точный вариант над int (см. exact). None - результат не целый, считается как float.
+    """
     __str_repr: str
     """
     Строковое представление оператора для отладки и вывода ошибок
     """
+    precedence: int
+    """
+    Приоритет оператора. Чем больше число, тем раньше выполняется оператор
+    """
+    right_associative: bool
 
     @staticmethod
     def from_symbol(sym: str) -> 'BinaryOperator':
@@ -46,9 +66,20 @@ class BinaryOperator:
         """
         return _OP_MAP[sym]
 
-    def __init__(self, str_repr: str, func: Callable[[float, float], float]):
+    @staticmethod
+    def symbols() -> frozenset[str]:
+        """
+        Символы всех определенных операторов
+        """
+        return frozenset(_OP_MAP)
+
+    def __init__(self, str_repr: str, func: Callable[[float, float], float], precedence: int,
+                 right_associative: bool = False, integer: Callable[[int, int], int | None] | None = None):
         self.__func = func
+        self.__integer = integer
         self.__str_repr = str_repr
+        self.precedence = precedence
+        self.right_associative = right_associative
 
     def __call__(self, left: float, right: float) -> float:
         """
@@ -65,6 +96,40 @@ class BinaryOperator:
         except OverflowError as e:
             raise OperationError(left, self.__str_repr, right, "переполнение") from e
 
+    def exact(self, left: float, right: float) -> float:
+        """
+        Применяет оператор в режиме целых чисел (EvaluationOptions.exact_integers): если оба операнда целые
+        (int или float без дробной части в пределах точности double), результат вычисляется над int точно и без округления.
+        Если операнды не целые или точный результат не целый (например, 7 / 2), оператор применяется как обычно (__call__).
+        :raises OperationError: Если произошла заранее обработанная ошибка (например, переполнение)
+        :return: int или float с точностью 2 знака после запятой
+        """
+        if self.__integer is not None:
+            integer_left = left if isinstance(left, int) else as_integer(left)
+            integer_right = right if isinstance(right, int) else as_integer(right)
+            if integer_left is not None and integer_right is not None:
+                try:
+                    result = self.__integer(integer_left, integer_right)
+                except OperationError as e:
+                    e.operator = self.__str_repr
+                    raise
+                if result is not None:
+                    return result
+        return self(left, right)
+
+    @property
+    def symbol(self) -> str:
+        """
+        Символ, по которому оператор возвращает from_symbol (может отличаться от строкового представления, например '#')
+        """
+        return _SYMBOLS[self]
+
+    def __reduce__(self) -> tuple:
+        """
+        При распаковке (pickle, например, в другом процессе) оператор восстанавливается по символу как Flyweight
+        """
+        return BinaryOperator.from_symbol, (self.symbol, )
+
     def __str__(self) -> str:
         return self.__str_repr
 
@@ -99,15 +164,94 @@ def assert_integers(func: Callable[[float, float], float]) -> Callable[[float, f
     return wrapper
 
 
+def as_integer(value: float) -> int | None:
+    """
+    :return: Значение как int, если оно целое и точно представлено, иначе None
+    """
+    if value.__class__ is int:
+        return value    # type: ignore
+    if value.is_integer() and -_MAX_EXACT_FLOAT <= value <= _MAX_EXACT_FLOAT:
+        return int(value)
+    return None
+
+
+def _assert_fits(left: int, right: int, result: int) -> int:
+    if result.bit_length() > MAX_INTEGER_BITS:
+        raise OperationError(left, "", right, "переполнение")
+    return result
+
+
+def _integer_true_divide(left: int, right: int) -> int | None:
+    if right == 0:
+        raise OperationError(left, "", right, "деление на ноль")
+    quotient, remainder = divmod(left, right)
+    return quotient if remainder == 0 else None
+
+
+def _integer_floor_divide(left: int, right: int) -> int:
+    if right == 0:
+        raise OperationError(left, "", right, "деление на ноль")
+    return left // right
+
+
+def _integer_mod(left: int, right: int) -> int:
+    if right == 0:
+        raise OperationError(left, "", right, "деление на ноль")
+    return left % right
+
+
+def _integer_power(left: int, right: int) -> int | None:
+    if right < 0:
+        return None
+    if (abs(left).bit_length() - 1) * right > MAX_INTEGER_BITS:    # оценка снизу, чтобы не считать огромную степень
+        raise OperationError(left, "", right, "переполнение")
+    return _assert_fits(left, right, left ** right)
+
+
+def _integer_comparison(compare: Callable[[int, int], bool]) -> Callable[[int, int], int]:
+    return lambda left, right: int(compare(left, right))
+
+
 _OP_MAP = {
-    "+": BinaryOperator("+", ops.add),
-    "-": BinaryOperator("-", ops.sub),
-    "*": BinaryOperator("*", ops.mul),
-    "/": BinaryOperator("/", assert_right_is_non_zero(ops.truediv)),
-    "#": BinaryOperator("//", assert_right_is_non_zero(assert_integers(ops.floordiv))),
-    "%": BinaryOperator("%", assert_right_is_non_zero(assert_integers(ops.mod))),
-    "^": BinaryOperator("**", ops.pow),
+    "+": BinaryOperator("+", ops.add, 1, integer=ops.add),
+    "-": BinaryOperator("-", ops.sub, 1, integer=ops.sub),
+    "*": BinaryOperator("*", ops.mul, 2, integer=lambda left, right: _assert_fits(left, right, left * right)),
+    "/": BinaryOperator("/", assert_right_is_non_zero(ops.truediv), 2, integer=_integer_true_divide),
+    "#": BinaryOperator("//", assert_right_is_non_zero(assert_integers(ops.floordiv)), 2, integer=_integer_floor_divide),
+    "%": BinaryOperator("%", assert_right_is_non_zero(assert_integers(ops.mod)), 2, integer=_integer_mod),
+    "^": BinaryOperator("**", ops.pow, 3, right_associative=True, integer=_integer_power),
+    "<": BinaryOperator("<", ops.lt, 0, integer=_integer_comparison(ops.lt)),
+    ">": BinaryOperator(">", ops.gt, 0, integer=_integer_comparison(ops.gt)),
+    "{": BinaryOperator("<=", ops.le, 0, integer=_integer_comparison(ops.le)),
+    "}": BinaryOperator(">=", ops.ge, 0, integer=_integer_comparison(ops.ge)),
+    "~": BinaryOperator("==", ops.eq, 0, integer=_integer_comparison(ops.eq)),
+    "!": BinaryOperator("!=", ops.ne, 0, integer=_integer_comparison(ops.ne)),
+}
+"""
+Flyweight объекты операторов.
+Сравнения дают 1.0 (истина) или 0.0 (ложь) и выполняются после арифметики. Многосимвольные операторы
+заменяются при нормализации ввода на один символ (см. Calculator.prepare), например '//' на '#' и '<=' на '{'.
+"""
+
+_SYMBOLS = {operator: sym for sym, operator in _OP_MAP.items()}
+
+SPELLINGS = {
+    "//": "#",
+    "**": "^",
+    "<=": "{",
+    ">=": "}",
+    "==": "~",
+    "!=": "!",
 }
 """
-Flyweight объекты операторов
+Многосимвольные операторы ввода и символы, на которые они заменяются при нормализации (в порядке замены)
 """
+
+
+def translate_spellings(text: str) -> str:
+    """
+    Заменяет многосимвольные операторы (SPELLINGS) их символами
+    """
+    for spelling, symbol in SPELLINGS.items():
+        text = text.replace(spelling, symbol)
+    return text
@@ -0,0 +1,153 @@
+from typing import Collection
+
+from src.common import UserFriendlyException, NameLookup
+from src.evaluator import EvaluationOptions, DEFAULT_OPTIONS
+from src.functions import CodeBasedFunction
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.operators import BinaryOperator
+
+
+def fold_constants(tree: Node, params: Collection[str], name_table: NameLookup | None = None,
+                   fold_globals: bool = False, options: EvaluationOptions = DEFAULT_OPTIONS) -> Node:
+    """
+    Заранее вычисляет поддеревья, которые не зависят от параметров функции, и заменяет их числами.
+    Константами считаются:
+    - числа;
+    - глобальные переменные из name_table и вызовы встроенных функций (CodeBasedFunction из name_table)
+      с константными аргументами - только при fold_globals. Тогда функция запоминает их значения на момент
+      объявления и не зависит от последующих переобъявлений. Без fold_globals имя встроенной функции
+      может быть переобъявлено или скрыто параметром вызывающей функции, поэтому вызов остается как есть.
+    Вызовы пользовательских функций не сворачиваются: их тело видит аргументы вызывающей функции.
+    Если вычисление поддерева завершается ошибкой (деление на ноль и т. п.), поддерево остается как есть,
+    чтобы ошибка возникла при вызове с тем же сообщением, что и без свертки.
+    Свернутые узлы сохраняют участок исходной строки, поэтому тексты ошибок не меняются.
+    :param tree: Корень синтаксического дерева тела функции
+    :param params: Названия параметров функции
+    :param name_table: Таблица имен на момент объявления. None - сворачиваются только числовые выражения.
+    :param fold_globals: Подставлять значения глобальных переменных и результаты встроенных функций
+    :param options: Настройки вычисления, с которыми будет вызываться функция
+    :return: Новый корень (или исходный, если сворачивать нечего)
+    """
+    results: list[Node] = []
+    pending: list[tuple[Node, bool]] = [(tree, False)]
+
+    while pending:
+        node, expanded = pending.pop()
+
+        if isinstance(node, Number):
+            results.append(node)
+
+        elif isinstance(node, Name):
+            value = _constant_global(node.identifier, params, name_table) if fold_globals else None
+            results.append(node if value is None else Number(value, node.source, node.start, node.end))
+
+        elif isinstance(node, OperatorChain):
+            if expanded:
+                first_operand = len(results) - len(node.operands)
+                operands = tuple(results[first_operand:])
+                del results[first_operand:]
+                results.append(_fold_chain(node, operands, options))
+            else:
+                pending.append((node, True))
+                pending.extend((operand, False) for operand in reversed(node.operands))
+
+        elif isinstance(node, Call):
+            if expanded:
+                first_arg = len(results) - len(node.args)
+                args = tuple(results[first_arg:])
+                del results[first_arg:]
+                results.append(_fold_call(node, args, params, name_table if fold_globals else None))
+            else:
+                pending.append((node, True))
+                pending.extend((arg, False) for arg in reversed(node.args))
+
+        else:
+            raise TypeError(f"Неизвестный тип узла: {type(node).__name__}")
+
+    return results[0]
+
+
+def _constant_global(identifier: str, params: Collection[str], name_table: NameLookup | None) -> float | None:
+    if identifier in params or name_table is None:
+        return None
+
+    value = name_table.get(identifier)
+    return value if isinstance(value, (float, int)) else None
+
+
+def _fold_chain(chain: OperatorChain, operands: tuple[Node, ...], options: EvaluationOptions) -> Node:
+    """
+    Сворачивает цепочку целиком, если все операнды - числа. Иначе сворачивает константное начало цепочки
+    (конец - для правоассоциативных), которое при вычислении все равно выполнилось бы первым.
+    """
+    if all(isinstance(operand, Number) for operand in operands):
+        try:
+            value = chain.fold([operand.value for operand in operands], options.compensated_sum,    # type: ignore
+                               options.exact_integers)
+        except UserFriendlyException:
+            return _rebuild_chain(chain, operands, chain.operators)
+        return Number(value, chain.source, chain.start, chain.end)
+
+    if chain.additive and options.compensated_sum:
+        # точная сумма вычисляется по всем слагаемым сразу, частичная свертка изменила бы результат
+        return _rebuild_chain(chain, operands, chain.operators)
+
+    count = 0
+    ordered = reversed(operands) if chain.right_associative else iter(operands)
+    for operand in ordered:
+        if not isinstance(operand, Number):
+            break
+        count += 1
+
+    if count >= 2:
+        if chain.right_associative:
+            run, rest = slice(len(operands) - count, None), slice(None, len(operands) - count)
+            run_operators, rest_operators = slice(len(operands) - count, None), slice(None, len(operands) - count)
+        else:
+            run, rest = slice(None, count), slice(count, None)
+            run_operators, rest_operators = slice(None, count - 1), slice(count - 1, None)
+
+        folded = _fold_run(chain, operands[run], chain.operators[run_operators], options)
+        if folded is not None:
+            if chain.right_associative:
+                return _rebuild_chain(chain, operands[rest] + (folded, ), chain.operators[rest_operators])
+            return _rebuild_chain(chain, (folded, ) + operands[rest], chain.operators[rest_operators])
+
+    return _rebuild_chain(chain, operands, chain.operators)
+
+
+def _fold_run(chain: OperatorChain, operands: tuple[Node, ...], operators: tuple[BinaryOperator, ...],
+              options: EvaluationOptions) -> Number | None:
+    """
+    Сворачивает участок цепочки из чисел
+    :return: Число или None, если вычисление завершилось ошибкой
+    """
+    run = OperatorChain(operands, operators, chain.source, operands[0].start, operands[-1].end)
+    try:
+        value = run.fold([operand.value for operand in operands], options.compensated_sum,    # type: ignore
+                          options.exact_integers)
+    except UserFriendlyException:
+        return None
+    return Number(value, run.source, run.start, run.end)
+
+
+def _rebuild_chain(chain: OperatorChain, operands: tuple[Node, ...], operators: tuple[BinaryOperator, ...]) -> Node:
+    if operands == chain.operands and operators == chain.operators:
+        return chain
+    return OperatorChain(operands, operators, chain.source, chain.start, chain.end)
+
+
+def _fold_call(call: Call, args: tuple[Node, ...], params: Collection[str], name_table: NameLookup | None) -> Node:
+    target = name_table.get(call.identifier) if name_table is not None and call.identifier not in params else None
+
+    if isinstance(target, CodeBasedFunction) and all(isinstance(arg, Number) for arg in args):
+        try:
+            value = call.invoke(target, [arg.value for arg in args], name_table)    # type: ignore
+        except UserFriendlyException:
+            pass
+        else:
+            return Number(value, call.source, call.start, call.end)
+
+    if args == call.args:
+        return call
+    return Call(call.identifier, args, call.source, call.start, call.end)
@@ -0,0 +1,561 @@
+from typing import Any
+
+from src import profiling
+from src.common import InvalidIdentifierError, NameLookup, remove_extra_brackets
+from src.functions import Function, FunctionSyntaxError
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.operators import BinaryOperator
+
+
+class ExpressionSyntaxError(Exception):
+    pass
+
+
+NUMBER = "number"
+NAME = "name"
+OPERATOR = "operator"
+OPEN_BRACKET = "("
+CLOSE_BRACKET = ")"
+COMMA = ","
+END = "end"
+
+SEPARATORS = frozenset("(),")
+"""
+Символы, которые всегда являются отдельными токенами (помимо операторов)
+"""
+
+
+class Token:
+    """
+    Лексема мат. выражения.
+    value зависит от вида лексемы:
+    число - значение; имя - идентификатор; оператор - BinaryOperator; скобка - индекс парной скобки в списке лексем.
+    """
+
+    __slots__ = ("kind", "value", "start", "end")
+
+    kind: str
+    value: Any
+    start: int
+    end: int
+
+    def __init__(self, kind: str, value: Any, start: int, end: int):
+        self.kind = kind
+        self.value = value
+        self.start = start
+        self.end = end
+
+    def __repr__(self) -> str:
+        return f"Token({self.kind}, {self.value!r})"
+
+
+def parse_number(string: str) -> float | None:
+    """
+    Пытается интерпретировать строку как число (как в Python, включая разделитель '_').
+    :return: Значение числа или None, если строка не является числом
+    """
+    no_leading_zeros = string.lstrip("0_")    # lstrip убирает ведущие нули и _
+    if string and not no_leading_zeros:    # на случай, если значение 0
+        return 0
+    try:
+        return float(no_leading_zeros)
+    except ValueError:
+        return None
+
+
+def tokenize(expression: str) -> list[Token]:
+    """
+    Разбивает выражение на лексемы (см. scan) и сопоставляет парные скобки,
+    поэтому ошибки баланса скобок обнаруживаются здесь.
+    :param expression: Строка с мат. выражением (уже очищенная от пробелов, с преобразованными операторами)
+    :raises ExpressionSyntaxError: Нарушен баланс скобок
+    :return: Список лексем, заканчивающийся лексемой END
+    """
+    tokens = scan(expression)
+    open_brackets: list[Token] = []    # еще не закрытые скобки
+
+    for index, token in enumerate(tokens):
+        kind = token.kind
+        if kind == OPEN_BRACKET:
+            token.value = index
+            open_brackets.append(token)
+        elif kind == CLOSE_BRACKET:
+            if not open_brackets:
+                raise ExpressionSyntaxError("Лишние закрывающие скобки")
+            pair = open_brackets.pop()
+            token.value = pair.value
+            pair.value = index
+
+    if open_brackets:
+        raise ExpressionSyntaxError("Имеются незакрытые скобки")
+
+    tokens.append(Token(END, None, len(expression), len(expression)))
+    return tokens
+
+
+def scan(expression: str, offset: int = 0) -> list[Token]:
+    """
+    Разбивает участок выражения на лексемы за один проход по строке, не сопоставляя скобки.
+    Все символы, не являющиеся операторами, скобками или запятыми, собираются в 'слова',
+    которые затем интерпретируются как число или идентификатор.
+    :param expression: Участок мат. выражения (уже очищенный от пробелов, с преобразованными операторами)
+    :param offset: Позиция участка в выражении: на нее сдвигаются позиции лексем
+    :return: Список лексем без лексемы END; value скобок - None
+    """
+    tokens: list[Token] = []
+    word_start = -1
+    special = SEPARATORS | BinaryOperator.symbols()
+
+    for index, sym in enumerate(expression):
+        if sym not in special:
+            if word_start == -1:
+                word_start = index
+            continue
+
+        if word_start != -1:
+            tokens.append(_make_word(expression, word_start, index, offset))
+            word_start = -1
+
+        position = offset + index
+        if sym == "(":
+            tokens.append(Token(OPEN_BRACKET, None, position, position + 1))
+        elif sym == ")":
+            tokens.append(Token(CLOSE_BRACKET, None, position, position + 1))
+        elif sym == ",":
+            tokens.append(Token(COMMA, None, position, position + 1))
+        else:
+            tokens.append(Token(OPERATOR, BinaryOperator.from_symbol(sym), position, position + 1))
+
+    if word_start != -1:
+        tokens.append(_make_word(expression, word_start, len(expression), offset))
+
+    return tokens
+
+
+def _make_word(expression: str, start: int, end: int, offset: int) -> Token:
+    """
+    Создает лексему числа или имени из участка строки
+    """
+    word = expression[start:end]
+    value = parse_number(word)
+    if value is None:
+        return Token(NAME, word, offset + start, offset + end)
+    return Token(NUMBER, value, offset + start, offset + end)
+
+
+class _Frame:
+    """
+    Незавершенное выражение на стеке парсера: все выражение целиком, содержимое скобок или аргументы вызова функции
+    """
+
+    __slots__ = ("kind", "start", "end", "operands", "operators", "args", "identifier", "wrapped")
+
+    kind: str
+    start: int
+    end: int
+    """
+    Участок исходной строки, занимаемый выражением (вместе со скобками и именем функции)
+    """
+    operands: list[Node]
+    operators: list[BinaryOperator]
+    args: list[Node]
+    """
+    Уже разобранные аргументы (только для вызова функции)
+    """
+    identifier: str
+    wrapped: int
+    """
+    Сколько лишних пар скобок окружает все аргументы вызова, например max((1,2)) (только для вызова функции)
+    """
+
+    def __init__(self, kind: str, start: int, end: int, identifier: str = ""):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.operands = []
+        self.operators = []
+        self.args = []
+        self.identifier = identifier
+        self.wrapped = 0
+
+
+TOP = "top"
+GROUP = "group"
+CALL = "call"
+
+
+class Parser:
+    """
+    Строит синтаксическое дерево из строки с мат. выражением.
+    Строка просматривается один раз. Операторы сворачиваются по приоритетам с помощью стека операторов
+    в плоские цепочки операторов одного приоритета (OperatorChain),
+    а вложенные скобки и вызовы функций хранятся на явном стеке, поэтому ни длинные цепочки операторов,
+    ни глубокая вложенность не приводят к рекурсии. Глубина вложенности ограничена только памятью и max_depth.
+    """
+
+    source: str
+    max_depth: int | None
+    """
+    Максимальная глубина вложенности скобок и вызовов функций. None - без ограничения.
+    """
+
+    __tokens: list[Token]
+    __position: int
+    __frames: list[_Frame]
+
+    def __init__(self, source: str, max_depth: int | None = None):
+        self.source = source
+        self.max_depth = max_depth
+        self.__tokens = []
+        self.__position = 0
+        self.__frames = []
+
+    @property
+    def context(self) -> str:
+        """
+        Участок выражения (ближайшие внешние скобки или вызов функции), в котором находился парсер.
+        После ошибки используется для сообщения пользователю.
+        """
+        if not self.__frames:
+            return self.source
+        frame = self.__frames[-1]
+        return self.source[frame.start:frame.end]
+
+    def parse(self) -> Node:
+        """
+        Разбирает выражение целиком.
+        :raises ExpressionSyntaxError: Синтаксическая ошибка в выражении
+        :raises FunctionSyntaxError: Синтаксическая ошибка в вызове функции
+        :return: Корень синтаксического дерева
+        """
+        if profiling.enabled:
+            started = profiling.clock()
+            self.__tokens = tokenize(self.source)
+            profiling.PROFILER.add(profiling.TOKENIZE, profiling.clock() - started)
+        else:
+            self.__tokens = tokenize(self.source)
+        self.__position = 0
+        self.__frames = [_Frame(TOP, 0, len(self.source))]
+
+        self.__begin_expression()
+        while True:
+            token = self.__next()
+            frame = self.__frames[-1]
+
+            if token.kind == OPERATOR:
+                self.__push_operator(frame, token.value)
+                self.__expect_operand()
+            elif token.kind == CLOSE_BRACKET and frame.wrapped:
+                frame.wrapped -= 1
+            elif token.kind == CLOSE_BRACKET:
+                self.__close_frame(frame)
+            elif token.kind == COMMA and frame.kind == CALL:
+                frame.args.append(self.__finish_expression(frame))
+                if self.__peek().kind in (COMMA, CLOSE_BRACKET):
+                    raise FunctionSyntaxError("Нарушен синтаксис аргументов")
+                self.__begin_expression()
+            elif token.kind == END:
+                # баланс скобок проверен в tokenize, поэтому здесь остается только внешний уровень
+                return self.__finish_expression(frame)
+            else:
+                raise ExpressionSyntaxError(f"Недопустимый символ: '{self.source[token.start]}'")
+
+    def __peek(self) -> Token:
+        return self.__tokens[self.__position]
+
+    def __next(self) -> Token:
+        token = self.__tokens[self.__position]
+        self.__position += 1
+        return token
+
+    def __begin_expression(self) -> None:
+        """
+        Начинает разбор выражения (всего ввода, содержимого скобок или аргумента) и разбирает его первый операнд.
+        """
+        if not self.__take_literal():
+            self.__take_unary()
+            self.__expect_operand()
+
+    def __take_literal(self) -> bool:
+        """
+        Число со знаком или порядком ('-2.', '1e-5'), которое занимает все выражение целиком,
+        разбирается как одно число, хотя состоит из нескольких лексем.
+        :return: True, если выражение оказалось таким числом
+        """
+        start = end = self.__position
+        while self.__tokens[end].kind in (NUMBER, NAME, OPERATOR) and end - start < 4:
+            end += 1
+        if end - start < 2 or self.__tokens[end].kind not in (COMMA, CLOSE_BRACKET, END):
+            return False
+
+        first, last = self.__tokens[start], self.__tokens[end - 1]
+        value = parse_number(self.source[first.start:last.end])
+        if value is None:
+            return False
+
+        self.__position = end
+        self.__push_operand(Number(value, self.source, first.start, last.end))
+        return True
+
+    def __take_unary(self) -> None:
+        """
+        Унарный плюс/минус допустим только в начале выражения и преобразуется в бинарный: -2+5 -> 0-2+5
+        """
+        token = self.__peek()
+        if token.kind == OPERATOR and self.source[token.start] in "+-":
+            self.__position += 1
+            frame = self.__frames[-1]
+            frame.operands.append(Number(0, self.source, token.start, token.start))
+            frame.operators.append(token.value)
+
+    def __expect_operand(self) -> None:
+        """
+        Разбирает операнд: число или переменную.
+        Скобки и вызовы функций не разбираются здесь целиком: они кладутся на стек,
+        после чего цикл переходит к первому операнду внутри них.
+        """
+        while True:
+            token = self.__next()
+
+            if token.kind == OPEN_BRACKET:
+                self.__open_frame(_Frame(GROUP, token.start, self.__tokens[token.value].end))
+                if self.__take_literal():
+                    return
+                self.__take_unary()
+                continue
+
+            if token.kind not in (NUMBER, NAME):
+                raise ExpressionSyntaxError("Недопустимое выражение: ''")
+
+            if self.__peek().kind == OPEN_BRACKET:
+                self.__open_call(token)
+                if self.__take_literal():
+                    return
+                self.__take_unary()
+                continue
+
+            if token.kind == NUMBER:
+                self.__push_operand(Number(token.value, self.source, token.start, token.end))
+            else:
+                self.__push_operand(Name(token.value, self.source, token.start, token.end))
+            return
+
+    def __push_operand(self, operand: Node) -> None:
+        """
+        Добавляет готовый операнд в текущее выражение. После операнда должен идти оператор или конец выражения.
+        """
+        if isinstance(operand, (Name, Call)):
+            self.__validate_operand(operand)
+        if self.__peek().kind in (NUMBER, NAME, OPEN_BRACKET):
+            if isinstance(operand, Call):
+                raise FunctionSyntaxError("Ошибка в синтаксисе вызова функции")
+            raise ExpressionSyntaxError(f"Пропущен оператор после '{operand.text}'")
+
+        self.__frames[-1].operands.append(operand)
+
+    def __open_frame(self, frame: _Frame) -> None:
+        if self.max_depth is not None and len(self.__frames) > self.max_depth:
+            raise ExpressionSyntaxError(f"Превышена максимальная глубина вложенности ({self.max_depth})")
+        self.__frames.append(frame)
+
+    def __open_call(self, name: Token) -> None:
+        """
+        Начинает разбор вызова функции вида 'func(a,b,...)'. Каждый аргумент - отдельное выражение.
+        Сам первый аргумент разбирается вызывающим кодом.
+        """
+        open_bracket = self.__next()
+        close_bracket = self.__tokens[open_bracket.value]
+        frame = _Frame(CALL, name.start, close_bracket.end, self.source[name.start:name.end])
+        self.__open_frame(frame)
+
+        # лишние скобки вокруг всех аргументов не меняют их: max((1,2)) - то же, что max(1,2)
+        close = open_bracket.value
+        while self.__peek().kind == OPEN_BRACKET and self.__peek().value == close - 1:
+            close = self.__next().value
+            frame.wrapped += 1
+
+        if self.__peek().kind in (COMMA, CLOSE_BRACKET):
+            raise FunctionSyntaxError("Нарушен синтаксис аргументов")
+
+    def __close_frame(self, frame: _Frame) -> None:
+        """
+        Завершает выражение в скобках или вызов функции и передает результат во внешнее выражение как операнд
+        """
+        inner = self.__finish_expression(frame)
+        self.__frames.pop()
+
+        if frame.kind == CALL:
+            frame.args.append(inner)
+            operand: Node = Call(frame.identifier, tuple(frame.args), self.source, frame.start, frame.end)
+        else:
+            # скобки включаются в участок исходной строки, чтобы попасть в текст ошибок
+            operand = inner.respan(frame.start, frame.end)
+
+        self.__push_operand(operand)
+
+    def __finish_expression(self, frame: _Frame) -> Node:
+        """
+        Сворачивает все оставшиеся операторы выражения и возвращает его корень. Очищает стеки выражения.
+        """
+        while frame.operators:
+            self.__reduce(frame.operands, frame.operators)
+
+        return frame.operands.pop()
+
+    def __push_operator(self, frame: _Frame, operator: BinaryOperator) -> None:
+        """
+        Добавляет оператор в выражение, предварительно сворачивая цепочки операторов с большим приоритетом.
+        Оператор того же приоритета просто продолжает текущую цепочку.
+        """
+        while frame.operators and frame.operators[-1].precedence > operator.precedence:
+            self.__reduce(frame.operands, frame.operators)
+        frame.operators.append(operator)
+
+    def __reduce(self, operands: list[Node], operators: list[BinaryOperator]) -> None:
+        """
+        Сворачивает верхнюю цепочку операторов одного приоритета и их операнды в узел OperatorChain.
+        Приоритеты на стеке операторов не убывают, поэтому цепочка - это все верхние операторы с равным приоритетом.
+        """
+        precedence = operators[-1].precedence
+        count = 1
+        while count < len(operators) and operators[-count - 1].precedence == precedence:
+            count += 1
+
+        chain_operators = tuple(operators[-count:])
+        chain_operands = tuple(operands[-count - 1:])
+        del operators[-count:]
+        del operands[-count - 1:]
+
+        for operand in chain_operands:
+            self.__validate_operand(operand)
+
+        operands.append(OperatorChain(chain_operands, chain_operators, self.source,
+                                      chain_operands[0].start, chain_operands[-1].end))
+
+    def __validate_operand(self, operand: Node) -> None:
+        """
+        Проверяет, может ли операнд бинарного оператора начинаться и заканчиваться своими символами.
+        :raises ExpressionSyntaxError: Операнд некорректен
+        """
+        if isinstance(operand, OperatorChain) or operand.start == operand.end:
+            return
+
+        # проверка .isalnum() нужна для поддержки функций и переменных
+        # . для поддержки float как в python: .5
+        first, last = self.source[operand.start], self.source[operand.end - 1]
+        if not (first in "(." or first.isalnum()) or not (last == ")" or last.isalnum()):
+            raise ExpressionSyntaxError(f"Недопустимое выражение: '{operand.text}'")
+
+
+DIAGNOSE_LIMIT = 10_000
+"""
+Максимальная длина выражения, для которого ищется исходное место ошибки (см. diagnose).
+Поиск разбивает строку заново на каждом уровне вложенности, поэтому для длинного ввода не выполняется.
+"""
+
+
+def diagnose(expression: str, name_table: NameLookup | None = None) -> tuple[str, Exception] | None:
+    """
+    Находит ошибку в выражении, которое не удалось разобрать, так же, как ее находило вычисление по строкам
+    до появления синтаксического дерева: выражение делится по операторам самого низкого приоритета, части проверяются
+    и обходятся в порядке вычисления, части без операторов - числа, переменные и вызовы функций.
+    Так сообщение об ошибке указывает тот же участок ввода (например, '1*' для 1*-2), что и раньше.
+    Значения не вычисляются, поэтому ошибки вычисления (деление на ноль и т. п.) не учитываются.
+    :param name_table: Таблица имен для проверки идентификаторов. None - идентификаторы не проверяются.
+    :return: (участок выражения, в котором найдена ошибка; ошибка) или None, если ошибка не найдена
+    """
+    pending = [expression]
+    while pending:
+        current = pending.pop()
+        try:
+            parts = _diagnose_part(current, name_table)
+        except (ExpressionSyntaxError, FunctionSyntaxError, InvalidIdentifierError) as e:
+            return current, e
+        pending.extend(reversed(parts))
+    return None
+
+
+def _diagnose_part(expression: str, name_table: NameLookup | None) -> list[str]:
+    """
+    Проверяет один уровень выражения
+    :return: Вложенные выражения (операнды или аргументы) в порядке вычисления
+    """
+    prepared = remove_extra_brackets(expression)
+    if not prepared or parse_number(prepared) is not None:
+        return []
+    if prepared[0] in "+-":
+        prepared = "0" + prepared
+
+    for symbols, right_associative, optional in _precedence_levels():
+        if optional and symbols.isdisjoint(prepared):
+            continue
+        parts = _split(prepared, symbols)
+        if len(parts) > 1:
+            if right_associative:    # операторы применяются справа налево, начиная с двух последних операндов
+                return [parts[-2], parts[-1]] + parts[-3::-1]
+            return parts
+
+    identifier, args = Function.try_parse_function_call(prepared)
+    if identifier is None:
+        identifier = prepared
+
+    if name_table is not None:
+        target = name_table.get(identifier)
+        if target is None:
+            raise InvalidIdentifierError(f"Неизвестный идентификатор: {identifier}")
+        if args is not None and not isinstance(target, Function):
+            raise InvalidIdentifierError(f"'{identifier}' не является функцией")
+        if args is None and not isinstance(target, (float, int)):
+            raise InvalidIdentifierError(f"'{identifier}' не может использоваться как переменная")
+
+    return list(args or ())
+
+
+def _precedence_levels() -> list[tuple[frozenset[str], bool, bool]]:
+    """
+    Символы операторов, сгруппированные по приоритету (от низкого к высокому), правая ассоциативность группы
+    и признак того, что группа проверяется, только если ее операторы есть в выражении.
+    Сравнения появились позже арифметики, поэтому выражения без них делятся так же, как до их появления:
+    начиная с '+' и '-'.
+    """
+    additive = BinaryOperator.from_symbol("+").precedence
+    levels: dict[int, set[str]] = {}
+    for symbol in BinaryOperator.symbols():
+        levels.setdefault(BinaryOperator.from_symbol(symbol).precedence, set()).add(symbol)
+    return [(frozenset(symbols), BinaryOperator.from_symbol(next(iter(symbols))).right_associative,
+             precedence < additive)
+            for precedence, symbols in sorted(levels.items())]
+
+
+def _split(expression: str, symbols: frozenset[str]) -> list[str]:
+    """
+    Делит выражение на части по операторам из symbols вне скобок и проверяет края каждой части
+    :raises ExpressionSyntaxError: Нарушен баланс скобок или часть не может быть операндом
+    """
+    parts = []
+    brackets = 0
+    start = 0
+    for index, sym in enumerate(expression):
+        if sym == "(":
+            brackets += 1
+        elif sym == ")":
+            brackets -= 1
+            if brackets < 0:
+                raise ExpressionSyntaxError("Лишние закрывающие скобки")
+
+        if brackets == 0 and sym in symbols:
+            parts.append(_checked_part(expression[start:index]))
+            start = index + 1
+
+    if brackets != 0:
+        raise ExpressionSyntaxError("Имеются незакрытые скобки")
+
+    parts.append(_checked_part(expression[start:]))
+    return parts
+
+
+def _checked_part(part: str) -> str:
+    # проверка .isalnum() нужна для поддержки функций и переменных; +- в начале - унарные, . - для float вида .5
+    if not part or not (part[0] in "-+()." or part[0].isalnum()) or not (part[-1] in "()" or part[-1].isalnum()):
+        raise ExpressionSyntaxError(f"Недопустимое выражение: '{part}'")
+    return part
@@ -0,0 +1,142 @@
+import json
+import time
+
+
+enabled = False
+"""
+Включен ли сбор статистики. Читается один раз в начале каждого вычисления (разбора, вызова execute),
+поэтому выключенная статистика стоит одну проверку локальной переменной на узел.
+"""
+
+clock = time.perf_counter_ns
+
+PREPARE = "prepare"
+"""
+Calculator.prepare: удаление незначащих символов и преобразование операторов
+"""
+TOKENIZE = "tokenize"
+"""
+Разбиение строки на лексемы и проверка баланса скобок
+"""
+PARSE = "parse"
+"""
+Разбор целиком (включая tokenize): сворачивание операторов в цепочки, скобки, вызовы функций
+"""
+DECLARE = "declare"
+EVALUATE = "evaluate"
+"""
+Вычисление выражения верхнего уровня (включая вложенные вызовы функций)
+"""
+RESOLVE = "resolve"
+"""
+Поиск идентификаторов в таблице имен
+"""
+OPERATORS = "operators"
+"""
+Применение бинарных операторов (calls - количество операторов, время - по цепочкам)
+"""
+USER_CALLS = "user_calls"
+"""
+Вызовы пользовательских функций (время включает вычисление тела)
+"""
+BUILTIN_CALLS = "builtin_calls"
+
+EXPRESSIONS = "expressions"
+"""
+Счетчик созданных объектов Expression
+"""
+SHARED_REUSED = "shared_reused"
+"""
+Счетчик повторяющихся поддеревьев, значение которых взято уже вычисленным (см. evaluator.evaluate)
+"""
+SHARED_SKIPPED = "shared_skipped"
+"""
+Счетчик узлов, которые благодаря этому не пришлось обходить повторно
+"""
+
+
+class PhaseStats:
+    """
+    Количество выполнений этапа и суммарное время
+    """
+
+    __slots__ = ("calls", "total_ns")
+
+    calls: int
+    total_ns: int
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ns = 0
+
+    @property
+    def mean_us(self) -> float:
+        return self.total_ns / self.calls / 1e3 if self.calls else 0.0
+
+
+class Profiler:
+    """
+    Статистика по этапам обработки ввода и счетчики
+    """
+
+    phases: dict[str, PhaseStats]
+    counters: dict[str, int]
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    def add(self, phase: str, elapsed_ns: int, calls: int = 1) -> None:
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.calls += calls
+        stats.total_ns += elapsed_ns
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def reset(self) -> None:
+        self.phases.clear()
+        self.counters.clear()
+
+    def to_dict(self) -> dict:
+        return {
+            "enabled": enabled,
+            "phases": {name: {"calls": stats.calls, "total_ms": stats.total_ns / 1e6, "mean_us": stats.mean_us}
+                       for name, stats in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+
+    def format(self) -> str:
+        """
+        Таблица этапов (по убыванию суммарного времени) и счетчиков для вывода пользователю
+        """
+        if not self.phases and not self.counters:
+            return "Статистика пуста" + ("" if enabled else " (сбор выключен, ':stats on')")
+
+        lines = [f"{'этап':<14} {'вызовов':>10} {'всего, мс':>11} {'среднее, мкс':>13}"]
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].total_ns):
+            lines.append(f"{name:<14} {stats.calls:>10} {stats.total_ns / 1e6:>11.3f} {stats.mean_us:>13.2f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<14} {value:>10}")
+        return "\n".join(lines)
+
+
+PROFILER = Profiler()
+"""
+Статистика процесса (собирается, только пока enabled)
+"""
+
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+
+def disable() -> None:
+    global enabled
+    enabled = False
@@ -0,0 +1,267 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Any, Sequence
+
+from src.calculator import Calculator
+from src.common import UserFriendlyException, Nametable, NameLookup
+from src.name_tables import BUILTINS, LineDependencies
+from src.user_functions import UserDefinedFunction
+
+
+class LineResult:
+    """
+    Результат выполнения одной строки сценария
+    """
+
+    __slots__ = ("value", "error")
+
+    value: float | None
+    """
+    Значение выражения; None для объявления или при ошибке
+    """
+    error: str | None
+    """
+    Текст ошибки; None, если строка выполнена успешно
+    """
+
+    def __init__(self, value: float | None = None, error: str | None = None):
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self) -> str:
+        if self.error is not None:
+            return self.error
+        if self.value is None:    # например, присвоение переменной
+            return "OK"
+        return str(self.value)
+
+
+def execute_script(calculator: Calculator, lines: Sequence[str], workers: int | None = None,
+                   fail_fast: bool = False) -> list[LineResult]:
+    """
+    Выполняет строки сценария так же, как последовательные вызовы calculator.execute, но независимые строки -
+    параллельно в нескольких процессах.
+
+    По идентификаторам, которые строки читают и объявляют (NametableManager.dependencies), строится граф зависимостей:
+    строка зависит от последнего предыдущего объявления каждого читаемого ею идентификатора (с учетом идентификаторов,
+    к которым обращаются тела вызываемых функций), а объявление - еще и от предыдущего объявления того же идентификатора.
+    Строки выполняются уровнями графа: строки одного уровня друг от друга не зависят.
+    Каждая строка получает значения ровно тех версий переменных, которые видела бы при последовательном выполнении,
+    поэтому результат не зависит от количества процессов.
+    В конце объявления переносятся в таблицу имен калькулятора в порядке строк.
+    В режиме формул переобъявление пересчитывает зависимые переменные, которых нет среди идентификаторов строки,
+    поэтому строки выполняются последовательно на самом калькуляторе.
+
+    :param lines: Строки сценария
+    :param workers: Количество процессов. None - по количеству ядер; 1 - без дочерних процессов.
+    :param fail_fast:
+        Остановиться на первой ошибке, как при последовательном выполнении: после ошибки выполняются только
+        еще не выполненные предыдущие строки, а объявления следующих за ней строк, уже выполненные параллельно,
+        в таблицу имен не переносятся
+    :return: Результаты в порядке строк (при fail_fast - до первой ошибки включительно)
+    """
+    if calculator.nt_manager.formula_mode:
+        executed = []
+        for line in lines:
+            executed.append(_execute_line(calculator, line))
+            if fail_fast and not executed[-1].ok:
+                break
+        return executed
+
+    workers = workers or os.cpu_count() or 1
+    prepared = [calculator.prepare(line) for line in lines]
+    manager = calculator.nt_manager
+
+    levels = _schedule(prepared, [manager.dependencies(line) for line in prepared], manager.name_table)
+
+    results: list[LineResult] = [LineResult() for _ in prepared]
+    declared: dict[int, Any] = {}    # номер строки -> объявленное ею значение (только успешные объявления)
+    versions = _Versions(manager.name_table, declared)
+    last = len(prepared) - 1    # последняя строка, которая выполнялась бы последовательно (при fail_fast - первая ошибка)
+
+    executor: Executor | None = ProcessPoolExecutor(workers) if workers > 1 and len(prepared) > 1 else None
+    try:
+        for level in levels:
+            level = [line for line in level if line[0] <= last]
+            tasks = [(prepared[index], versions.bindings(index, reads)) for index, reads, _ in level]
+            for (index, _, writes), (result, value) in zip(level, _run(executor, workers, tasks, calculator)):
+                results[index] = result
+                if result.ok and writes:
+                    declared[index] = value
+                    versions.record(index, writes)
+                elif not result.ok and fail_fast:
+                    last = min(last, index)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    for index in sorted(declared):
+        if index > last:
+            break
+        (identifier, ) = versions.writes_of(index)
+        manager.assign(identifier, declared[index])
+
+    return results[:last + 1]
+
+
+_Task = tuple[str, Nametable]
+"""
+Строка и значения идентификаторов, которые она читает
+"""
+
+_Level = list[tuple[int, frozenset[str], frozenset[str]]]
+"""
+Строки одного уровня графа зависимостей: (номер строки, читаемые идентификаторы, объявляемые идентификаторы)
+"""
+
+
+def _schedule(lines: Sequence[str], dependencies: Sequence[LineDependencies], name_table: NameLookup) -> list[_Level]:
+    """
+    Распределяет строки по уровням графа зависимостей: уровень строки на 1 больше максимального уровня строк,
+    от которых она зависит.
+    """
+    # идентификаторы, к которым обращаются тела функций, на текущий момент сценария
+    function_globals = {name: value.global_names for name, value in name_table.items()
+                        if isinstance(value, UserDefinedFunction)}
+    last_writer: dict[str, int] = {}
+    line_levels: list[int] = []
+    levels: list[_Level] = []
+
+    for index, line_dependencies in enumerate(dependencies):
+        reads = _expand_calls(line_dependencies.reads, function_globals)
+        writes = line_dependencies.writes
+
+        parents = [last_writer[name] for name in reads | writes if name in last_writer]
+        level = max((line_levels[parent] + 1 for parent in parents), default=0)
+        line_levels.append(level)
+        if level == len(levels):
+            levels.append([])
+        levels[level].append((index, reads, writes))
+
+        for name in writes:
+            last_writer[name] = index
+            if line_dependencies.function_globals is not None:
+                function_globals[name] = line_dependencies.function_globals
+            else:
+                function_globals.pop(name, None)
+
+    return levels
+
+
+def _expand_calls(names: frozenset[str], function_globals: dict[str, frozenset[str]]) -> frozenset[str]:
+    """
+    Добавляет к идентификаторам те, к которым (транзитивно) обращаются тела вызываемых функций
+    """
+    expanded = set(names)
+    pending = [name for name in names if name in function_globals]
+    while pending:
+        for name in function_globals[pending.pop()]:
+            if name not in expanded:
+                expanded.add(name)
+                if name in function_globals:
+                    pending.append(name)
+
+    return frozenset(expanded)
+
+
+class _Versions:
+    """
+    Значения идентификаторов на момент каждой строки сценария
+    """
+
+    __initial: NameLookup
+    __declared: dict[int, Any]
+    __writers: dict[str, list[int]]
+    """
+    Идентификатор -> номера строк, успешно объявивших его (по возрастанию)
+    """
+    __writes: dict[int, frozenset[str]]
+
+    def __init__(self, initial: NameLookup, declared: dict[int, Any]):
+        self.__initial = initial
+        self.__declared = declared
+        self.__writers = {}
+        self.__writes = {}
+
+    def record(self, index: int, writes: frozenset[str]) -> None:
+        self.__writes[index] = writes
+        for name in writes:
+            writers = self.__writers.setdefault(name, [])
+            writers.append(index)
+            writers.sort()    # строки одного уровня могут завершиться в любом порядке
+
+    def writes_of(self, index: int) -> frozenset[str]:
+        return self.__writes[index]
+
+    def bindings(self, index: int, reads: frozenset[str]) -> Nametable:
+        """
+        Значения идентификаторов, которые видела бы строка index при последовательном выполнении.
+        Встроенные функции не передаются - они есть в каждом процессе.
+        """
+        bindings: Nametable = {}
+        for name in reads:
+            writer = next((line for line in reversed(self.__writers.get(name, ())) if line < index), None)
+            if writer is not None:
+                bindings[name] = self.__declared[writer]
+            elif name in self.__initial and self.__initial[name] is not BUILTINS.get(name):
+                bindings[name] = self.__initial[name]
+
+        return bindings
+
+
+def _run(executor: Executor | None, workers: int, tasks: list[_Task], calculator: Calculator) -> list[tuple[LineResult, Any]]:
+    """
+    Выполняет независимые строки одного уровня, разбивая их на части по количеству процессов
+    """
+    settings = calculator.settings()
+    if executor is None or len(tasks) <= 1:
+        return _execute_chunk(tasks, settings)
+
+    chunk_size = -(-len(tasks) // workers)
+    chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+    futures = [executor.submit(_execute_chunk, chunk, settings) for chunk in chunks]
+
+    results: list[tuple[LineResult, Any]] = []
+    for chunk, future in zip(chunks, futures):
+        try:
+            results.extend(future.result())
+        except Exception:
+            # например, слишком глубокое дерево функции не удалось передать между процессами
+            results.extend(_execute_chunk(chunk, settings))
+
+    return results
+
+
+def _execute_chunk(tasks: list[_Task], settings: dict[str, Any]) -> list[tuple[LineResult, Any]]:
+    """
+    Выполняется в дочернем процессе: выполняет строки на отдельном калькуляторе
+    :param settings: Параметры калькулятора сценария (Calculator.settings)
+    :return: Для каждой строки - результат и объявленное значение (для объявлений)
+    """
+    calculator = Calculator(**settings)
+    results: list[tuple[LineResult, Any]] = []
+
+    for line, bindings in tasks:
+        calculator.nt_manager.restore(bindings)
+        result = _execute_line(calculator, line)
+
+        declared = None
+        if result.ok and result.value is None:
+            identifier = line.split("=")[0]
+            declared = calculator.nt_manager.name_table[identifier]
+        results.append((result, declared))
+
+    return results
+
+
+def _execute_line(calculator: Calculator, line: str) -> LineResult:
+    try:
+        return LineResult(calculator.execute(line))
+    except UserFriendlyException as e:
+        return LineResult(error=str(e))
+    except Exception as e:
+        return LineResult(error=f"Произошла непредвиденная ошибка: {type(e).__name__}('{str(e)}')")
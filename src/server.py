@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import functools
+import json
+import struct
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable
+
+from src.budgets import Budget
+from src.calculator import Calculator
+from src.main import execute_expression
+
+
+LINE = "line"
+"""
+Построчный протокол: запрос - строка, ответ - строка "+результат" или "-ошибка".
+Переводы строк и обратная косая черта в тексте ответа экранируются (\\n, \\\\).
+"""
+LENGTH = "length"
+"""
+Протокол с длиной: запрос - 4 байта длины (big-endian) и UTF-8 строка, ответ - 4 байта длины и "+результат"/"-ошибка"
+"""
+
+MAX_REQUEST_SIZE = 1 << 20
+"""
+Максимальный размер одного запроса в байтах
+"""
+
+LATENCY_WINDOW = 10_000
+"""
+По скольким последним запросам считаются перцентили задержки
+"""
+
+_LENGTH = struct.Struct(">I")
+
+
+class ServerMetrics:
+    """
+    Счетчики соединений и запросов и задержка обработки последних запросов
+    """
+
+    connections_total: int
+    connections_active: int
+    requests: int
+    errors: int
+    __latencies: deque[float]
+
+    def __init__(self):
+        self.connections_total = 0
+        self.connections_active = 0
+        self.requests = 0
+        self.errors = 0
+        self.__latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.requests += 1
+        self.errors += not ok
+        self.__latencies.append(latency)
+
+    def percentile(self, fraction: float) -> float:
+        """
+        :return: Задержка в секундах, которую не превышает доля fraction последних запросов (0, если запросов не было)
+        """
+        if not self.__latencies:
+            return 0.0
+        ordered = sorted(self.__latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self) -> dict:
+        return {
+            "connections_total": self.connections_total,
+            "connections_active": self.connections_active,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_p50_ms": self.percentile(0.5) * 1e3,
+            "latency_p99_ms": self.percentile(0.99) * 1e3,
+        }
+
+
+class CalculatorServer:
+    """
+    Asyncio сервер калькулятора. У каждого соединения свой Calculator (и своя таблица имен).
+    Запросы соединения выполняются по порядку, поэтому клиент может отправлять их, не дожидаясь ответов.
+    Вычисления выполняются в executor, чтобы долгий ввод одного клиента не останавливал обработку остальных,
+    а бюджет (budget_factory) не дает одному запросу надолго занять поток.
+    Кроме выражений и объявлений доступна команда ":metrics" - метрики сервера в JSON.
+    Команды REPL (см. main.execute_command) клиентам недоступны: они пишут файлы и меняют общую статистику процесса.
+    """
+
+    metrics: ServerMetrics
+    framing: str
+    """
+    LINE или LENGTH
+    """
+    __calculator_factory: Callable[[], Calculator]
+    __budget_factory: Callable[[], Budget] | None
+    __executor: Executor
+
+    def __init__(self, calculator_factory: Callable[[], Calculator] = Calculator, framing: str = LINE,
+                 executor: Executor | None = None, budget_factory: Callable[[], Budget] | None = None):
+        """
+        :param calculator_factory: Создает калькулятор для нового соединения
+        :param executor: Где выполнять вычисления. None - пул потоков.
+        :param budget_factory: Создает бюджет для каждого запроса. None - без ограничений.
+        """
+        if framing not in (LINE, LENGTH):
+            raise ValueError(f"Неизвестный протокол: {framing}")
+
+        self.metrics = ServerMetrics()
+        self.framing = framing
+        self.__calculator_factory = calculator_factory
+        self.__budget_factory = budget_factory
+        self.__executor = executor or ThreadPoolExecutor()
+
+    async def start_tcp(self, host: str | None = None, port: int = 0) -> asyncio.Server:
+        return await asyncio.start_server(self.__handle, host, port, limit=MAX_REQUEST_SIZE)
+
+    async def start_unix(self, path: str) -> asyncio.Server:
+        return await asyncio.start_unix_server(self.__handle, path, limit=MAX_REQUEST_SIZE)
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.metrics.connections_total += 1
+        self.metrics.connections_active += 1
+        calculator = self.__calculator_factory()
+        loop = asyncio.get_running_loop()
+
+        try:
+            while True:
+                try:
+                    request = await self.__read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError, asyncio.IncompleteReadError, UnicodeDecodeError):
+                    writer.write(self.__encode_response("Некорректный запрос", False))
+                    break
+                if request is None:
+                    break
+
+                started = time.perf_counter()
+                command = request.strip()
+                if command == ":metrics":
+                    text, ok = json.dumps(self.metrics.to_dict()), True
+                elif command.startswith(":"):
+                    text, ok = f"Неизвестная команда: {command}", False
+                else:
+                    budget = self.__budget_factory() if self.__budget_factory is not None else None
+                    text, ok = await loop.run_in_executor(self.__executor, execute_expression, calculator, request,
+                                                          budget)
+                self.metrics.record(time.perf_counter() - started, ok)
+
+                writer.write(self.__encode_response(text, ok))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.metrics.connections_active -= 1
+            writer.close()
+
+    async def __read_request(self, reader: asyncio.StreamReader) -> str | None:
+        """
+        :return: Строка запроса; None - клиент закрыл соединение
+        """
+        if self.framing == LENGTH:
+            try:
+                header = await reader.readexactly(_LENGTH.size)
+            except asyncio.IncompleteReadError as e:
+                if not e.partial:
+                    return None
+                raise
+            (size, ) = _LENGTH.unpack(header)
+            if size > MAX_REQUEST_SIZE:
+                raise ValueError("Слишком большой запрос")
+            return (await reader.readexactly(size)).decode("utf-8")
+
+        line = await reader.readline()
+        if not line:
+            return None
+        return line.decode("utf-8").rstrip("\r\n")
+
+    def __encode_response(self, text: str, ok: bool) -> bytes:
+        payload = ("+" if ok else "-") + text
+        if self.framing == LENGTH:
+            encoded = payload.encode("utf-8")
+            return _LENGTH.pack(len(encoded)) + encoded
+        return (payload.replace("\\", "\\\\").replace("\n", "\\n") + "\n").encode("utf-8")
+
+
+async def serve(server: CalculatorServer, host: str | None = None, port: int = 0, path: str | None = None) -> None:
+    """
+    Запускает сервер на TCP порту или Unix сокете (path) и обслуживает клиентов до отмены
+    """
+    if path is not None:
+        listener = await server.start_unix(path)
+    else:
+        listener = await server.start_tcp(host, port)
+
+    async with listener:
+        try:
+            await listener.serve_forever()
+        finally:
+            server.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="python3 -m src.server", description="Сервер калькулятора")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--unix", metavar="PATH", help="Слушать Unix сокет вместо TCP порта")
+    parser.add_argument("--framing", choices=(LINE, LENGTH), default=LINE,
+                        help="Протокол: построчный или с длиной перед каждым сообщением")
+    parser.add_argument("--workers", type=int, help="Количество потоков для вычислений")
+    parser.add_argument("--max-operations", type=int, help="Лимит операций на запрос")
+    parser.add_argument("--max-calls", type=int, help="Лимит вызовов пользовательских функций на запрос")
+    parser.add_argument("--max-seconds", type=float, help="Лимит времени вычисления запроса")
+    args = parser.parse_args(argv)
+
+    budget_factory = None
+    if (args.max_operations, args.max_calls, args.max_seconds) != (None, None, None):
+        budget_factory = functools.partial(Budget, args.max_operations, args.max_calls, args.max_seconds)
+
+    server = CalculatorServer(framing=args.framing, executor=ThreadPoolExecutor(args.workers),
+                              budget_factory=budget_factory)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
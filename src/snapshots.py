@@ -0,0 +1,347 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Any
+
+from src.common import UserFriendlyException, Nametable
+from src.name_tables import NametableManager
+from src.nodes import Node, Number, Name, Call, OperatorChain, child_offsets
+from src.operators import BinaryOperator
+from src.user_functions import UserDefinedFunction
+
+
+MAGIC = b"SCALC\0"
+VERSION = 2
+"""
+Версия 2: целые числа, которые нельзя точно сохранить как double, хранятся строкой (_BIG_INT)
+"""
+_READABLE_VERSIONS = (1, VERSION)
+
+_HEADER = struct.Struct("<6sH8I")
+"""
+Заголовок: сигнатура, версия, количество строк, размер строк в байтах, переменных, функций, аргументов, формул,
+символов операторов, узлов
+"""
+
+_NODE = struct.Struct("<B3xIIId")
+"""
+Узел дерева (в обратном порядке обхода): тип, аргумент, начало и конец участка исходной строки, число.
+Аргумент и число зависят от типа узла:
+- число: вид числа (_FLOAT, _INT или _BIG_INT); значение (для _BIG_INT - номер строки с десятичной записью)
+- переменная: номер строки с идентификатором; 0
+- вызов: номер строки с идентификатором; количество аргументов
+- цепочка операторов: количество операндов; смещение символов операторов
+"""
+
+_NUMBER, _NAME, _CALL, _CHAIN = range(4)
+
+_FLOAT, _INT, _BIG_INT = range(3)
+"""
+Виды чисел (для переменных и узлов-чисел)
+"""
+
+_MAX_EXACT_INT = 2 ** 53
+
+_FUNCTION_FIELDS = 6
+"""
+Поля функции: имя, тело (исходная строка), первый аргумент, количество аргументов, первый узел, количество узлов
+"""
+
+_FORMULA_FIELDS = 4
+"""
+Поля формулы: имя переменной, исходная строка, первый узел, количество узлов
+"""
+
+
+class SnapshotError(UserFriendlyException):
+    """
+    Файл не является снимком таблицы имен или записан несовместимой версией
+    """
+    pass
+
+
+def save(manager: NametableManager, path: str) -> None:
+    """
+    Сохраняет объявленные переменные, функции и формулы в компактный двоичный файл.
+    Переменные хранятся одним массивом чисел (array('d'), большие int - десятичной строкой), функции и формулы -
+    уже разобранными деревьями, поэтому при загрузке ничего не разбирается и не вычисляется заново.
+    Сохраняется только собственный слой таблицы имен: встроенные функции и общая таблица (SharedNames) - нет.
+    Файл записывается во временный и затем атомарно заменяет path.
+    :raises SnapshotError: Значение нельзя сохранить (например, функция, заданная кодом Python)
+    """
+    writer = _Writer()
+
+    var_names, var_kinds, var_values = array("I"), array("B"), array("d")
+    functions, function_args = array("I"), array("I")
+    formulas = array("I")
+
+    base = manager.name_table.base
+    for name, value in manager.name_table.overlay.items():
+        if value is base.get(name):
+            continue
+
+        if isinstance(value, (float, int)):
+            var_names.append(writer.string(name))
+            kind, stored = writer.number(value)
+            var_kinds.append(kind)
+            var_values.append(stored)
+        elif isinstance(value, UserDefinedFunction):
+            first_node, node_count = writer.tree(value.body)
+            functions.extend((writer.string(name), writer.string(value.body.source),
+                              len(function_args), len(value.arg_names), first_node, node_count))
+            function_args.extend(writer.string(arg) for arg in value.arg_names)
+        else:
+            raise SnapshotError(f"Нельзя сохранить '{name}': {type(value).__name__}")
+
+    for name, formula in manager.formulas.items():
+        first_node, node_count = writer.tree(formula)
+        formulas.extend((writer.string(name), writer.string(formula.source), first_node, node_count))
+
+    string_lengths = array("I", (len(encoded) for encoded in writer.strings))
+    string_blob = b"".join(writer.strings)
+
+    sections: list[array | bytes] = [string_lengths, string_blob, var_names, var_kinds, var_values,
+                                     functions, function_args, formulas, bytes(writer.operators), bytes(writer.nodes)]
+    header = _HEADER.pack(MAGIC, VERSION, len(writer.strings), len(string_blob), len(var_names),
+                          len(functions) // _FUNCTION_FIELDS, len(function_args), len(formulas) // _FORMULA_FIELDS,
+                          len(writer.operators), len(writer.nodes) // _NODE.size)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(header)
+        for section in sections:
+            file.write(_to_little_endian(section).tobytes() if isinstance(section, array) else section)
+    os.replace(temporary, path)
+
+
+def load(manager: NametableManager, path: str) -> None:
+    """
+    Заменяет объявления в manager содержимым снимка (см. save). Файл отображается в память (mmap).
+    Функции создаются с настройками запоминания manager.
+    :raises SnapshotError: Файл не является снимком, записан другой версией или поврежден
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size < _HEADER.size:
+            raise SnapshotError("Файл не является снимком таблицы имен")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    with data:
+        magic, version, *counts = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise SnapshotError("Файл не является снимком таблицы имен")
+        if version not in _READABLE_VERSIONS:
+            raise SnapshotError(f"Неподдерживаемая версия снимка: {version} (ожидалась {VERSION})")
+
+        n_strings, n_string_bytes, n_vars, n_functions, n_args, n_formulas, n_operators, n_nodes = counts
+        reader = _Reader(data, _HEADER.size)
+        try:
+            string_lengths = reader.array("I", n_strings)
+            strings = _split_strings(reader.bytes(n_string_bytes), string_lengths)
+
+            var_names = reader.array("I", n_vars)
+            var_kinds = reader.array("B", n_vars)
+            var_values = reader.array("d", n_vars)
+            functions = reader.array("I", n_functions * _FUNCTION_FIELDS)
+            function_args = reader.array("I", n_args)
+            formulas = reader.array("I", n_formulas * _FORMULA_FIELDS)
+            operator_symbols = reader.bytes(n_operators).decode("ascii")
+            nodes = list(_NODE.iter_unpack(reader.bytes(n_nodes * _NODE.size)))
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            raise SnapshotError(f"Снимок поврежден: {e}") from e
+
+    # индексы и количества в поврежденном файле могут указывать за пределы секций
+    try:
+        names: Nametable = {}
+        for name_index, kind, value in zip(var_names, var_kinds, var_values):
+            names[strings[name_index]] = _number(kind, value, strings)
+
+        for offset in range(0, len(functions), _FUNCTION_FIELDS):
+            name, source, first_arg, arg_count, first_node, node_count = functions[offset:offset + _FUNCTION_FIELDS]
+            body = _intern(manager, _build_tree(nodes[first_node:first_node + node_count], strings[source], strings,
+                                                operator_symbols))
+            arg_names = [strings[arg] for arg in function_args[first_arg:first_arg + arg_count]]
+            names[strings[name]] = UserDefinedFunction(body, arg_names, memo_size=manager.memo_size)
+
+        restored_formulas: dict[str, Node] = {}
+        for offset in range(0, len(formulas), _FORMULA_FIELDS):
+            name, source, first_node, node_count = formulas[offset:offset + _FORMULA_FIELDS]
+            restored_formulas[strings[name]] = _intern(manager, _build_tree(nodes[first_node:first_node + node_count],
+                                                                            strings[source], strings, operator_symbols))
+    except (IndexError, KeyError, ValueError, OverflowError) as e:
+        raise SnapshotError(f"Снимок поврежден: {e}") from e
+
+    if not restored_formulas.keys() <= names.keys():
+        raise SnapshotError("Снимок поврежден: формула необъявленной переменной")
+    manager.restore(names, restored_formulas)
+
+
+def _intern(manager: NametableManager, tree: Node) -> Node:
+    return tree if manager.interner is None else manager.interner.intern(tree)
+
+
+class _Writer:
+    """
+    Накапливает общие для всего снимка таблицу строк, символы операторов и узлы деревьев
+    """
+
+    strings: list[bytes]
+    operators: bytearray
+    nodes: bytearray
+    __string_indexes: dict[str, int]
+
+    def __init__(self):
+        self.strings = []
+        self.operators = bytearray()
+        self.nodes = bytearray()
+        self.__string_indexes = {}
+
+    def string(self, value: str) -> int:
+        """
+        :return: Номер строки в таблице строк (одинаковые строки хранятся один раз)
+        """
+        index = self.__string_indexes.get(value)
+        if index is None:
+            index = self.__string_indexes[value] = len(self.strings)
+            self.strings.append(value.encode("utf-8"))
+        return index
+
+    def number(self, value: float) -> tuple[int, float]:
+        """
+        :return: Вид числа и значение для записи как double (для больших int - номер строки с десятичной записью)
+        """
+        if not isinstance(value, int):
+            return _FLOAT, value
+        if -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+            return _INT, value
+        return _BIG_INT, self.string(str(value))
+
+    def tree(self, tree: Node) -> tuple[int, int]:
+        """
+        Записывает узлы дерева в обратном порядке обхода (без рекурсии).
+        Участки потомков записываются относительно исходной строки корня: после интернирования (см. interning.py)
+        потомок может принадлежать другой строке с тем же текстом.
+        :return: Номер первого узла и количество узлов
+        """
+        first_node = len(self.nodes) // _NODE.size
+        pending: list[tuple[Node, bool, int]] = [(tree, False, tree.start)]
+
+        while pending:
+            node, expanded, start = pending.pop()
+            end = start + node.end - node.start
+
+            if isinstance(node, Number):
+                kind, stored = self.number(node.value)
+                self.nodes += _NODE.pack(_NUMBER, kind, start, end, stored)
+            elif isinstance(node, Name):
+                self.nodes += _NODE.pack(_NAME, self.string(node.identifier), start, end, 0)
+            elif isinstance(node, Call):
+                if expanded:
+                    self.nodes += _NODE.pack(_CALL, self.string(node.identifier), start, end, len(node.args))
+                else:
+                    pending.append((node, True, start))
+                    pending.extend((arg, False, start + offset)
+                                   for arg, offset in reversed(list(zip(node.args, child_offsets(node)))))
+            elif isinstance(node, OperatorChain):
+                if expanded:
+                    operators_offset = len(self.operators)
+                    self.operators += "".join(operator.symbol for operator in node.operators).encode("ascii")
+                    self.nodes += _NODE.pack(_CHAIN, len(node.operands), start, end, operators_offset)
+                else:
+                    pending.append((node, True, start))
+                    pending.extend((operand, False, start + offset)
+                                   for operand, offset in reversed(list(zip(node.operands, child_offsets(node)))))
+            else:
+                raise SnapshotError(f"Неизвестный тип узла: {type(node).__name__}")
+
+        return first_node, len(self.nodes) // _NODE.size - first_node
+
+
+class _Reader:
+    """
+    Последовательно читает секции снимка из отображенного в память файла
+    """
+
+    __data: Any
+    __offset: int
+
+    def __init__(self, data: Any, offset: int):
+        self.__data = data
+        self.__offset = offset
+
+    def bytes(self, size: int) -> bytes:
+        end = self.__offset + size
+        if end > len(self.__data):
+            raise ValueError("неожиданный конец файла")
+        chunk = self.__data[self.__offset:end]
+        self.__offset = end
+        return chunk
+
+    def array(self, typecode: str, count: int) -> array:
+        result = array(typecode)
+        result.frombytes(self.bytes(count * result.itemsize))
+        return _to_little_endian(result)    # перестановка байтов симметрична
+
+
+def _to_little_endian(values: array) -> array:
+    """
+    Числа в снимке хранятся в порядке little-endian независимо от платформы
+    """
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _split_strings(blob: bytes, lengths: array) -> list[str]:
+    strings = []
+    offset = 0
+    for length in lengths:
+        strings.append(blob[offset:offset + length].decode("utf-8"))
+        offset += length
+    return strings
+
+
+def _number(kind: int, value: float, strings: list[str]) -> float:
+    if kind == _BIG_INT:
+        return int(strings[int(value)])
+    return int(value) if kind == _INT else value
+
+
+def _build_tree(records: list[tuple], source: str, strings: list[str], operator_symbols: str) -> Node:
+    """
+    Восстанавливает дерево из узлов в обратном порядке обхода (без рекурсии)
+    """
+    stack: list[Node] = []
+
+    for kind, argument, start, end, number in records:
+        if kind == _NUMBER:
+            stack.append(Number(_number(argument, number, strings), source, start, end))
+        elif kind == _NAME:
+            stack.append(Name(strings[argument], source, start, end))
+        elif kind == _CALL:
+            if not 0 <= number <= len(stack):
+                raise SnapshotError("Снимок поврежден: неверная структура дерева")
+            first_arg = len(stack) - int(number)
+            args = tuple(stack[first_arg:])
+            del stack[first_arg:]
+            stack.append(Call(strings[argument], args, source, start, end))
+        elif kind == _CHAIN:
+            if not 2 <= argument <= len(stack):
+                raise SnapshotError("Снимок поврежден: неверная структура дерева")
+            first_operand = len(stack) - argument
+            operands = tuple(stack[first_operand:])
+            del stack[first_operand:]
+            offset = int(number)
+            symbols = operator_symbols[offset:offset + argument - 1]
+            if len(symbols) != argument - 1:
+                raise SnapshotError("Снимок поврежден: неверная структура дерева")
+            operators = tuple(BinaryOperator.from_symbol(symbol) for symbol in symbols)
+            stack.append(OperatorChain(operands, operators, source, start, end))
+        else:
+            raise SnapshotError(f"Снимок поврежден: неизвестный тип узла {kind}")
+
+    if len(stack) != 1:
+        raise SnapshotError("Снимок поврежден: неверная структура дерева")
+    return stack[0]
@@ -0,0 +1,826 @@
+import codecs
+import math
+import mmap
+from collections import deque
+from typing import Iterator
+
+from src import budgets
+from src.common import UserFriendlyException, NameLookup
+from src.evaluator import EvaluationOptions, DEFAULT_OPTIONS
+from src.functions import Function, CodeBasedFunction, ConditionalFunction, FunctionSyntaxError
+from src.nodes import Name, Call
+from src.operators import BinaryOperator, OperationError, SPELLINGS, as_integer, translate_spellings
+from src.parser import (ExpressionSyntaxError, Token, SEPARATORS, NUMBER, NAME, OPERATOR, OPEN_BRACKET, CLOSE_BRACKET,
+                        COMMA, END, TOP, GROUP, CALL, parse_number, scan)
+
+
+_CHUNK = 1 << 16
+"""
+Сколько байт буфера нормализуется и разбивается на лексемы за раз
+"""
+
+_SPECIAL = SEPARATORS | BinaryOperator.symbols()
+
+_SPELLING_CHARS = frozenset("".join(SPELLINGS))
+
+_ADD = BinaryOperator.from_symbol("+")
+
+_LITERAL_TOKENS = 4
+"""
+Из скольких лексем может состоять число со знаком и порядком: '-', '1e', '-', '5' (см. Parser.__take_literal)
+"""
+
+_THEN = "then"
+_ELSE = "else"
+"""
+Выбранная ветка вызова if (см. _Frame.branch)
+"""
+
+_FAILED = math.inf
+"""
+Глубина пропуска (_Evaluator.skip) после ошибки вычисления: остаток выражения только проверяется
+"""
+
+
+def _apply(operator: BinaryOperator, left: float, right: float, position: int, exact: bool) -> float:
+    try:
+        return operator.exact(left, right) if exact else operator(left, right)
+    except OperationError as e:
+        raise UserFriendlyException(f"Ошибка вычисления выражения (позиция {position})\n{str(e)}") from e
+
+
+class _Chain:
+    """
+    Незавершенная цепочка операторов одного приоритета.
+    Левоассоциативные операторы применяются сразу, как только прочитан следующий операнд,
+    поэтому цепочка любой длины занимает постоянную память. Порядок применения тот же, что у OperatorChain.fold.
+    """
+
+    __slots__ = ("precedence", "value", "operator", "position", "exact")
+
+    precedence: int
+    value: float
+    """
+    Результат операторов, уже примененных к прочитанным операндам
+    """
+    operator: BinaryOperator
+    """
+    Последний прочитанный оператор, ожидающий правого операнда
+    """
+    position: int
+    """
+    Позиция последнего оператора в файле (для текста ошибок)
+    """
+    exact: bool
+
+    def __init__(self, first: float, operator: BinaryOperator, position: int, exact: bool):
+        self.precedence = operator.precedence
+        self.value = first
+        self.operator = operator
+        self.position = position
+        self.exact = exact
+
+    def add(self, operand: float, operator: BinaryOperator, position: int) -> None:
+        """
+        Продолжает цепочку: operand - правый операнд предыдущего оператора, operator - следующий оператор
+        """
+        self.value = _apply(self.operator, self.value, operand, self.position, self.exact)
+        self.operator = operator
+        self.position = position
+
+    def finish(self, operand: float) -> float:
+        """
+        Завершает цепочку последним операндом
+        :return: Значение цепочки
+        """
+        return _apply(self.operator, self.value, operand, self.position, self.exact)
+
+
+class _PowerChain(_Chain):
+    """
+    Цепочка правоассоциативных операторов (**): вычисляется справа налево, поэтому операнды копятся до конца цепочки
+    """
+
+    __slots__ = ("operands", "operators", "positions")
+
+    operands: list[float]
+    operators: list[BinaryOperator]
+    positions: list[int]
+
+    def __init__(self, first: float, operator: BinaryOperator, position: int, exact: bool):
+        super().__init__(first, operator, position, exact)
+        self.operands = [first]
+        self.operators = [operator]
+        self.positions = [position]
+
+    def add(self, operand: float, operator: BinaryOperator, position: int) -> None:
+        self.operands.append(operand)
+        self.operators.append(operator)
+        self.positions.append(position)
+
+    def finish(self, operand: float) -> float:
+        result = operand
+        for index in range(len(self.operators) - 1, -1, -1):
+            result = _apply(self.operators[index], self.operands[index], result, self.positions[index], self.exact)
+        return result
+
+
+class _SumChain(_Chain):
+    """
+    Цепочка сложений/вычитаний при EvaluationOptions.compensated_sum.
+    Точная сумма хранится как несколько частичных сумм без общих разрядов (алгоритм Шевчука, как в math.fsum),
+    их количество не зависит от длины цепочки. Одновременно считаются обычный результат с округлением после каждого
+    оператора (на случай бесконечностей и переполнения) и, в режиме целых чисел, точная сумма int - как в OperatorChain.fold.
+    """
+
+    __slots__ = ("partials", "finite", "integer", "regular_error")
+
+    partials: list[float]
+    finite: bool
+    """
+    False, если слагаемое или частичная сумма не конечны (math.fsum в этом случае не используется)
+    """
+    integer: float | None
+    """
+    Точная сумма, пока все операнды целые (только при exact_integers), иначе None
+    """
+    regular_error: UserFriendlyException | None
+    """
+    Ошибка обычного вычисления. Возникает, только если обычный результат действительно понадобится.
+    """
+
+    def __init__(self, first: float, operator: BinaryOperator, position: int, exact: bool):
+        super().__init__(first, operator, position, False)
+        self.partials = []
+        self.finite = True
+        self.integer = first if exact and as_integer(first) is not None else None
+        self.regular_error = None
+        self.__add_term(first)
+
+    def add(self, operand: float, operator: BinaryOperator, position: int) -> None:
+        self.__feed(operand)
+        self.operator = operator
+        self.position = position
+
+    def finish(self, operand: float) -> float:
+        self.__feed(operand)
+        if self.integer is not None:
+            return self.integer
+
+        if self.finite:
+            try:
+                return round(math.fsum(self.partials), 2)
+            except (OverflowError, ValueError):
+                pass
+
+        if self.regular_error is not None:
+            raise self.regular_error
+        return self.value
+
+    def __feed(self, operand: float) -> None:
+        operator = self.operator
+        if self.integer is not None:
+            self.integer = operator.exact(self.integer, operand) if as_integer(operand) is not None else None
+
+        if self.regular_error is None:
+            try:
+                self.value = _apply(operator, self.value, operand, self.position, False)
+            except UserFriendlyException as e:
+                self.regular_error = e
+
+        self.__add_term(operand if operator is _ADD else -operand)
+
+    def __add_term(self, term: float) -> None:
+        if not self.finite:
+            return
+        try:
+            x = float(term)
+        except OverflowError:
+            self.finite = False
+            return
+
+        partials = self.partials
+        count = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            high = x + y
+            low = y - (high - x)
+            if low:
+                partials[count] = low
+                count += 1
+            x = high
+        del partials[count:]
+        partials.append(x)
+        self.finite = math.isfinite(x)
+
+
+class _Frame:
+    """
+    Незавершенное выражение: весь файл, содержимое скобок или аргумент вызова функции
+    """
+
+    __slots__ = ("kind", "chains", "operand", "call", "target", "args", "count", "branch")
+
+    kind: str
+    chains: list[_Chain]
+    """
+    Незавершенные цепочки операторов. Приоритеты строго возрастают к вершине, поэтому цепочек не больше,
+    чем уровней приоритета.
+    """
+    operand: float
+    """
+    Последний вычисленный операнд
+    """
+    call: Call | None
+    """
+    Узел вызова без аргументов (только для текста ошибок)
+    """
+    target: Function | None
+    args: list[float]
+    """
+    Уже вычисленные аргументы вызова
+    """
+    count: int
+    """
+    Количество начатых аргументов вызова
+    """
+    branch: str | None
+    """
+    Выбранная ветка вызова if: _THEN, _ELSE или None, пока условие не вычислено
+    """
+
+    def __init__(self, kind: str, call: Call | None = None, target: Function | None = None):
+        self.kind = kind
+        self.chains = []
+        self.operand = 0
+        self.call = call
+        self.target = target
+        self.args = []
+        self.count = 1
+        self.branch = None
+
+    def push_operator(self, operator: BinaryOperator, position: int, options: EvaluationOptions) -> None:
+        """
+        Добавляет оператор после операнда, предварительно завершая цепочки операторов с большим приоритетом
+        """
+        value = self.operand
+        chains = self.chains
+        while chains and chains[-1].precedence > operator.precedence:
+            value = chains.pop().finish(value)
+
+        if chains and chains[-1].precedence == operator.precedence:
+            chains[-1].add(value, operator, position)
+        elif operator.right_associative:
+            chains.append(_PowerChain(value, operator, position, options.exact_integers))
+        elif options.compensated_sum and operator.precedence == _ADD.precedence:
+            chains.append(_SumChain(value, operator, position, options.exact_integers))
+        else:
+            chains.append(_Chain(value, operator, position, options.exact_integers))
+
+    def finish(self) -> float:
+        """
+        Завершает все цепочки выражения
+        :return: Значение выражения
+        """
+        value = self.operand
+        chains = self.chains
+        while chains:
+            value = chains.pop().finish(value)
+        return value
+
+
+def _fragments(buffer: bytes | mmap.mmap) -> Iterator[str]:
+    """
+    Нормализует буфер по частям, как Calculator.prepare: убирает пробельные символы (в том числе переводы строк)
+    и заменяет многосимвольные операторы (SPELLINGS). Часть заканчивается там, где ее не может продолжить следующая:
+    не внутри 'слова' и не внутри последовательности символов, из которых состоят многосимвольные операторы.
+    :return: Части нормализованного выражения по порядку
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    carry = ""
+    for start in range(0, len(buffer), _CHUNK):
+        text = carry + "".join(decoder.decode(buffer[start:start + _CHUNK]).split())
+        cut = len(text) - 1
+        while cut > 0 and not _can_cut(text[cut - 1], text[cut]):
+            cut -= 1
+        yield translate_spellings(text[:cut])
+        carry = text[cut:]
+
+    yield translate_spellings(carry + "".join(decoder.decode(b"", final=True).split()))
+
+
+def _can_cut(left: str, right: str) -> bool:
+    if left in _SPELLING_CHARS and right in _SPELLING_CHARS:
+        return False
+    return left in _SPECIAL or right in _SPECIAL
+
+
+def _tokens(buffer: bytes | mmap.mmap) -> Iterator[tuple[Token, str]]:
+    """
+    Лексемы нормализованного выражения (см. _fragments) вместе с их текстом. Позиции лексем отсчитываются
+    в нормализованном выражении. Последняя лексема - END.
+    :raises ExpressionSyntaxError: В выражении есть объявление
+    """
+    offset = 0
+    for fragment in _fragments(buffer):
+        for token in scan(fragment, offset):
+            text = fragment[token.start - offset:token.end - offset]
+            if token.kind == NAME and "=" in text:
+                raise ExpressionSyntaxError("Объявления в файле с выражением не поддерживаются")
+            yield token, text
+        offset += len(fragment)
+
+    yield Token(END, None, offset, offset), ""
+
+
+class _Handler:
+    """
+    Получатель частей выражения, которые распознает _Grammar. Сам ничего не делает: так выражение только проверяется.
+    """
+
+    def number(self, value: float) -> None:
+        pass
+
+    def name(self, identifier: str) -> None:
+        pass
+
+    def open_group(self) -> None:
+        pass
+
+    def open_call(self, identifier: str) -> None:
+        pass
+
+    def operator(self, operator: BinaryOperator, position: int) -> None:
+        pass
+
+    def comma(self) -> None:
+        """
+        Аргумент вызова закончился, начинается следующий
+        """
+
+    def close(self) -> None:
+        """
+        Закрывающая скобка группы или вызова
+        """
+
+    def unwrap(self, count: int) -> None:
+        """
+        count последних открытых групп оказались лишними скобками вокруг всех аргументов вызова: max((1,2))
+        """
+
+
+class _Level:
+    """
+    Незавершенное выражение на стеке _Grammar
+    """
+
+    __slots__ = ("kind", "chained", "first", "may_wrap", "wrapped")
+
+    kind: str
+    chained: bool
+    """
+    В выражении уже есть оператор: его операнды проверяются (см. Parser.__validate_operand)
+    """
+    first: str | None
+    """
+    Текст первого операнда-числа, который проверяется, если за ним появится оператор
+    """
+    may_wrap: bool
+    """
+    Группа открыта первой лексемой аргументов вызова (или такой же группы)
+    и может оказаться лишними скобками вокруг всех аргументов
+    """
+    wrapped: int
+    """
+    Сколько лишних пар скобок окружает все аргументы вызова (см. Parser._Frame.wrapped)
+    """
+
+    def __init__(self, kind: str, may_wrap: bool = False):
+        self.kind = kind
+        self.chained = False
+        self.first = None
+        self.may_wrap = may_wrap
+        self.wrapped = 0
+
+
+class _Grammar:
+    """
+    Проверяет выражение по потоку лексем по тем же правилам, что и Parser, не строя дерева,
+    и сообщает о каждой распознанной части обработчику (_Handler).
+    Parser видит все лексемы сразу, поэтому лишние скобки вокруг аргументов вызова узнает по парной скобке.
+    Здесь такие скобки сначала разбираются как группа и распознаются по запятой внутри нее.
+    """
+
+    position: int
+    """
+    Позиция последней прочитанной лексемы в нормализованном выражении (для текста ошибок)
+    """
+    max_depth: int | None
+
+    __tokens: Iterator[tuple[Token, str]]
+    __ahead: deque[tuple[Token, str]]
+    __handler: _Handler
+    __levels: list[_Level]
+    __wrap_candidate: bool
+    """
+    Следующая открывающая скобка - первая лексема аргументов вызова или группы, которая может оказаться лишними скобками
+    """
+    __close_next: bool
+    """
+    Закрыта лишняя скобка вокруг аргументов: следующая лексема должна быть закрывающей скобкой
+    """
+
+    def __init__(self, tokens: Iterator[tuple[Token, str]], handler: _Handler, max_depth: int | None = None):
+        self.position = 0
+        self.max_depth = max_depth
+        self.__tokens = tokens
+        self.__ahead = deque()
+        self.__handler = handler
+        self.__levels = [_Level(TOP)]
+        self.__wrap_candidate = False
+        self.__close_next = False
+
+    def parse(self) -> None:
+        """
+        Читает выражение до конца
+        :raises UserFriendlyException: Выражение пустое
+        :raises ExpressionSyntaxError: Синтаксическая ошибка в выражении
+        :raises FunctionSyntaxError: Синтаксическая ошибка в вызове функции
+        """
+        if self.__peek(1)[0][0].kind == END:
+            raise UserFriendlyException("Пустой ввод")
+
+        handler = self.__handler
+        self.__begin_expression()
+        while True:
+            token, text = self.__next()
+            level = self.__levels[-1]
+
+            if self.__close_next and token.kind != CLOSE_BRACKET:
+                raise ExpressionSyntaxError("Недопустимый символ: ','")
+            self.__close_next = False
+
+            if token.kind == OPERATOR:
+                self.__push_operator(level, token.value)
+                self.__expect_operand()
+            elif token.kind == CLOSE_BRACKET and level.wrapped:
+                level.wrapped -= 1
+                self.__close_next = True
+            elif token.kind == CLOSE_BRACKET:
+                if level.kind == TOP:
+                    raise ExpressionSyntaxError("Лишние закрывающие скобки")
+                self.__close_level()
+            elif token.kind == COMMA and (level.kind == CALL or level.may_wrap):
+                if level.kind != CALL:
+                    level = self.__unwrap()
+                handler.comma()
+                level.chained = False
+                level.first = None
+                if self.__peek_kind() in (COMMA, CLOSE_BRACKET):
+                    raise FunctionSyntaxError("Нарушен синтаксис аргументов")
+                self.__begin_expression()
+            elif token.kind == END:
+                if len(self.__levels) > 1:
+                    raise ExpressionSyntaxError("Имеются незакрытые скобки")
+                return
+            else:
+                raise ExpressionSyntaxError(f"Недопустимый символ: '{text}'")
+
+    def __next(self) -> tuple[Token, str]:
+        item = self.__ahead.popleft() if self.__ahead else next(self.__tokens)
+        self.position = item[0].start
+        self.__wrap_candidate = False
+        return item
+
+    def __peek(self, count: int) -> list[tuple[Token, str]]:
+        """
+        :return: До count следующих лексем (меньше, только если раньше встретится END)
+        """
+        ahead = self.__ahead
+        while len(ahead) < count and not (ahead and ahead[-1][0].kind == END):
+            ahead.append(next(self.__tokens))
+        return list(ahead)[:count]
+
+    def __peek_kind(self) -> str:
+        if not self.__ahead:
+            self.__ahead.append(next(self.__tokens))
+        return self.__ahead[0][0].kind
+
+    def __begin_expression(self) -> None:
+        if not self.__take_literal():
+            self.__take_unary()
+            self.__expect_operand()
+
+    def __take_literal(self) -> bool:
+        """
+        Число со знаком или порядком ('-2.', '1e-5'), которое занимает все выражение целиком (см. Parser.__take_literal)
+        """
+        candidate = self.__peek(_LITERAL_TOKENS + 1)
+        count = 0
+        while count < _LITERAL_TOKENS and candidate[count][0].kind in (NUMBER, NAME, OPERATOR):
+            count += 1
+        if count < 2 or candidate[count][0].kind not in (COMMA, CLOSE_BRACKET, END):
+            return False
+
+        value = parse_number("".join(text for _, text in candidate[:count]))
+        if value is None:
+            return False
+
+        for _ in range(count):
+            self.__next()
+        self.__handler.number(value)
+        self.__levels[-1].first = None
+        return True
+
+    def __take_unary(self) -> None:
+        """
+        Унарный плюс/минус в начале выражения преобразуется в бинарный: -2+5 -> 0-2+5
+        """
+        token, text = self.__peek(1)[0]
+        if token.kind == OPERATOR and text in "+-":
+            self.__next()
+            self.__handler.number(0)
+            self.__handler.operator(token.value, token.start)
+            self.__levels[-1].chained = True
+
+    def __expect_operand(self) -> None:
+        """
+        Разбирает операнд. Как и в Parser, скобки и вызовы функций только открываются, после чего цикл переходит
+        к первому операнду внутри них.
+        """
+        handler = self.__handler
+        while True:
+            may_wrap = self.__wrap_candidate
+            token, text = self.__next()
+
+            if token.kind == OPEN_BRACKET:
+                self.__open_level(_Level(GROUP, may_wrap))
+                handler.open_group()
+                self.__wrap_candidate = may_wrap
+                if self.__take_literal():
+                    return
+                self.__take_unary()
+                continue
+
+            if token.kind not in (NUMBER, NAME):
+                raise ExpressionSyntaxError("Недопустимое выражение: ''")
+
+            if self.__peek_kind() == OPEN_BRACKET:
+                # вызов функции - всегда допустимый операнд, если имя начинается допустимым символом
+                self.__validate(text + "()")
+                self.__next()
+                self.__open_level(_Level(CALL))
+                handler.open_call(token.value if token.kind == NAME else text)
+                if self.__peek_kind() in (COMMA, CLOSE_BRACKET):
+                    raise FunctionSyntaxError("Нарушен синтаксис аргументов")
+                self.__wrap_candidate = True
+                if self.__take_literal():
+                    return
+                self.__take_unary()
+                continue
+
+            level = self.__levels[-1]
+            if token.kind == NAME or level.chained:
+                self.__validate(text)
+            else:
+                level.first = text
+            if token.kind == NUMBER:
+                handler.number(token.value)
+            else:
+                handler.name(token.value)
+            if self.__peek_kind() in (NUMBER, NAME, OPEN_BRACKET):
+                raise ExpressionSyntaxError(f"Пропущен оператор после '{text}'")
+            return
+
+    def __open_level(self, level: _Level) -> None:
+        if self.max_depth is not None and len(self.__levels) > self.max_depth:
+            raise ExpressionSyntaxError(f"Превышена максимальная глубина вложенности ({self.max_depth})")
+        self.__levels.append(level)
+
+    def __close_level(self) -> None:
+        """
+        Завершает группу или вызов: их значение - операнд внешнего выражения
+        """
+        closed = self.__levels.pop()
+        self.__levels[-1].first = None
+        self.__handler.close()
+        if self.__peek_kind() in (NUMBER, NAME, OPEN_BRACKET):
+            if closed.kind == CALL:
+                raise FunctionSyntaxError("Ошибка в синтаксисе вызова функции")
+            raise ExpressionSyntaxError("Пропущен оператор после ')'")
+
+    def __unwrap(self) -> _Level:
+        """
+        Запятая внутри групп, открытых первыми лексемами аргументов вызова: эти группы - лишние скобки вокруг аргументов
+        :return: Уровень вызова
+        """
+        count = 0
+        while self.__levels[-1].may_wrap:
+            self.__levels.pop()
+            count += 1
+        call = self.__levels[-1]
+        call.wrapped += count
+        self.__handler.unwrap(count)
+        return call
+
+    def __push_operator(self, level: _Level, operator: BinaryOperator) -> None:
+        if not level.chained:
+            if level.first is not None:
+                self.__validate(level.first)
+                level.first = None
+            level.chained = True
+        self.__handler.operator(operator, self.position)
+
+    @staticmethod
+    def __validate(text: str) -> None:
+        """
+        Проверяет, может ли операнд бинарного оператора начинаться и заканчиваться своими символами
+        (см. Parser.__validate_operand)
+        """
+        first, last = text[0], text[-1]
+        if not (first in "(." or first.isalnum()) or not (last == ")" or last.isalnum()):
+            raise ExpressionSyntaxError(f"Недопустимое выражение: '{text}'")
+
+
+class _Evaluator(_Handler):
+    """
+    Вычисляет выражение по мере его распознавания (_Grammar): операторы применяются, как только прочитан следующий
+    операнд. Первая ошибка вычисления запоминается, а остаток выражения только проверяется, чтобы синтаксическая
+    ошибка в нем, как при обычном вычислении, была сообщена раньше ошибки вычисления.
+    """
+
+    frames: list[_Frame]
+    skip: float | None
+    """
+    Глубина скобок в пропускаемых аргументах if; None - аргументы не пропускаются; _FAILED - после ошибки
+    """
+    error: UserFriendlyException | None
+    """
+    Первая ошибка вычисления
+    """
+
+    __name_table: NameLookup
+    __options: EvaluationOptions
+    __budget: budgets.Budget | None
+
+    def __init__(self, name_table: NameLookup, options: EvaluationOptions):
+        self.frames = [_Frame(TOP)]
+        self.skip = None
+        self.error = None
+        self.__name_table = name_table
+        self.__options = options
+        self.__budget = budgets.current()
+
+    def result(self) -> float:
+        """
+        :raises UserFriendlyException: Первая ошибка вычисления
+        """
+        if self.error is not None:
+            raise self.error
+        return self.frames[0].finish()
+
+    def number(self, value: float) -> None:
+        if self.skip is None:
+            self.frames[-1].operand = value
+
+    def name(self, identifier: str) -> None:
+        if self.skip is None:
+            try:
+                self.frames[-1].operand = Name(identifier, identifier, 0, len(identifier)).resolve(self.__name_table)
+            except UserFriendlyException as e:
+                self.__fail(e)
+
+    def open_group(self) -> None:
+        if self.skip is not None:
+            self.skip += 1
+        else:
+            self.frames.append(_Frame(GROUP))
+
+    def open_call(self, identifier: str) -> None:
+        if self.skip is not None:
+            self.skip += 1
+            return
+        call = Call(identifier, (), f"{identifier}(...)", 0, len(identifier) + 5)
+        try:
+            self.frames.append(_Frame(CALL, call, call.resolve(self.__name_table)))
+        except UserFriendlyException as e:
+            self.__fail(e)
+
+    def operator(self, operator: BinaryOperator, position: int) -> None:
+        if self.skip is not None:
+            return
+        if self.__budget is not None:
+            self.__budget.charge(operations=1)
+        try:
+            self.frames[-1].push_operator(operator, position, self.__options)
+        except UserFriendlyException as e:
+            self.__fail(e)
+
+    def comma(self) -> None:
+        frame = self.frames[-1]
+        if self.skip is not None:
+            if not self.skip:
+                frame.count += 1
+                if frame.branch is _ELSE and frame.count == 3:
+                    self.skip = None
+            return
+
+        try:
+            value = frame.finish()
+        except UserFriendlyException as e:
+            self.__fail(e)
+            return
+        frame.args.append(value)
+        frame.count += 1
+        if isinstance(frame.target, ConditionalFunction):
+            if frame.branch is None and frame.count == 2:
+                if self.__budget is not None:
+                    self.__budget.charge(operations=1)
+                frame.branch = _THEN if value else _ELSE
+                if frame.branch is _ELSE:
+                    self.skip = 0
+            elif frame.branch is not None:
+                self.skip = 0    # остальные аргументы не вычисляются: после ветки или лишние
+
+    def close(self) -> None:
+        frames = self.frames
+        frame = frames[-1]
+        try:
+            if self.skip is not None:
+                if self.skip:
+                    self.skip -= 1
+                    return
+                self.skip = None
+                if frame.branch is not _THEN or frame.count != 3:
+                    frame.call.invoke(frame.target, [0.0] * frame.count, self.__name_table)    # type: ignore
+                value = frame.args[1]
+            else:
+                value = frame.finish()
+                if frame.kind == CALL and frame.branch is not _ELSE:
+                    frame.args.append(value)
+                    if self.__budget is not None:
+                        if isinstance(frame.target, CodeBasedFunction):
+                            self.__budget.charge(operations=1)
+                        else:
+                            self.__budget.charge(calls=1)
+                    value = frame.call.invoke(frame.target, frame.args, self.__name_table,    # type: ignore
+                                              options=self.__options)
+        except UserFriendlyException as e:
+            self.__fail(e)
+            return
+
+        frames.pop()
+        frames[-1].operand = value
+
+    def unwrap(self, count: int) -> None:
+        if self.skip is not None:
+            self.skip -= count
+            return
+        try:
+            value = self.frames[-1].finish()
+        except UserFriendlyException as e:
+            self.__fail(e)
+            return
+        del self.frames[-count:]
+        self.frames[-1].operand = value
+
+    def __fail(self, error: UserFriendlyException) -> None:
+        if isinstance(error, budgets.BudgetExceededError):
+            raise error
+        self.error = error
+        self.skip = _FAILED
+
+
+def evaluate_buffer(buffer: bytes | mmap.mmap, name_table: NameLookup, options: EvaluationOptions = DEFAULT_OPTIONS,
+                    max_depth: int | None = None) -> float:
+    """
+    Вычисляет выражение, не строя ни нормализованную строку целиком, ни список всех лексем, ни синтаксическое дерево:
+    буфер (bytes, mmap) нормализуется и разбивается на лексемы теми же функциями, что и обычный ввод
+    (Calculator.prepare, parser.scan), но по частям, а операторы применяются по мере чтения операндов.
+    Дополнительная память зависит только от глубины вложенности скобок, количества аргументов вызовов
+    и длины цепочек '**', но не от длины выражения.
+    Пробельные символы (в том числе переводы строк) убираются, как пробелы в Calculator.prepare, поэтому '1 2' - это 12.
+    Результат и ошибки те же, что у Calculator.execute: после ошибки вычисления выражение дочитывается до конца,
+    и синтаксическая ошибка, если она есть, сообщается вместо ошибки вычисления. Вместо текста участка выражения
+    сообщения содержат позицию в выражении без пробельных символов.
+    У if(cond, a, b) невыбранная ветка только проверяется, но не вычисляется.
+    :param buffer: Выражение в кодировке UTF-8
+    :param name_table: Таблица имен, через которую в выражении могут быть задействованы переменные и функции
+    :param options: Настройки вычисления (в том числе для вызовов пользовательских функций)
+    :param max_depth: Максимальная глубина вложенности скобок и вызовов функций. None - без ограничения.
+    :raises UserFriendlyException: Ошибка в выражении или при вычислении. Подробности в исключении.
+    :raises BudgetExceededError: Бюджет вычисления исчерпан или вычисление отменено
+    :raises RecursionError: Превышена глубина вызовов пользовательских функций
+    :return: Значение выражения
+    """
+    evaluator = _Evaluator(name_table, options)
+    grammar = _Grammar(_tokens(buffer), evaluator, max_depth)
+    try:
+        grammar.parse()
+    except ExpressionSyntaxError as e:
+        raise UserFriendlyException(f"Ошибка в выражении (позиция {grammar.position})\n{str(e)}") from e
+    except FunctionSyntaxError as e:
+        raise UserFriendlyException(f"Ошибка в вызове функции (позиция {grammar.position})\n{str(e)}") from e
+
+    return evaluator.result()
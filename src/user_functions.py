@@ -1,8 +1,16 @@
-from typing import Callable, Iterable, Sequence
+from typing import Sequence
 
+from src.budgets import BudgetExceededError
+from src.cache import LRUCache
 from src.functions import Function, FunctionSyntaxError, FunctionExecutionError
-from src.common import InvalidIdentifierError, IDENTIFIER_ALLOWED_CHARACTERS, Nametable
-from src.expressions import Expression
+from src.common import InvalidIdentifierError, IDENTIFIER_ALLOWED_CHARACTERS, Nametable, NameLookup, Scope
+from src.codegen import GeneratedFunction
+from src.evaluator import evaluate, EvaluationOptions, DEFAULT_OPTIONS, TREE, VM
+from src.expressions import Expression, COMPILERS
+from src.interning import NodeInterner
+from src.nodes import Node, identifiers
+from src.optimizer import fold_constants
+from src.vm import Program
 
 
 class UserFunctionDefiner:
@@ -16,10 +24,22 @@ class UserFunctionDefiner:
         return string.startswith("lambda")
 
     @classmethod
-    def build_function_from_string(cls, string: str) -> Function:
+    def build_function_from_string(cls, string: str, max_depth: int | None = None, memo_size: int = 0,
+                                   name_table: NameLookup | None = None, fold_globals: bool = False,
+                                   options: EvaluationOptions = DEFAULT_OPTIONS,
+                                   interner: NodeInterner | None = None) -> Function:
         """
         Собирает мат. функцию (аналог lambda из Python) из строки вида "lambda(x,y,z):x+y+z"
+        Тело функции разбирается сразу, поэтому синтаксические ошибки в нем обнаруживаются при объявлении.
+        Части тела, не зависящие от аргументов, вычисляются сразу (см. optimizer.fold_constants).
         :param string: Строка вида "lambda(x,y,z):x+y+z"
+        :param max_depth: Максимальная глубина вложенности скобок и вызовов функций в теле. None - без ограничения.
+        :param memo_size: Размер таблицы запомненных результатов функции (см. UserDefinedFunction.memo). 0 - не запоминать.
+        :param name_table: Таблица имен на момент объявления, из которой берутся встроенные функции для свертки
+        :param fold_globals: Подставить в тело значения глобальных переменных на момент объявления
+        :param options: Настройки вычисления, с которыми будет вызываться функция
+        :param interner: Таблица уникальных узлов для тела функции (после свертки констант). None - не интернировать.
+        :raises UserFriendlyException: Синтаксическая ошибка в теле функции
         :return: Экземпляр UserDefinedFunction, при вызове которого вычисляется указанное выражение с заданными переменными
         """
 
@@ -37,9 +57,12 @@ class UserFunctionDefiner:
         for arg in args:
             cls.__assert_arg_name_is_valid(arg)
 
-        expression = Expression(expression_string)
+        body = Expression(expression_string, max_depth=max_depth).parse()
+        body = fold_constants(body, args, name_table=name_table, fold_globals=fold_globals, options=options)
+        if interner is not None:
+            body = interner.intern(body)
 
-        return UserDefinedFunction(expression.evaluate, args)
+        return UserDefinedFunction(body, args, memo_size=memo_size)
 
     @classmethod
     def __assert_arg_name_is_valid(cls, arg_name: str):
@@ -63,51 +86,176 @@ class UserDefinedFunction(Function):
     Мат. функция, заданная пользовательскм выражением через lambda
     """
 
+    inline = True
+
     arg_names: Sequence[str]
-    _callable: Callable[[Nametable, ], float]
+    body: Node
+    """
+    Заранее разобранное тело функции
+    """
+    global_names: frozenset[str]
+    """
+    Идентификаторы, к которым обращается тело функции, кроме ее аргументов
+    """
+    memo: LRUCache[tuple, float] | None
+    """
+    Запомненные результаты вызовов по значениям аргументов. None - результаты не запоминаются.
+    Таблица сбрасывается через invalidate_memo при переобъявлении любого глобального имени, от которого зависит функция
+    (см. NametableManager.assign).
+    """
+    __reachable_names: frozenset[str] | None
+    """
+    Имена, к которым функция обращается сама или через вызываемые функции. Вычисляются при первом запомненном вызове.
+    """
+    __programs: dict[tuple[str, bool, bool], Program | GeneratedFunction]
+    """
+    Скомпилированное тело по способу вычисления и значениям compensated_sum и exact_integers (см. EvaluationOptions).
+    Компилируется при первом вызове.
+    """
 
-    def __init__(self, _callable: Callable[[Nametable, ], float], arg_names: Sequence[str]):
+    def __init__(self, body: Node, arg_names: Sequence[str], memo_size: int = 0):
+        """
+        :param memo_size: Максимальное количество запомненных результатов. 0 - не запоминать.
+        """
         self.arg_names = arg_names
-        self._callable = _callable
+        self.body = body
+        self.global_names = identifiers(body) - frozenset(arg_names)
+        self.memo = LRUCache(memo_size) if memo_size > 0 else None
+        self.__reachable_names = None
+        self.__programs = {}
+
+    def invalidate_memo(self) -> None:
+        """
+        Забывает запомненные результаты (счетчики попаданий сохраняются)
+        """
+        if self.memo is not None:
+            self.memo.clear(reset_stats=False)
+        self.__reachable_names = None
 
-    def __call__(self, *args: float, name_table: Nametable | None = None, **kwargs) -> float:
+    def __call__(self, *args: float, name_table: NameLookup | None = None,
+                 options: EvaluationOptions = DEFAULT_OPTIONS, **kwargs) -> float:
         """
         Вычисляет выражение, заданное пользователем, с учетом аргументов.
+        Аргументы попадают в отдельную область видимости поверх переданной таблицы,
+        поэтому исходная таблица не изменяется и не копируется.
+        Если включено запоминание (memo), повторный вызов с теми же аргументами возвращает сохраненный результат.
         :param args: Числовые аргументы, которые будут переданы функции
+        :param options: Настройки вычисления вызывающего выражения
         :return: Результат выполнения функции приведенный к float
         """
 
+        if name_table is None:
+            name_table = Nametable()
+
+        memo_key = self.memo_key(args, name_table, options)
+        result = self.recall(memo_key)
+        if result is not None:
+            return result
+
         try:
-            if name_table is not None:
-                name_table = name_table.copy()    # чтобы не изменять исходную таблицу
-            else:
-                name_table = Nametable()
-            self.__extend_nametable(name_table, args, self.arg_names)
+            scope = self.enter(args, name_table)
 
-            return self._callable(name_table)
-        except RecursionError:
+            if options.backend == TREE:
+                result = evaluate(self.body, scope, options)
+            else:
+                # тело выполняется стековой машиной и для PYTHON: вложенные вызовы не занимают стек Python
+                result = self.compile(options.compensated_sum, VM, options.exact_integers).run(scope, options)
+        except (RecursionError, BudgetExceededError):
             raise
         except (FunctionSyntaxError, FunctionExecutionError):
             raise
         except Exception as e:
             raise FunctionExecutionError(str(e)) from e
 
-    @classmethod
-    def __extend_nametable(cls, name_table: Nametable, args: Iterable[float], arg_names: Sequence[str]):
+        self.remember(memo_key, result)
+        return result
+
+    def memo_key(self, args: Sequence[float], name_table: NameLookup, options: EvaluationOptions) -> tuple | None:
         """
-        Преобразует позиционные аргументы из 'args' в именованные через сопоставление с 'arg_names' и добавляет их в таблицу.
-        Используется для создания локальных таблиц при вызове функций.
-        :param name_table: Таблица имен, в которую будут добавлены аргументы.
-        :param args: Позиционные аргументы, переданные функции.
-        :param arg_names: Сигнатура аргументов функции/
-        :return: Ничего не возвращает, т. к. изменяет 'name_table'
+        :return: Ключ для запоминания результата вызова или None, если результат не запоминается
         """
-        index = 0
-        for index, value in enumerate(args):
-            if index >= len(arg_names):
-                raise FunctionSyntaxError("Переданы лишние аргументы")
+        if self.memo is None or not self.__is_pure_call(name_table):
+            return None
+        return tuple(args), options.compensated_sum, options.exact_integers
 
-            name_table[arg_names[index]] = value
+    def recall(self, memo_key: tuple | None) -> float | None:
+        """
+        :return: Запомненный результат или None
+        """
+        if memo_key is None:
+            return None
+        return self.memo.get(memo_key)    # type: ignore
+
+    def remember(self, memo_key: tuple | None, result: float) -> None:
+        if memo_key is not None:
+            self.memo.put(memo_key, result)    # type: ignore
+
+    def enter(self, args: Sequence[float], name_table: NameLookup) -> NameLookup:
+        """
+        Создает область видимости вызова: аргументы поверх таблицы вызывающего выражения.
+        Вместе с memo_key/recall/remember позволяет вычислять тело без вызова __call__ (см. Function.inline),
+        чтобы вложенные и рекурсивные вызовы не занимали стек Python.
+        :raises FunctionSyntaxError: Неверное количество аргументов
+        """
+        return Scope.extend(name_table, self.__bind_arguments(args, self.arg_names))
+
+    def __getstate__(self) -> dict:
+        """
+        Скомпилированное тело не передается между процессами (сгенерированные функции не сериализуются)
+        и компилируется заново при первом вызове
+        """
+        state = self.__dict__.copy()
+        state["_UserDefinedFunction__programs"] = {}
+        return state
+
+    def compile(self, compensated_sum: bool = False, backend: str = VM,
+                exact_integers: bool = False) -> Program | GeneratedFunction:
+        """
+        Тело, скомпилированное для стековой машины или в функцию Python (кэшируется, см. Expression.compile)
+        """
+        key = (backend, compensated_sum, exact_integers)
+        program = self.__programs.get(key)
+        if program is None:
+            program = self.__programs[key] = COMPILERS[backend](self.body, compensated_sum, exact_integers)
+        return program
 
-        if index < len(arg_names) - 1:
+    def __is_pure_call(self, name_table: NameLookup) -> bool:
+        """
+        Проверяет, что результат вызова зависит только от аргументов и глобальных имен, т. е. его можно запомнить.
+        Тело функции видит аргументы вызывающих функций, поэтому при вложенном вызове они не должны перекрывать
+        ни одно из имен, к которым функция обращается сама или через другие функции.
+        """
+        if not isinstance(name_table, Scope):
+            return True
+
+        if self.__reachable_names is None:
+            self.__reachable_names = self.__collect_reachable_names(name_table.global_names)
+        return self.__reachable_names.isdisjoint(name_table.local_names)
+
+    def __collect_reachable_names(self, global_names: NameLookup) -> frozenset[str]:
+        reachable = set(self.global_names)
+        pending = list(self.global_names)
+        while pending:
+            target = global_names.get(pending.pop())
+            if isinstance(target, UserDefinedFunction):
+                for name in target.global_names - reachable:
+                    reachable.add(name)
+                    pending.append(name)
+
+        return frozenset(reachable)
+
+    @staticmethod
+    def __bind_arguments(args: Sequence[float], arg_names: Sequence[str]) -> Nametable:
+        """
+        Преобразует позиционные аргументы из 'args' в именованные через сопоставление с 'arg_names'.
+        :param args: Позиционные аргументы, переданные функции.
+        :param arg_names: Сигнатура аргументов функции
+        :return: Таблица с привязками аргументов
+        """
+        if len(args) > len(arg_names):
+            raise FunctionSyntaxError("Переданы лишние аргументы")
+
+        if len(args) < len(arg_names):
             raise FunctionSyntaxError("Недостаточно параметров для вызова функции")
+
+        return dict(zip(arg_names, args))
@@ -0,0 +1,420 @@
+import sys
+from typing import Callable
+from array import array
+
+from src import budgets
+from src.budgets import BudgetExceededError
+from src.common import UserFriendlyException, NameLookup
+from src.evaluator import EvaluationOptions, DEFAULT_OPTIONS, CallFrame, call_stack_error, VM
+from src.functions import Function, CodeBasedFunction, ConditionalFunction, FunctionSyntaxError, FunctionExecutionError
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.operators import OperationError
+
+
+CONST, OBJECT, NAME, BINOP, FOLD, RESOLVE, CALL, TEST, SKIP, SWAP = range(10)
+"""
+Коды инструкций. Аргумент инструкции - номер константы (CONST, OBJECT) или номер узла в Program.sites:
+- CONST: положить константу из array('d');
+- OBJECT: положить константу, которую нельзя хранить как double без изменения типа (например, целое 0);
+- NAME: положить значение переменной;
+- BINOP: применить оператор цепочки к двум верхним значениям (цепочка из двух операндов или шаг цепочки);
+- FOLD: свернуть верхние значения длинной цепочкой операторов (OperatorChain.fold);
+- RESOLVE: найти функцию вызова (до вычисления аргументов, как и при обходе дерева);
+- CALL: вызвать найденную функцию с верхними значениями в качестве аргументов;
+- TEST, SKIP: переходы вызова с тремя аргументами, если функция - if (см. compile_tree);
+- SWAP: поменять местами два верхних значения (шаг правоассоциативной цепочки).
+"""
+
+
+class Program:
+    """
+    Синтаксическое дерево, скомпилированное в плоскую последовательность инструкций стековой машины.
+    Инструкции хранятся в array('B'), их аргументы - в array('I'), числовые константы - в array('d'),
+    идентификаторы - в таблице интернированных строк. Узлы дерева (sites) используются для текста ошибок,
+    поэтому сообщения совпадают с сообщениями при обходе дерева (evaluator.evaluate).
+    """
+
+    __slots__ = ("code", "args", "constants", "objects", "sites", "names", "operators", "counts", "jumps", "tails",
+                 "compensated_sum", "exact_integers")
+
+    code: array
+    args: array
+    constants: array
+    objects: list[float]
+    sites: list[Node]
+    names: list[str | None]
+    """
+    Для каждого узла из sites - интернированный идентификатор (для переменных и вызовов)
+    """
+    operators: list[Callable[[float, float], float] | None]
+    """
+    Для каждого узла из sites - оператор (для BINOP): BinaryOperator или его метод exact
+    """
+    counts: array
+    """
+    Для каждого узла из sites - количество снимаемых со стека значений (для FOLD и CALL)
+    """
+    jumps: array
+    """
+    Для каждого узла из sites - адрес перехода (для TEST и SKIP)
+    """
+    tails: array
+    """
+    Для каждого узла из sites - 1, если вызов последний в программе (возможно, внутри веток if)
+    """
+    compensated_sum: bool
+    """
+    Программа скомпилирована для точного суммирования (см. EvaluationOptions)
+    """
+    exact_integers: bool
+    """
+    Программа скомпилирована для точных целых чисел: BINOP применяет BinaryOperator.exact (см. EvaluationOptions)
+    """
+
+    def __init__(self, compensated_sum: bool, exact_integers: bool = False):
+        self.code = array("B")
+        self.args = array("I")
+        self.constants = array("d")
+        self.objects = []
+        self.sites = []
+        self.names = []
+        self.operators = []
+        self.counts = array("I")
+        self.jumps = array("I")
+        self.tails = array("B")
+        self.compensated_sum = compensated_sum
+        self.exact_integers = exact_integers
+
+    def run(self, name_table: NameLookup, options: EvaluationOptions = DEFAULT_OPTIONS) -> float:
+        """
+        Выполняет программу. Семантика (порядок вычисления, ошибки, бюджет, глубина вызовов) совпадает
+        с evaluator.evaluate: тела пользовательских функций выполняются в том же цикле (без стека Python),
+        хвостовые вызовы продолжают текущий кадр, у if вычисляется только выбранная ветка.
+        :raises UserFriendlyException: Ошибка при вычислении. Подробности в исключении.
+        :raises BudgetExceededError: Бюджет вычисления исчерпан или вычисление отменено
+        :raises RecursionError: Превышена глубина вызовов пользовательских функций
+        """
+        return _execute(self, name_table, options, [])
+
+    def __len__(self) -> int:
+        return len(self.code)
+
+
+_RETURN = Program(False)
+"""
+Пустая программа: возврат в нее из вызова завершает выполнение (см. call)
+"""
+
+
+def call(site: Call, function: Function, args: list[float], name_table: NameLookup,
+         options: EvaluationOptions = DEFAULT_OPTIONS) -> float:
+    """
+    Вызывает пользовательскую функцию (Function.inline) на стековой машине: вложенные и рекурсивные вызовы
+    не занимают стек Python. Результат и ошибки совпадают с Call.invoke.
+    :param site: Узел вызова (для текста ошибок)
+    """
+    memo_key = function.memo_key(args, name_table, options)    # type: ignore
+    result = function.recall(memo_key)    # type: ignore
+    if result is not None:
+        return result
+    try:
+        scope = function.enter(args, name_table)    # type: ignore
+    except (FunctionSyntaxError, FunctionExecutionError) as e:
+        raise site.call_error(e) from e
+    if options.max_call_depth < 1:
+        raise RecursionError(f"Превышена глубина вызовов функций ({options.max_call_depth})")
+
+    program = function.compile(options.compensated_sum, VM, options.exact_integers)    # type: ignore
+    return _execute(program, scope, options, [_Frame(site, name_table, function, memo_key, _RETURN, 0, 0)])
+
+
+def _execute(program: Program, name_table: NameLookup, options: EvaluationOptions, frames: list["_Frame"]) -> float:
+    """
+    :param frames: Незавершенные вызовы: уже начатый вызов (см. call) или пустой список
+    """
+    try:
+        return _loop(program, name_table, options, frames)
+    except (RecursionError, BudgetExceededError):
+        raise
+    except Exception as e:
+        if not frames:
+            raise
+        raise call_stack_error((entry for frame in reversed(frames) for entry in frame), e) from e
+
+
+def _loop(program: Program, name_table: NameLookup, options: EvaluationOptions, frames: list["_Frame"]) -> float:
+    code, args, constants, sites, names, operators, counts = program.code, program.args, program.constants, \
+        program.sites, program.names, program.operators, program.counts
+    end = len(code)
+    pc = 0
+    depth = len(frames)
+    max_call_depth = options.max_call_depth
+    budget = budgets.current()
+    stack: list = []
+    push, pop = stack.append, stack.pop
+    targets: list = []
+    frame: _Frame | None = frames[-1] if frames else None
+
+    while True:
+        if pc == end:
+            if frame is None:
+                return stack[-1]
+
+            # возврат из пользовательской функции: результат уже на вершине стека
+            frame.function.remember(frame.memo_key, stack[-1])    # type: ignore
+            depth -= frame.depth
+            frames.pop()
+            program, pc, name_table = frame.program, frame.pc, frame.caller_names
+            code, args, constants, sites, names, operators, counts = program.code, program.args, \
+                program.constants, program.sites, program.names, program.operators, program.counts
+            end = len(code)
+            frame = frames[-1] if frames else None
+            continue
+
+        op = code[pc]
+        arg = args[pc]
+        pc += 1
+
+        if op == CONST:
+            push(constants[arg])
+
+        elif op == NAME:
+            try:
+                value = name_table[names[arg]]    # type: ignore
+            except KeyError:
+                value = None
+            if value.__class__ is float:
+                push(value)
+            else:    # целые числа и ошибки - как при обходе дерева
+                push(sites[arg].resolve(name_table))    # type: ignore
+
+        elif op == BINOP:
+            if budget is not None:
+                budget.charge(operations=1)
+            right = pop()
+            try:
+                stack[-1] = operators[arg](stack[-1], right)    # type: ignore
+            except OperationError as e:
+                raise UserFriendlyException(f"Ошибка вычисления выражения: {sites[arg].text}\n{str(e)}") from e
+
+        elif op == FOLD:
+            count = counts[arg]
+            if budget is not None:
+                budget.charge(operations=count - 1)
+            values = stack[-count:]
+            del stack[-count:]
+            push(sites[arg].fold(values, program.compensated_sum, program.exact_integers))    # type: ignore
+
+        elif op == RESOLVE:
+            targets.append(sites[arg].resolve(name_table))    # type: ignore
+
+        elif op == CALL:
+            count = counts[arg]
+            target = targets.pop()
+            if target.__class__ is ConditionalFunction and count == ConditionalFunction.ARGUMENTS:
+                continue    # конец ветки "иначе" у if: значение ветки уже на стеке
+            if budget is not None:
+                if isinstance(target, CodeBasedFunction):
+                    budget.charge(operations=1)
+                else:
+                    budget.charge(calls=1)
+            if count:
+                call_args = stack[-count:]
+                del stack[-count:]
+            else:
+                call_args = []
+
+            if not target.inline:
+                push(sites[arg].invoke(target, call_args, name_table, options=options))    # type: ignore
+                continue
+
+            memo_key = target.memo_key(call_args, name_table, options)
+            result = target.recall(memo_key)
+            if result is not None:
+                push(result)
+                continue
+            try:
+                scope = target.enter(call_args, name_table)
+            except (FunctionSyntaxError, FunctionExecutionError) as e:
+                raise sites[arg].call_error(e) from e    # type: ignore
+
+            depth += 1
+            if depth > max_call_depth:
+                raise RecursionError(f"Превышена глубина вызовов функций ({max_call_depth})")
+
+            if frame is not None and program.tails[arg] and frame.memo_key is None and memo_key is None \
+                    and len(targets) == frame.targets \
+                    + sum(1 for pending in targets[frame.targets:] if pending.__class__ is ConditionalFunction):
+                # хвостовой вызов: текущему телу после возврата осталось только завершить ветки if
+                del targets[frame.targets:]
+                frame.add_tail_call(sites[arg])    # type: ignore
+            else:
+                frame = _Frame(sites[arg], name_table, target, memo_key, program, pc, len(targets))    # type: ignore
+                frames.append(frame)
+
+            name_table = scope
+            program = target.compile(program.compensated_sum, VM, program.exact_integers)
+            code, args, constants, sites, names, operators, counts = program.code, program.args, \
+                program.constants, program.sites, program.names, program.operators, program.counts
+            end = len(code)
+            pc = 0
+
+        elif op == TEST:
+            target = targets[-1]
+            if target.__class__ is ConditionalFunction:
+                if budget is not None:
+                    budget.charge(operations=1)
+                if not pop():
+                    pc = program.jumps[arg]
+
+        elif op == SKIP:
+            if targets[-1].__class__ is ConditionalFunction:
+                targets.pop()
+                pc = program.jumps[arg]
+
+        elif op == OBJECT:
+            push(program.objects[arg])
+
+        elif op == SWAP:
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+
+        else:
+            raise ValueError(f"Неизвестная инструкция: {op}")
+
+
+class _Frame(CallFrame):
+    """
+    Кадр вызова пользовательской функции на стековой машине: куда вернуться после тела функции
+    """
+
+    __slots__ = ("program", "pc", "targets")
+
+    program: Program
+    pc: int
+    targets: int
+    """
+    Сколько функций было на стеке раскрытых вызовов в момент вызова
+    """
+
+    def __init__(self, call: Call, caller_names: NameLookup, function, memo_key: tuple | None, program: Program,
+                 pc: int, targets: int):
+        super().__init__(call, caller_names, function, memo_key)
+        self.program = program
+        self.pc = pc
+        self.targets = targets
+
+
+_TEST = object()
+_SKIP = object()
+"""
+Состояния вызова с тремя аргументами при компиляции: вычислено условие / первая ветка
+"""
+
+
+def compile_tree(tree: Node, compensated_sum: bool = False, exact_integers: bool = False) -> Program:
+    """
+    Компилирует синтаксическое дерево в программу стековой машины (без рекурсии).
+    Операнды и операторы цепочки вычисляются в том же порядке, что и при обходе дерева (см. OperatorChain):
+    если после первого оператора вычисляется не число (OperatorChain.stepwise), каждый оператор - отдельный BINOP
+    сразу после своих операндов (у правоассоциативной цепочки - после SWAP, кроме первого),
+    иначе все операнды вычисляются до операторов.
+    Вызов с тремя аргументами компилируется с переходами, которые срабатывают, только если функция - if:
+    RESOLVE, условие, TEST (ложь - к третьему аргументу), второй аргумент, SKIP (за CALL), третий аргумент, CALL.
+    Для любой другой функции переходы не выполняются и вызов выполняется как обычно.
+    :param compensated_sum: Для точного суммирования цепочки сложений всегда сворачиваются целиком (FOLD)
+    :param exact_integers: Операторы применяются в режиме целых чисел (BinaryOperator.exact)
+    """
+    program = Program(compensated_sum, exact_integers)
+    constant_indexes: dict[float, int] = {}
+    # (узел, состояние, последний ли он в программе)
+    pending: list[tuple[Node, object, bool]] = [(tree, False, True)]
+    branches: list[tuple[int, int]] = []    # (TEST, SKIP) незавершенных вызовов с тремя аргументами
+
+    while pending:
+        node, expanded, tail = pending.pop()
+
+        if isinstance(node, Number):
+            if node.value.__class__ is float:
+                index = constant_indexes.get(node.value)
+                if index is None or node.value != node.value:    # nan не равен себе
+                    index = constant_indexes[node.value] = len(program.constants)
+                    program.constants.append(node.value)
+                _emit(program, CONST, index)
+            else:
+                _emit(program, OBJECT, len(program.objects))
+                program.objects.append(node.value)
+
+        elif isinstance(node, Name):
+            _emit(program, NAME, _site(program, node, sys.intern(node.identifier)))
+
+        elif isinstance(node, OperatorChain):
+            if expanded is True:
+                if len(node.operands) == 2 and not (compensated_sum and node.additive):
+                    operator = node.operators[0]
+                    _emit(program, BINOP, _site(program, node, operator=operator.exact if exact_integers else operator))
+                else:
+                    _emit(program, FOLD, _site(program, node, count=len(node.operands)))
+            elif expanded is False:
+                if not node.stepwise or (compensated_sum and node.additive):
+                    pending.append((node, True, False))
+                    pending.extend((operand, False, False) for operand in reversed(node.operands))
+                else:
+                    pending.extend((item, False, False) if isinstance(item, Node) else (node, item, False)
+                                   for item in reversed(node.order()))
+            else:
+                if node.right_associative and expanded != len(node.operators) - 1:
+                    _emit(program, SWAP, 0)
+                operator = node.operators[expanded]    # type: ignore
+                _emit(program, BINOP, _site(program, node, operator=operator.exact if exact_integers else operator))
+
+        elif isinstance(node, Call):
+            conditional = len(node.args) == ConditionalFunction.ARGUMENTS
+            if expanded is _TEST:
+                test = _site(program, node)
+                _emit(program, TEST, test)
+                pending.append((node, _SKIP, tail))
+                pending.append((node.args[1], False, tail))
+                branches.append((test, 0))
+            elif expanded is _SKIP:
+                test, _ = branches.pop()
+                skip = _site(program, node)
+                _emit(program, SKIP, skip)
+                program.jumps[test] = len(program.code)
+                branches.append((test, skip))
+                pending.append((node, True, tail))
+                pending.append((node.args[2], False, tail))
+            elif expanded:
+                _emit(program, CALL, _site(program, node, sys.intern(node.identifier), count=len(node.args), tail=tail))
+                if conditional:
+                    _, skip = branches.pop()
+                    program.jumps[skip] = len(program.code)
+            else:
+                _emit(program, RESOLVE, _site(program, node, sys.intern(node.identifier)))
+                if conditional:
+                    pending.append((node, _TEST, tail))
+                    pending.append((node.args[0], False, False))
+                else:
+                    pending.append((node, True, tail))
+                    pending.extend((arg, False, False) for arg in reversed(node.args))
+
+        else:
+            raise TypeError(f"Неизвестный тип узла: {type(node).__name__}")
+
+    return program
+
+
+def _emit(program: Program, op: int, arg: int) -> None:
+    program.code.append(op)
+    program.args.append(arg)
+
+
+def _site(program: Program, node: Node, name: str | None = None,
+          operator: Callable[[float, float], float] | None = None,
+          count: int = 0, tail: bool = False) -> int:
+    program.sites.append(node)
+    program.names.append(name)
+    program.operators.append(operator)
+    program.counts.append(count)
+    program.jumps.append(0)
+    program.tails.append(tail)
+    return len(program.sites) - 1
@@ -0,0 +1,109 @@
+import unittest
+from unittest import TestCase
+
+from src.batch import HAVE_NUMPY, np, OK, DIVISION_BY_ZERO, NOT_INTEGER, OVERFLOW, INVALID_ARGUMENT
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+
+
+@unittest.skipIf(not HAVE_NUMPY, "numpy не установлен")
+class TestEvaluateBatch(TestCase):
+
+    calc: Calculator
+
+    def setUp(self):
+        self.calc = Calculator()
+
+    def __assert_matches_scalar(self, expression: str, **bindings: list[float]):
+        """
+        Шорткат для проверки, что пакетное вычисление совпадает с поэлементным вычислением калькулятора
+        """
+        result = self.calc.evaluate_batch(expression, {name: np.array(values) for name, values in bindings.items()})
+        for index in range(len(next(iter(bindings.values())))):
+            for name, values in bindings.items():
+                self.calc.execute(f"{name} = {values[index]}")
+            self.assertEqual(self.calc.execute(expression), result.values[index])
+        self.assertFalse(result.error_mask.any())
+
+    def test_operators(self):
+        self.__assert_matches_scalar("5.2 - x*3/y**2 + 7%4//2 - 2^3^x",
+                                     x=[0, 1, 2, 3.5], y=[1, 0.5, -2, 4])
+
+    def test_rounding_large_values(self):
+        self.__assert_matches_scalar("x**64 % 3 + x * y", x=[3, 7, 11, -3], y=[1e17, 123456789012.345, 2 ** 52, 5e15])
+
+    def test_rounding_ties(self):
+        self.__assert_matches_scalar("x * 1", x=[0.415, 1.005, 2.675, -0.125, 0.285, 1.115, 10.045, -2.345])
+        self.__assert_matches_scalar("x / 1000 + x / 8", x=[5, 15, 125, 2675, 1005, -7])
+
+    def test_functions(self):
+        self.__assert_matches_scalar("1 + max(abs(x), 12*0.5, y) - min(x, y) + sqrt(pow(x, 2))",
+                                     x=[-7, 0, 3.25], y=[1, 10, -3])
+
+    def test_user_function(self):
+        self.calc.execute("k = 3")
+        self.calc.execute("f = lambda a, b: a * k - b")
+        self.__assert_matches_scalar("f(x, 1) + f(2, x)", x=[0, 1.5, -4])
+
+    def test_comparisons(self):
+        self.__assert_matches_scalar("(x < y) + (x <= y) * 2 + (x == y) * 4 + (x != y) * 8 + (x > 1)",
+                                     x=[0, 1, 2, 3.5], y=[1, 1, -2, 4])
+
+    def test_conditional(self):
+        self.__assert_matches_scalar("if(x < 0, -x, x * 2) + if(x, 1, 0)", x=[-3, 0, 2.5])
+
+    def test_conditional_errors_from_chosen_branch(self):
+        result = self.calc.evaluate_batch("if(x, 1 / x, 1 // 0.5)", {"x": np.array([2, 0, 4])})
+        self.assertEqual([OK, NOT_INTEGER, OK], result.errors.tolist())
+        self.assertEqual(0.5, result.values[0])
+
+    def test_broadcast(self):
+        result = self.calc.evaluate_batch("x + y", {"x": np.array([[1], [2]]), "y": np.array([10, 20, 30])})
+        self.assertEqual((2, 3), result.values.shape)
+        self.assertEqual(32, result.values[1, 2])
+
+    def test_division_by_zero(self):
+        result = self.calc.evaluate_batch("1 / x", {"x": np.array([2, 0, 4])})
+        self.assertEqual([OK, DIVISION_BY_ZERO, OK], result.errors.tolist())
+        self.assertTrue(np.isnan(result.values[1]))
+        self.assertEqual(0.25, result.values[2])
+        self.assertEqual("деление на ноль", result.error_message(1))
+        self.assertIsNone(result.error_message(0))
+
+    def test_integer_checks(self):
+        result = self.calc.evaluate_batch("x // 2 + x % y", {"x": np.array([5, 2.5, 4]), "y": np.array([3, 1, 0])})
+        self.assertEqual([OK, NOT_INTEGER, DIVISION_BY_ZERO], result.errors.tolist())
+        self.assertEqual(4, result.values[0])
+
+    def test_first_error_is_kept(self):
+        result = self.calc.evaluate_batch("1 / x + 1 // x", {"x": np.array([0, 0.5])})
+        self.assertEqual([DIVISION_BY_ZERO, NOT_INTEGER], result.errors.tolist())
+
+    def test_power_errors(self):
+        result = self.calc.evaluate_batch("x ^ y + sqrt(x)", {"x": np.array([10, -8, 4]), "y": np.array([400, 0.5, 2])})
+        self.assertEqual([OVERFLOW, INVALID_ARGUMENT, OK], result.errors.tolist())
+        self.assertEqual(18, result.values[2])
+
+    def test_unknown_identifier(self):
+        with self.assertRaises(UserFriendlyException):
+            self.calc.evaluate_batch("x + z", {"x": np.array([1, 2])})
+
+    def test_wrong_arg_count(self):
+        with self.assertRaises(UserFriendlyException):
+            self.calc.evaluate_batch("sqrt(x, 2)", {"x": np.array([1, 2])})
+
+    def test_declaration(self):
+        with self.assertRaises(UserFriendlyException):
+            self.calc.evaluate_batch("y = x", {"x": np.array([1, 2])})
+
+
+@unittest.skipIf(np is not None, "numpy установлен")
+class TestEvaluateBatchWithoutNumpy(TestCase):
+
+    def test_requires_numpy(self):
+        with self.assertRaises(UserFriendlyException):
+            Calculator().evaluate_batch("x + 1", {"x": [1, 2]})
+
+
+if __name__ == '__main__':
+    unittest.main()
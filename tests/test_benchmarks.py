@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks import large_file
+from benchmarks.suite import WORKLOADS, Measurement, measure, run_suite, compare, save_baseline, load_baseline
+
+
+class TestSuite(unittest.TestCase):
+
+    @staticmethod
+    def __measurement(ops_per_sec: float = 1000, p99_us: float = 10, peak_kib: float = 100) -> Measurement:
+        return Measurement(ops=100, ops_per_sec=ops_per_sec, p50_us=5, p99_us=p99_us, peak_kib=peak_kib)
+
+    def test_all_workloads_run(self):
+        for workload in WORKLOADS.values():
+            with self.subTest(workload.name):
+                result = measure(workload, 5)
+                self.assertGreater(result.ops, 0)
+                self.assertGreater(result.ops_per_sec, 0)
+                self.assertLessEqual(result.p50_us, result.p99_us)
+
+    def test_exact_integers(self):
+        result = measure(WORKLOADS["big_integers"], 2, exact_integers=True)
+        self.assertEqual(2, result.ops)
+
+    def test_scale(self):
+        self.assertEqual(["plus_chain/10", "plus_chain/100", "plus_chain/1000"],
+                         list(run_suite(["plus_chain"], scale=0.1)))
+
+    def test_no_regression_within_threshold(self):
+        baseline = {"w/1": self.__measurement()}
+        current = {"w/1": self.__measurement(ops_per_sec=800, p99_us=12, peak_kib=120)}
+        self.assertEqual([], compare(current, baseline, threshold=0.25))
+
+    def test_regressions(self):
+        baseline = {"w/1": self.__measurement()}
+        current = {"w/1": self.__measurement(ops_per_sec=700, p99_us=13, peak_kib=130)}
+        self.assertEqual(3, len(compare(current, baseline, threshold=0.25)))
+
+    def test_new_workload_not_compared(self):
+        self.assertEqual([], compare({"new/1": self.__measurement(ops_per_sec=1)}, {}))
+
+    def test_baseline_round_trip(self):
+        handle, path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        try:
+            save_baseline({"w/1": self.__measurement()}, path)
+            self.assertEqual(self.__measurement().to_dict(), load_baseline(path)["w/1"].to_dict())
+        finally:
+            os.remove(path)
+
+
+class TestLargeFile(unittest.TestCase):
+
+    def test_modes_agree(self):
+        handle, path = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+        try:
+            self.assertEqual(10_000, large_file.write_expression(path, 1000))
+            stream = large_file.measure(large_file.STREAM, path)
+            self.assertEqual(large_file.measure(large_file.EXECUTE, path)["result"], stream["result"])
+            self.assertGreater(stream["peak_rss_kib"], 0)
+        finally:
+            os.remove(path)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import threading
+import time
+import unittest
+
+from src import budgets
+from src.budgets import Budget, BudgetExceededError
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+from src.expressions import Expression
+
+
+class TestBudget(unittest.TestCase):
+
+    calculator: Calculator
+
+    def setUp(self):
+        self.calculator = Calculator()
+        self.calculator.execute("f0 = lambda(x): x + 1")
+        for i in range(1, 30):
+            # 2^i вызовов f0 на один вызов fi
+            self.calculator.execute(f"f{i} = lambda(x): f{i - 1}(x) + f{i - 1}(x)")
+
+    def __assert_exceeded(self, line: str, budget: Budget, message: str) -> None:
+        with self.assertRaises(BudgetExceededError) as context:
+            self.calculator.execute(line, budget)
+        self.assertIn(message, str(context.exception))
+
+    def test_is_user_friendly(self):
+        self.assertTrue(issubclass(BudgetExceededError, UserFriendlyException))
+
+    def test_operations(self):
+        self.assertEqual(50, self.calculator.execute("+".join(["1"] * 50), Budget(max_operations=49)))
+        self.__assert_exceeded("+".join(["1"] * 51), Budget(max_operations=49), "операций")
+
+    def test_calls(self):
+        self.assertEqual(2 ** 5 * 2, self.calculator.execute("f5(1)", Budget(max_calls=100)))
+        self.__assert_exceeded("f29(1)", Budget(max_calls=1000), "Превышен лимит вызовов функций: 1000")
+
+    def test_recursion(self):
+        self.calculator.execute("r = lambda(x): r(x) + 1")
+        self.__assert_exceeded("r(1)", Budget(max_calls=200), "вызовов")
+
+    def test_time(self):
+        started = time.monotonic()
+        self.__assert_exceeded("f29(1)", Budget(max_seconds=0.05), "времени")
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_cancel_from_other_thread(self):
+        budget = Budget()
+        timer = threading.Timer(0.05, budget.cancel)
+        timer.start()
+        try:
+            self.__assert_exceeded("f29(1)", budget, "отменено")
+        finally:
+            timer.cancel()
+
+    def test_reusable(self):
+        budget = Budget(max_calls=100)
+        for _ in range(10):
+            self.calculator.execute("f5(1)", budget)
+        self.assertEqual(63, budget.calls)
+
+    def test_not_active_after_execute(self):
+        with self.assertRaises(BudgetExceededError):
+            self.calculator.execute("f29(1)", Budget(max_calls=10))
+        self.assertIsNone(budgets.current())
+        self.assertEqual(2 ** 10 * 2, self.calculator.execute("f10(1)"))
+
+    def test_declaration_not_applied(self):
+        self.__assert_exceeded("y = f29(1)", Budget(max_calls=1000), "вызовов")
+        self.assertNotIn("y", self.calculator.nt_manager.name_table)
+
+    def test_formula_rolled_back(self):
+        calculator = Calculator(formula_mode=True)
+        calculator.execute("k = 1")
+        calculator.execute("g = lambda(x): x + k")
+        calculator.execute("a = g(1) + g(2) + g(3)")
+        with self.assertRaises(BudgetExceededError):
+            calculator.execute("k = 10", Budget(max_calls=2))
+        self.assertEqual((1, 9), (calculator.nt_manager.name_table["k"], calculator.nt_manager.name_table["a"]))
+
+    def test_memo_not_poisoned(self):
+        calculator = Calculator(memo_size=16)
+        calculator.execute("g = lambda(x): x * 2")
+        calculator.execute("h = lambda(x): g(x) + g(x + 1) + g(x + 2)")
+        with self.assertRaises(BudgetExceededError):
+            calculator.execute("h(1)", Budget(max_calls=2))
+        self.assertEqual(12, calculator.execute("h(1)"))
+
+    def test_expression_evaluate(self):
+        expression = Expression("1+2+3+4")
+        self.assertEqual(10, expression.evaluate(budget=Budget(max_operations=3)))
+        with self.assertRaises(BudgetExceededError):
+            expression.evaluate(budget=Budget(max_operations=2))
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from src.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_hit_and_miss(self):
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.put("a", 1)
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertEqual(0.5, cache.hit_rate)
+
+    def test_eviction(self):
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")    # теперь 'b' - самая давно использованная запись
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(2, len(cache))
+
+    def test_invalidate(self):
+        cache: LRUCache[str, int] = LRUCache(2)
+        cache.put("a", 1)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertNotIn("a", cache)
+
+    def test_disabled(self):
+        cache: LRUCache[str, int] = LRUCache(0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -36,6 +36,121 @@ class TestCalculatorCorrect(TestCase):
         self.calc.execute("y = 15")
         self.assertEqual(16, self.calc.execute("1 + max(abs(y), 12*0.5)"))
 
+    def test_settings(self):
+        calc = Calculator(cache_size=0, max_depth=50, memo_size=8, formula_mode=True, exact_integers=True)
+        settings = calc.settings()
+        self.assertEqual(settings, Calculator(**settings).settings())
+        settings["max_depth"] = None
+        self.assertEqual(50, calc.settings()["max_depth"])
+
+    def test_bracketed_arguments(self):
+        self.assertEqual(2, self.calc.execute("max((1,2))"))
+        self.assertEqual(2, self.calc.execute("max(((1, 2)))"))
+
+    def test_comparisons(self):
+        self.calc.execute("x = 2")
+        self.assertEqual(1, self.calc.execute("x <= 1 + 1"))
+        self.assertEqual(0, self.calc.execute("x >= 3"))
+        self.assertEqual(1, self.calc.execute("x == 2 != 0"))
+        self.assertEqual(3, self.calc.execute("(x > 1) + (x < 3) + (x != 0)"))
+
+    def test_conditional(self):
+        self.calc.execute("x = 0")
+        self.assertEqual(2, self.calc.execute("if(1, 2, 1 / 0)"))
+        self.assertEqual(5, self.calc.execute("if(x, 1 / x, 5)"))
+        self.calc.execute("sign = lambda(a): if(a < 0, -1, if(a > 0, 1, 0))")
+        self.assertEqual([-1, 0, 1], [self.calc.execute(f"sign({a})") for a in (-3, 0, 7)])
+
+
+class TestCalculatorExactIntegers(TestCase):
+
+    calc: Calculator
+
+    def setUp(self):
+        self.calc = Calculator(exact_integers=True)
+
+    def test_big_results(self):
+        self.assertEqual(2 ** 100, self.calc.execute("2 ** 100"))
+        self.assertEqual(1, self.calc.execute("2 ** 100 + 1 - 2 ** 100"))
+        self.assertEqual(3 ** 300 // 7 % 1_000_007, self.calc.execute("3 ** 300 // 7 % 1_000_007"))
+
+    def test_integer_results_are_int(self):
+        self.calc.execute("x = 10")
+        self.assertIs(int, type(self.calc.execute("x // 3 + x % 3")))
+        self.assertIs(int, type(self.calc.execute("x")))
+        self.assertIs(int, type(self.calc.execute("6 / 3")))
+
+    def test_float_when_needed(self):
+        self.assertEqual(3.5, self.calc.execute("7 / 2"))
+        self.assertEqual(1.41, self.calc.execute("2 ** 0.5"))
+        self.assertEqual(0.3, self.calc.execute("0.1 + 0.2"))
+
+    def test_user_functions(self):
+        self.calc.execute("fact = lambda(n): if(n < 1, 1, n * fact(n - 1))")
+        self.assertEqual(265252859812191058636308480000000, self.calc.execute("fact(30)"))
+
+    def test_too_big(self):
+        with self.assertRaisesRegex(UserFriendlyException, "переполнение"):
+            self.calc.execute("2 ** 100000")
+
+    def test_float_mode_unchanged(self):
+        with self.assertRaisesRegex(UserFriendlyException, "переполнение"):
+            Calculator().execute("2 ** 2000")
+        self.assertIs(float, type(Calculator().execute("2 ** 10")))
+
+
+class TestCalculatorCache(TestCase):
+
+    calc: Calculator
+
+    def setUp(self):
+        self.calc = Calculator(cache_size=2)
+
+    def test_hit(self):
+        self.calc.execute("1 + 2")
+        self.assertEqual(3, self.calc.execute("1+2"))    # одинаковый нормализованный ввод
+        self.assertEqual(1, self.calc.expression_cache.hits)
+
+    def test_uses_current_variables(self):
+        self.calc.execute("x = 1")
+        self.assertEqual(2, self.calc.execute("x + 1"))
+        self.calc.execute("x = 5")
+        self.assertEqual(6, self.calc.execute("x + 1"))
+
+    def test_declarations_not_cached(self):
+        self.calc.execute("x = 1")
+        self.calc.execute("x = 1")
+        self.assertEqual(0, len(self.calc.expression_cache))
+
+    def test_bounded(self):
+        for i in range(5):
+            self.calc.execute(f"{i} + 1")
+        self.assertEqual(2, len(self.calc.expression_cache))
+
+
+class TestCalculatorDeepNesting(TestCase):
+
+    DEPTH = 100_000
+
+    def test_deep_brackets(self):
+        self.assertEqual(1, Calculator().execute("(" * self.DEPTH + "1" + ")" * self.DEPTH))
+
+    def test_deep_operations(self):
+        self.assertEqual(self.DEPTH + 1, Calculator().execute("(1+" * self.DEPTH + "1" + ")" * self.DEPTH))
+
+    def test_deep_function_calls(self):
+        depth = self.DEPTH // 10
+        self.assertEqual(1, Calculator().execute("abs(" * depth + "-1" + ")" * depth))
+
+    def test_long_power_chain(self):
+        self.assertEqual(1, Calculator().execute("^".join(["1"] * (self.DEPTH // 10))))
+
+    def test_max_depth(self):
+        calc = Calculator(max_depth=10)
+        self.assertEqual(1, calc.execute("(" * 10 + "1" + ")" * 10))
+        with self.assertRaises(UserFriendlyException):
+            calc.execute("(" * 11 + "1" + ")" * 11)
+
 
 class TestCalculatorInvalidSyntax(TestCase):
 
@@ -0,0 +1,142 @@
+import pickle
+import random
+import unittest
+
+from src.budgets import Budget, BudgetExceededError
+from src.calculator import Calculator
+from src.codegen import generate
+from src.common import UserFriendlyException
+from src.evaluator import EvaluationOptions, TREE, VM, PYTHON
+from src.expressions import Expression
+from tests.test_vm import SETUP, LINES
+
+
+OPERATORS = ("+", "-", "*", "/", "//", "%", "**", "<", "<=", "==", "!=")
+ATOMS = ("0", "1", "2", "3", "0.5", "2.25", "10", "1000", "x", "y", "zero", "unknown", "sq")
+FUNCTIONS = ("max", "min", "abs", "sqrt", "pow", "sq", "hyp", "x", "if", "fact")
+
+
+def random_expression(rng: random.Random, depth: int = 0) -> str:
+    """
+    Случайное выражение из операторов, скобок, унарных знаков, переменных и вызовов функций,
+    в том числе с ошибками (деление на ноль, дробные операнды //, переполнение, неизвестные имена) и с if
+    """
+    kind = rng.random()
+    if depth > 4 or kind < 0.35:
+        return rng.choice(ATOMS)
+    if kind < 0.45:
+        return rng.choice("-+") + random_expression(rng, depth + 1)
+    if kind < 0.6:
+        return "(" + random_expression(rng, depth + 1) + ")"
+    if kind < 0.75:
+        args = ", ".join(random_expression(rng, depth + 1) for _ in range(rng.randint(1, 3)))
+        return f"{rng.choice(FUNCTIONS)}({args})"
+
+    parts = [random_expression(rng, depth + 1)]
+    for _ in range(rng.randint(1, 3)):
+        parts += [rng.choice(OPERATORS), random_expression(rng, depth + 1)]
+    return " ".join(parts)
+
+
+class TestDifferential(unittest.TestCase):
+    """
+    Сгенерированный код должен давать те же результаты (включая тип) и те же ошибки, что и обход дерева
+    """
+
+    @staticmethod
+    def __outcome(calculator: Calculator, line: str) -> tuple:
+        try:
+            value = calculator.execute(line)
+            return "ok", type(value), value
+        except RecursionError:
+            return "recursion",
+        except Exception as e:
+            return type(e), str(e)
+
+    def __assert_same(self, lines: list[str], **kwargs) -> None:
+        calculators = {backend: Calculator(backend=backend, **kwargs)
+                       for backend in (TREE, VM, PYTHON)}
+        for calculator in calculators.values():
+            for line in SETUP:
+                calculator.execute(line)
+
+        for line in lines:
+            with self.subTest(line[:80]):
+                expected = self.__outcome(calculators[TREE], line)
+                self.assertEqual(expected, self.__outcome(calculators[PYTHON], line))
+                self.assertEqual(expected, self.__outcome(calculators[VM], line))
+
+    def test_lines(self):
+        self.__assert_same(LINES)
+
+    def test_first_error_in_evaluation_order(self):
+        # операнды цепочки вычисляются по очереди с операторами: первая ошибка - та же, что и без свертки
+        errors = {"2//0*f(7/y*0)": "Ошибка вычисления выражения: 2#0*f(7/y*0)\nНедопустимая операция: 2",
+                  "(7*7)/(x)/(1%1)/min(2.5)": "Ошибка в выражении: (x)\nНеизвестный идентификатор: x",
+                  "b**s(y)^g(x,2.5,x)": "Ошибка в выражении: s(y)\nНеизвестный идентификатор: s"}
+        for exact_integers in (False, True):
+            for backend in (TREE, VM, PYTHON):
+                calculator = Calculator(backend=backend, exact_integers=exact_integers)
+                calculator.execute("y=1")
+                for line, message in errors.items():
+                    with self.subTest(line, backend=backend, exact_integers=exact_integers):
+                        with self.assertRaises(UserFriendlyException) as context:
+                            calculator.execute(line)
+                        self.assertTrue(str(context.exception).startswith(message), str(context.exception))
+                self.assertEqual(16, calculator.execute("8//y//max(1,1)*2"))
+                self.assertEqual(512, calculator.execute("2^y^2*256"))
+
+    def test_random(self):
+        rng = random.Random(20)
+        self.__assert_same([random_expression(rng) for _ in range(2000)])
+
+    def test_random_compensated_sum(self):
+        rng = random.Random(21)
+        self.__assert_same([random_expression(rng) for _ in range(500)], compensated_sum=True)
+
+    def test_random_exact_integers(self):
+        rng = random.Random(22)
+        self.__assert_same(LINES + [random_expression(rng) for _ in range(1000)], exact_integers=True)
+        self.__assert_same([random_expression(rng) for _ in range(300)], exact_integers=True, compensated_sum=True)
+
+
+class TestGenerate(unittest.TestCase):
+
+    def test_deep_nesting(self):
+        tree = Expression("(" * 5000 + "1+2" + ")" * 5000).parse()
+        self.assertEqual(3, generate(tree).run({}, EvaluationOptions()))
+
+    def test_long_chain(self):
+        tree = Expression("+".join(["1"] * 10_000)).parse()
+        self.assertEqual(10_000, generate(tree).run({}, EvaluationOptions()))
+
+    def test_cached_in_expression(self):
+        expression = Expression("x*2")
+        self.assertIs(expression.compile(backend=PYTHON), expression.compile(backend=PYTHON))
+        self.assertIn("def _run", expression.compile(backend=PYTHON).source)
+        self.assertEqual(4, expression.evaluate({"x": 2.0}, EvaluationOptions(backend=PYTHON)))
+
+    def test_budget(self):
+        calculator = Calculator(backend=PYTHON)
+        calculator.execute("f = lambda(a): a + 1")
+        self.assertEqual(50, calculator.execute("+".join(["1"] * 50), Budget(max_operations=49)))
+        with self.assertRaises(BudgetExceededError):
+            calculator.execute("+".join(["1"] * 51), Budget(max_operations=49))
+        with self.assertRaises(BudgetExceededError):
+            calculator.execute("f(f(f(1)))", Budget(max_calls=2))
+
+    def test_function_pickled_without_code(self):
+        calculator = Calculator(backend=PYTHON)
+        calculator.execute("f = lambda(a): a * 3")
+        self.assertEqual(6, calculator.execute("f(2)"))
+        function = pickle.loads(pickle.dumps(calculator.nt_manager.name_table["f"]))
+        self.assertEqual(9, function(3, options=calculator.options))
+
+    def test_error_is_user_friendly(self):
+        with self.assertRaises(UserFriendlyException):
+            Calculator(backend=PYTHON).execute("5 // 0.5")
+
+
+
+if __name__ == '__main__':
+    unittest.main()
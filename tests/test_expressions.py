@@ -1,15 +1,8 @@
 import unittest
-from typing import Iterable
 
-from src.expressions import Expression as Ex, ExpressionSyntaxError, TokenizedExpression
-from src.common import remove_extra_brackets
-from src.operators import BinaryOperator
-
-
-bop = BinaryOperator.from_symbol
-"""
-Шорткат для BinaryOperator.from_symbol
-"""
+from src.expressions import Expression as Ex
+from src.common import remove_extra_brackets, UserFriendlyException, BracketIndex
+from src.evaluator import EvaluationOptions
 
 
 class TestRemoveExtraBrackets(unittest.TestCase):
@@ -50,75 +43,117 @@ class TestRemoveExtraBrackets(unittest.TestCase):
         self.__assert_equal("(((-5)(*4+3))", "(((-5)(*4+3))")
 
 
-class TestSplitByOperators(unittest.TestCase):
+class TestBracketIndex(unittest.TestCase):
+
+    def test_partner(self):
+        index = BracketIndex("(1+(2))")
+        self.assertEqual((6, 0), (index.partner(0), index.partner(6)))
+        self.assertEqual((5, 3), (index.partner(3), index.partner(5)))
+        self.assertEqual(-1, index.partner(1))
+        self.assertTrue(index.balanced)
+
+    def test_unbalanced(self):
+        self.assertFalse(BracketIndex("(1))").balanced)
+        self.assertFalse(BracketIndex("((1)").balanced)
+
+    def test_strip_span(self):
+        index = BracketIndex("f(((1),(2)))")
+        self.assertEqual((3, 10), index.strip(1, 12))
 
-    def __assert_equal(self, arg: str, ops: Iterable[str], result: TokenizedExpression | None):
+    def test_deep_nesting(self):
+        depth = 100_000
+        self.assertEqual("1", remove_extra_brackets("(" * depth + "1" + ")" * depth))
+
+
+class TestEvaluate(unittest.TestCase):
+
+    def __assert_equal(self, arg: str, result: float):
         """
-        Шорткат для проверки __split_by_operators(arg, ops) == result через assertEqual
+        Шорткат для проверки Expression(arg).evaluate() == result через assertEqual
         """
-        self.assertEqual(result, Ex._Expression__split_by_operators(arg, *ops))    # type: ignore
+        self.assertEqual(result, Ex(arg).evaluate())
 
-    def __assert_raises(self, arg: str, ops: Iterable[str], raises: type[Exception]):
+    def __assert_error(self, arg: str, message: str):
         """
-        Шорткат для проверки, что вызов __split_by_operators(arg, ops) вызывает исключение raises
-        :return:
+        Шорткат для проверки текста ошибки, возникающей при вычислении Expression(arg)
         """
-        with self.assertRaises(raises):
-            Ex._Expression__split_by_operators(arg, *ops)    # type: ignore
+        with self.assertRaises(UserFriendlyException) as context:
+            Ex(arg).evaluate()
+        self.assertEqual(message, str(context.exception))
 
-    def test_basic(self):
-        self.__assert_equal("1+2", "+-", [Ex("1"), bop("+"), Ex("2")])
+    def test_single(self):
+        self.__assert_equal("1.5+2.3", 3.8)
 
     def test_multiple(self):
-        self.__assert_equal("1+2-3.2", "+-", [Ex("1"), bop("+"), Ex("2"), bop("-"), Ex("3.2")])
+        self.__assert_equal("4*0.5/2%3", 1)
 
-    def test_not_matching_ops(self):
-        self.__assert_equal("1*2.456+3/4-5%6", "+-", [Ex("1*2.456"), bop("+"), Ex("3/4"), bop("-"), Ex("5%6")])
+    def test_recursive(self):
+        self.__assert_equal("(2+2.5)*(5#3+1)", 9)
 
-    def test_brackets(self):
-        self.__assert_equal("1+(2-3.04)+4", "+-", [Ex("1"), bop("+"), Ex("(2-3.04)"), bop("+"), Ex("4")])
+    def test_right_associative(self):
+        self.__assert_equal("2^3^2", 512)
 
-    def test_alpha(self):
-        self.__assert_equal("1*a/bcd(3,4.1)*6", "*/", [Ex("1"), bop("*"), Ex("a"), bop("/"), Ex("bcd(3,4.1)"), bop("*"), Ex("6")])
+    def test_unary_rounding(self):
+        self.__assert_equal("-1.234*1", -1.23)
 
-    def test_no_split(self):
-        self.__assert_equal("1*2/3.08%(4-(2+1)-(2*3))^8", "+-", None)
+    def test_signed_literal(self):
+        self.__assert_equal("-1.234", -1.234)
+        self.__assert_equal("(1e-5)", 1e-5)
+        self.assertEqual("-0.0", str(Ex("-0").evaluate()))
 
-    def test_unknown_operator(self):
-        self.__assert_raises("1&2.0", "+-&", ExpressionSyntaxError)
+    def test_long_chain(self):
+        self.__assert_equal("+".join(["1"] * 100_000), 100_000)
 
-    def test_repeated_op(self):
-        self.__assert_raises("1+-2-2.3", "+-", ExpressionSyntaxError)
+    def test_compensated_sum(self):
+        expression = "+".join(["0.001"] * 1000)
+        self.assertEqual(0, Ex(expression).evaluate())    # каждое промежуточное значение округляется до 0
+        self.assertEqual(1, Ex(expression).evaluate(options=EvaluationOptions(compensated_sum=True)))
 
-    def test_empty_input(self):
-        self.__assert_raises("", "+-", ExpressionSyntaxError)
+    def test_compensated_sum_not_for_products(self):
+        options = EvaluationOptions(compensated_sum=True)
+        self.assertEqual(0.01, Ex("0.1*0.1+0.004").evaluate(options=options))
 
-    def test_not_closed_brackets(self):
-        self.__assert_raises("1+2*(3+(5)-1", "+-", ExpressionSyntaxError)
+    def test_chain_error_message(self):
+        self.__assert_error("1+4*2/0*3", "Ошибка вычисления выражения: 4*2/0*3\n"
+                                         "Недопустимая операция: 8.0 / 0 - деление на ноль")
 
-    def test_not_opened_brackets(self):
-        self.__assert_raises("1*(2^3)/4)^3", "*/", ExpressionSyntaxError)
+    def test_parsed_once(self):
+        expression = Ex("x*2")
+        tree = expression.parse()
+        self.assertEqual(6, expression.evaluate({"x": 3.0}))
+        self.assertEqual(8, expression.evaluate({"x": 4.0}))
+        self.assertIs(tree, expression.parse())
 
+    def test_division_by_zero_message(self):
+        self.__assert_error("1+(2/0)", "Ошибка вычисления выражения: (2/0)\n"
+                                       "Недопустимая операция: 2.0 / 0 - деление на ноль")
 
-class TestExecuteBinaryOperators(unittest.TestCase):
+    def test_unknown_identifier_message(self):
+        self.__assert_error("1+((x))", "Ошибка в выражении: ((x))\nНеизвестный идентификатор: x")
 
-    def __assert_equal(self, arg: TokenizedExpression, result: float, reversed_execution_order: bool = False):
-        """
-        Шорткат для проверки __execute_bin_ops(arg, reversed_execution_order) == result через assertEqual
-        """
-        self.assertEqual(result, Ex._Expression__execute_bin_ops(arg, reversed_execution_order))    # type: ignore
+    def test_empty_operand_message(self):
+        self.__assert_error("1+(2+*3)", "Ошибка в выражении: (2+*3)\nНедопустимое выражение: '*3'")
+        self.__assert_error("1+-2-2.3", "Ошибка в выражении: 1+-2-2.3\nНедопустимое выражение: ''")
 
-    def test_single(self):
-        self.__assert_equal([Ex("1.5"), bop("+"), Ex("2.3")], 3.8)
+    def test_operand_before_unary_message(self):
+        self.__assert_error("1*-2", "Ошибка в выражении: 1*-2\nНедопустимое выражение: '1*'")
+        self.__assert_error("2^-1", "Ошибка в выражении: 2^-1\nНедопустимое выражение: '2^'")
+        self.__assert_error("7#-2", "Ошибка в выражении: 7#-2\nНедопустимое выражение: '7#'")
 
-    def test_multiple(self):
-        self.__assert_equal([Ex("4"), bop("*"), Ex("0.5"), bop("/"), Ex("2"), bop("%"), Ex("3")], 1)
+    def test_invalid_operand_message(self):
+        self.__assert_error("x_+1", "Ошибка в выражении: x_+1\nНедопустимое выражение: 'x_'")
+        self.__assert_error(".", "Ошибка в выражении: .\nНедопустимое выражение: '.'")
 
-    def test_recursive(self):
-        self.__assert_equal([Ex("(2+2.5)"), bop("*"), Ex("(5#3+1)")], 9)
+    def test_brackets_messages(self):
+        self.__assert_error("1+2*(3+(5)-1", "Ошибка в выражении: 1+2*(3+(5)-1\nИмеются незакрытые скобки")
+        self.__assert_error("1*(2^3)/4)^3", "Ошибка в выражении: 1*(2^3)/4)^3\nЛишние закрывающие скобки")
 
-    def test_right_associative(self):
-        self.__assert_equal([Ex("2"), bop("^"), Ex("3"), bop("^"), Ex("2")], 512, True)
+    def test_unknown_symbols_message(self):
+        self.__assert_error("1&2.0", "Ошибка в выражении: 1&2.0\nНеизвестный идентификатор: 1&2.0")
+        self.__assert_error("1,2", "Ошибка в выражении: 1,2\nНеизвестный идентификатор: 1,2")
+
+    def test_call_syntax_message(self):
+        self.__assert_error("(1)(2)", "Ошибка в вызове функции: (1)(2)\nОшибка в синтаксисе вызова функции")
 
 
 if __name__ == '__main__':
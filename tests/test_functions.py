@@ -1,6 +1,6 @@
 import unittest
 
-from src.functions import Function, FunctionSyntaxError
+from src.functions import Function, ConditionalFunction, FunctionSyntaxError
 
 
 class TestParseFunctionCall(unittest.TestCase):
@@ -35,5 +35,16 @@ class TestParseFunctionCall(unittest.TestCase):
             Function.try_parse_function_call("func(1, 2, 3)abc")
 
 
+class TestConditionalFunction(unittest.TestCase):
+
+    def test_choice(self):
+        self.assertEqual(2, ConditionalFunction()(1, 2, 3))
+        self.assertEqual(3, ConditionalFunction()(0, 2, 3))
+
+    def test_wrong_argument_count(self):
+        with self.assertRaises(FunctionSyntaxError):
+            ConditionalFunction()(1, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
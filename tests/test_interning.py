@@ -0,0 +1,100 @@
+import unittest
+
+from src import profiling
+from src.budgets import Budget
+from src.calculator import Calculator
+from src.evaluator import evaluate
+from src.interning import NodeInterner
+from src.nodes import child_offsets, shared_subtrees
+from src.parser import Parser
+
+
+class TestNodeInterner(unittest.TestCase):
+
+    interner: NodeInterner
+
+    def setUp(self):
+        self.interner = NodeInterner()
+
+    def __intern(self, expression: str):
+        return self.interner.intern(Parser(expression).parse())
+
+    def test_same_subtree_is_one_object(self):
+        tree = self.__intern("sqrt(x*x+y*y)+1/sqrt(x*x+y*y)")
+        left = tree.operands[0]
+        right = tree.operands[1].operands[1]
+        self.assertIs(left, right)
+        self.assertIs(left.args[0].operands[0].operands[0], left.args[0].operands[0].operands[1])
+
+    def test_shared_across_expressions(self):
+        first = self.__intern("(a+1)*2")
+        second = self.__intern("3-(a+1)")
+        self.assertIs(first.operands[0], second.operands[1])
+        self.assertGreater(self.interner.reused, 0)
+        self.assertGreater(self.interner.saved_bytes, 0)
+
+    def test_text_is_part_of_key(self):
+        tree = self.__intern("1.0+1")
+        self.assertIsNot(tree.operands[0], tree.operands[1])
+        self.assertEqual(["1.0", "1"], [operand.text for operand in tree.operands])
+
+    def test_unreferenced_nodes_are_dropped(self):
+        self.__intern("a*b+c")
+        self.assertEqual(0, len(self.interner))
+        tree = self.__intern("a*b+c")
+        self.assertEqual(5, len(self.interner))
+        self.assertEqual(5, self.interner.stats()["unique"])
+        del tree
+
+    def test_child_offsets(self):
+        tree = self.__intern("(a+1)*(a+1)")
+        self.assertEqual([0, 6], child_offsets(tree))
+        call = self.__intern("max(b,(a+1))")
+        self.assertEqual([4, 6], child_offsets(call))
+
+
+class TestSharedEvaluation(unittest.TestCase):
+
+    calculator: Calculator
+
+    def setUp(self):
+        self.calculator = Calculator()
+        self.calculator.execute("x = 3")
+        self.calculator.execute("y = 4")
+        profiling.PROFILER.reset()
+        profiling.enable()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.PROFILER.reset()
+
+    def test_shared_subtrees(self):
+        tree = NodeInterner().intern(Parser("sqrt(x*x+y*y)+1/sqrt(x*x+y*y)").parse())
+        self.assertEqual({tree.operands[0]: 8}, shared_subtrees(tree))
+
+    def test_computed_once(self):
+        self.assertEqual(5.2, self.calculator.execute("sqrt(x*x+y*y)+1/sqrt(x*x+y*y)"))
+        self.assertEqual(1, profiling.PROFILER.counters[profiling.SHARED_REUSED])
+        self.assertEqual(8, profiling.PROFILER.counters[profiling.SHARED_SKIPPED])
+        # три оператора в x*x+y*y и два в остальном выражении
+        self.assertEqual(5, profiling.PROFILER.phases[profiling.OPERATORS].calls)
+
+    def test_inside_function_body(self):
+        self.calculator.execute("f = lambda(a): (a+1)*(a+1)")
+        self.assertEqual(9, self.calculator.execute("f(2)"))
+        self.assertEqual(16, self.calculator.execute("f(3)"))
+        self.assertEqual(2, profiling.PROFILER.counters[profiling.SHARED_REUSED])
+
+    def test_user_calls_are_not_shared(self):
+        self.calculator.execute("g = lambda(a): a + 1")
+        self.assertEqual(8, self.calculator.execute("g(x)+g(x)", Budget(max_calls=2)))
+        self.assertNotIn(profiling.SHARED_REUSED, profiling.PROFILER.counters)
+
+    def test_without_interning(self):
+        tree = Parser("(x+1)*(x+1)").parse()
+        self.assertEqual({}, shared_subtrees(tree))
+        self.assertEqual(16, evaluate(tree, {"x": 3}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import io
+import json
+import os
+import signal
+import tempfile
+import threading
+import unittest
+from unittest import TestCase
+
+from src.calculator import Calculator
+from src import profiling
+from src.main import run_batch, run_parallel, run_expression_file, execute_line, execute_cancellable
+
+
+class TestRunBatch(TestCase):
+
+    def __run(self, text: str, fail_fast: bool = False) -> tuple[list[str], int, int]:
+        """
+        Шорткат: выполняет text в пакетном режиме, возвращает строки вывода, количество строк и ошибок
+        """
+        output = io.StringIO()
+        processed, errors = run_batch(Calculator(), io.StringIO(text), output, fail_fast=fail_fast)
+        return output.getvalue().splitlines(), processed, errors
+
+    def test_results(self):
+        lines, processed, errors = self.__run("x = 2\nx * 3\n1 + 1\n")
+        self.assertEqual(["OK", "6.0", "2.0"], lines)
+        self.assertEqual((3, 0), (processed, errors))
+
+    def test_blank_lines_skipped(self):
+        lines, processed, errors = self.__run("1+2\n\n   \n3+4\n\n")
+        self.assertEqual(["3.0", "7.0"], lines)
+        self.assertEqual((2, 0), (processed, errors))
+
+    def test_no_prompt(self):
+        lines, _, _ = self.__run("1+2")
+        self.assertFalse(any(">>>" in line for line in lines))
+
+    def test_errors_continue(self):
+        lines, processed, errors = self.__run("1/0\n2+2\n")
+        self.assertEqual("4.0", lines[-1])
+        self.assertEqual((2, 1), (processed, errors))
+
+    def test_fail_fast(self):
+        lines, processed, errors = self.__run("1+1\n1/0\n2+2\n", fail_fast=True)
+        self.assertEqual("2.0", lines[0])
+        self.assertNotIn("4.0", lines)
+        self.assertEqual((2, 1), (processed, errors))
+
+    def test_many_lines(self):
+        lines, processed, _ = self.__run("1+2\n" * 10_000)
+        self.assertEqual(10_000, processed)
+        self.assertEqual(10_000, len(lines))
+
+
+class TestRunParallel(TestCase):
+
+    def test_same_as_batch(self):
+        script = "a = 1\nb = 2\n\na + b\n1 / 0\nc = a * b\nc + 1\n"
+        batch_output, parallel_output = io.StringIO(), io.StringIO()
+        batch_counts = run_batch(Calculator(), io.StringIO(script), batch_output)
+        parallel_counts = run_parallel(Calculator(), io.StringIO(script), parallel_output, workers=2)
+        self.assertEqual(batch_output.getvalue(), parallel_output.getvalue())
+        self.assertEqual(batch_counts, parallel_counts)
+
+    def test_fail_fast(self):
+        output = io.StringIO()
+        processed, errors = run_parallel(Calculator(), io.StringIO("1+1\n1/0\n2+2\n"), output, workers=2, fail_fast=True)
+        self.assertNotIn("4.0", output.getvalue())
+        self.assertEqual((2, 1), (processed, errors))
+
+    def test_commands(self):
+        script = "a = 2\n:stats off\na * 3\n:unknown\na + 1\n"
+        batch_output, parallel_output = io.StringIO(), io.StringIO()
+        batch_counts = run_batch(Calculator(), io.StringIO(script), batch_output)
+        parallel_counts = run_parallel(Calculator(), io.StringIO(script), parallel_output, workers=2)
+        self.assertEqual(batch_output.getvalue(), parallel_output.getvalue())
+        self.assertEqual(batch_counts, parallel_counts)
+
+        output = io.StringIO()
+        self.assertEqual((4, 1), run_parallel(Calculator(), io.StringIO(script), output, workers=2, fail_fast=True))
+        self.assertNotIn("3.0", output.getvalue())
+
+
+class TestExpressionFile(TestCase):
+
+    def test_result_and_error(self):
+        handle, path = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+        try:
+            for text, expected, expected_ok in (("1 +\n2 ** 2\n", "5.0", True), ("1 / 0", "деление на ноль", False)):
+                with self.subTest(text):
+                    with open(path, "w", encoding="utf-8") as file:
+                        file.write(text)
+                    output = io.StringIO()
+                    self.assertEqual(expected_ok, run_expression_file(Calculator(), path, output))
+                    self.assertIn(expected, output.getvalue())
+        finally:
+            os.remove(path)
+
+
+class TestStatsCommand(TestCase):
+
+    calculator: Calculator
+
+    def setUp(self):
+        self.calculator = Calculator()
+        profiling.PROFILER.reset()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.PROFILER.reset()
+
+    def __run(self, line: str) -> str:
+        text, ok = execute_line(self.calculator, line)
+        self.assertTrue(ok, text)
+        return text
+
+    def test_on_off(self):
+        self.__run(":stats on")
+        self.__run("1 + 2")
+        self.__run(":stats off")
+        self.__run("3 + 4")
+        self.assertEqual(1, profiling.PROFILER.phases[profiling.OPERATORS].calls)
+        self.assertIn(profiling.OPERATORS, self.__run(":stats"))
+
+    def test_json(self):
+        self.__run(":stats on")
+        self.__run("1 + 2")
+        self.__run("1 + 2")
+        data = json.loads(self.__run(":stats json"))
+        self.assertEqual(2, data["phases"][profiling.EVALUATE]["calls"])
+        self.assertEqual(1, data["expression_cache"]["hits"])
+        self.assertEqual(data["nodes"]["unique"], len(self.calculator.interner))
+
+    def test_json_file(self):
+        handle, path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        try:
+            self.__run(f":stats json {path}")
+            with open(path, encoding="utf-8") as file:
+                self.assertIn("phases", json.load(file))
+        finally:
+            os.remove(path)
+
+    def test_reset(self):
+        self.__run(":stats on")
+        self.__run("1 + 2")
+        self.__run(":stats reset")
+        self.assertEqual({}, profiling.PROFILER.phases)
+
+    def test_unknown(self):
+        self.assertFalse(execute_line(self.calculator, ":nope")[1])
+        self.assertFalse(execute_line(self.calculator, ":")[1])
+        self.assertFalse(execute_line(self.calculator, ":stats sideways")[1])
+
+    def test_in_batch(self):
+        output = io.StringIO()
+        run_batch(self.calculator, io.StringIO(":stats on\n1+2\n:stats json\n"), output)
+        self.assertIn('"operators"', output.getvalue())
+
+
+class TestCancellation(TestCase):
+
+    @unittest.skipUnless(hasattr(signal, "SIGINT") and hasattr(os, "kill"), "нужен SIGINT")
+    def test_ctrl_c_cancels_evaluation(self):
+        calculator = Calculator()
+        calculator.execute("f0 = lambda(x): x + 1")
+        for i in range(1, 30):
+            calculator.execute(f"f{i} = lambda(x): f{i - 1}(x) + f{i - 1}(x)")
+
+        timer = threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGINT))
+        timer.start()
+        try:
+            text, ok = execute_cancellable(calculator, "y = f29(1)")
+        finally:
+            timer.cancel()
+
+        self.assertFalse(ok)
+        self.assertIn("отменено", text)
+        self.assertNotIn("y", calculator.nt_manager.name_table)
+        self.assertIs(signal.default_int_handler, signal.getsignal(signal.SIGINT))
+        self.assertEqual("3.0", execute_cancellable(calculator, "1 + 2")[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
-from src.common import InvalidIdentifierError
-from src.name_tables import NametableManager
+from src.calculator import Calculator
+from src.common import InvalidIdentifierError, UserFriendlyException
+from src.name_tables import NametableManager, CyclicDependencyError, LayeredNametable, SharedNames, BUILTINS
 
 
 class TestIsDeclaration(unittest.TestCase):
@@ -53,5 +55,193 @@ class TestVarDeclaration(unittest.TestCase):
             self.nt_manager.declare_from_string("x=5=7")
 
 
+class TestDependencies(unittest.TestCase):
+
+    nt_manager: NametableManager
+
+    def setUp(self):
+        self.nt_manager = NametableManager()
+
+    def test_expression(self):
+        dependencies = self.nt_manager.dependencies("x+max(y,2)")
+        self.assertEqual({"x", "y", "max"}, dependencies.reads)
+        self.assertFalse(dependencies.writes)
+
+    def test_declaration(self):
+        dependencies = self.nt_manager.dependencies("x=y*2")
+        self.assertEqual({"y"}, dependencies.reads)
+        self.assertEqual({"x"}, dependencies.writes)
+        self.assertIsNone(dependencies.function_globals)
+
+    def test_function(self):
+        dependencies = self.nt_manager.dependencies("f=lambda(a):a+k")
+        self.assertFalse(dependencies.reads)
+        self.assertEqual({"f"}, dependencies.writes)
+        self.assertEqual({"k"}, dependencies.function_globals)
+
+    def test_syntax_error(self):
+        dependencies = self.nt_manager.dependencies("x=1+")
+        self.assertFalse(dependencies.reads | dependencies.writes)
+
+
+class TestFormulaMode(unittest.TestCase):
+
+    nt_manager: NametableManager
+
+    def setUp(self):
+        self.nt_manager = NametableManager(formula_mode=True)
+
+    def __declare(self, *declarations: str):
+        for declaration in declarations:
+            self.nt_manager.declare_from_string(declaration)
+
+    def __value(self, identifier: str) -> float:
+        return self.nt_manager.name_table[identifier]    # type: ignore
+
+    def test_recompute_downstream(self):
+        self.__declare("a=2", "b=3", "c=a*b+5", "d=c*2", "e=b+1")
+        self.__declare("a=10")
+        self.assertEqual(35, self.__value("c"))
+        self.assertEqual(70, self.__value("d"))
+        self.assertEqual(4, self.__value("e"))
+
+    def test_topological_order(self):
+        """
+        d зависит от a и через b, c - от a; пересчитываться должна после них
+        """
+        self.__declare("a=1", "b=a+1", "c=b*2", "d=c+a+b")
+        self.__declare("a=5")
+        self.assertEqual((6, 12, 23), (self.__value("b"), self.__value("c"), self.__value("d")))
+
+    def test_through_function(self):
+        self.__declare("k=2", "f=lambda(x):x*k", "c=f(3)")
+        self.__declare("k=10")
+        self.assertEqual(30, self.__value("c"))
+        self.__declare("f=lambda(x):x+k")
+        self.assertEqual(13, self.__value("c"))
+
+    def test_only_affected_recomputed(self):
+        self.__declare("a=1", "b=2", "c=a+1", "d=b+1")
+        formula = self.nt_manager.formulas["d"]
+        self.__declare("a=3")
+        self.assertIs(formula, self.nt_manager.formulas["d"])
+        self.assertEqual(4, self.__value("c"))
+
+    def test_self_reference(self):
+        self.__declare("a=1")
+        with self.assertRaises(CyclicDependencyError):
+            self.__declare("a=a+1")
+        self.assertEqual(1, self.__value("a"))
+
+    def test_cycle(self):
+        self.__declare("a=1", "b=a+1", "c=b+1")
+        with self.assertRaises(CyclicDependencyError):
+            self.__declare("a=c*2")
+        self.assertEqual((1, 2, 3), (self.__value("a"), self.__value("b"), self.__value("c")))
+
+    def test_cycle_through_function(self):
+        self.__declare("b=1", "f=lambda(x):x+b", "a=f(1)")
+        with self.assertRaises(CyclicDependencyError):
+            self.__declare("b=a")
+
+    def test_recompute_error_rolls_back(self):
+        self.__declare("a=1", "b=10/a", "c=b+1")
+        with self.assertRaises(UserFriendlyException):
+            self.__declare("a=0")
+        self.assertEqual((1, 10, 11), (self.__value("a"), self.__value("b"), self.__value("c")))
+
+    def test_disabled_by_default(self):
+        manager = NametableManager()
+        manager.declare_from_string("a=1")
+        manager.declare_from_string("b=a+1")
+        manager.declare_from_string("a=5")
+        self.assertEqual(2, manager.name_table["b"])
+
+
+class TestLayeredNametable(unittest.TestCase):
+
+    base: SharedNames
+
+    def setUp(self):
+        library = NametableManager()
+        library.declare_from_string("k=2")
+        library.declare_from_string("double=lambda(x):x*k")
+        self.base = library.name_table.freeze()
+
+    def test_sessions_share_base(self):
+        first, second = NametableManager(base=self.base), NametableManager(base=self.base)
+        first.declare_from_string("k=10")
+        first.declare_from_string("y=double(1)")
+        self.assertEqual(10, first.name_table["y"])
+        self.assertEqual(2, second.name_table["k"])
+        self.assertNotIn("y", second.name_table)
+        self.assertEqual(2, self.base["k"])
+
+    def test_builtins_available(self):
+        manager = NametableManager(base=self.base)
+        manager.declare_from_string("m=max(k,3)")
+        self.assertEqual(3, manager.name_table["m"])
+
+    def test_only_overlay_written(self):
+        manager = NametableManager(base=self.base)
+        manager.declare_from_string("x=1")
+        self.assertEqual({"x": 1}, dict(manager.name_table.overlay))
+        self.assertEqual(len(self.base) + 1, len(manager.name_table))
+        self.assertEqual(set(self.base) | {"x"}, set(manager.name_table))
+
+    def test_snapshot(self):
+        table = LayeredNametable(self.base)
+        table["x"] = 1
+        snapshot = table.snapshot()
+        table["x"] = 2
+        snapshot["y"] = 3
+        self.assertEqual((2, 1), (table["x"], snapshot["x"]))
+        self.assertNotIn("y", table)
+
+    def test_delete(self):
+        table = LayeredNametable(self.base)
+        table["x"] = 1
+        del table["x"]
+        self.assertNotIn("x", table)
+        with self.assertRaises(KeyError):
+            del table["k"]
+
+    def test_freeze_drops_memo(self):
+        manager = NametableManager(memo_size=8)
+        manager.declare_from_string("f=lambda(x):x+1")
+        self.assertIsNone(manager.name_table.freeze()["f"].memo)    # type: ignore
+
+    def test_formula_through_base_function(self):
+        manager = NametableManager(formula_mode=True, base=self.base)
+        manager.declare_from_string("b=double(3)")
+        manager.declare_from_string("k=10")
+        self.assertEqual(30, manager.name_table["b"])
+
+    def test_memo_invalidated_through_base_function(self):
+        manager = NametableManager(memo_size=8, base=self.base)
+        manager.declare_from_string("f=lambda(x):double(x)+1")
+
+        def call() -> float:
+            return manager.name_table["f"](3, name_table=manager.name_table)    # type: ignore
+
+        self.assertEqual(7, call())
+        manager.declare_from_string("k=10")
+        self.assertEqual(31, call())
+
+    def test_concurrent_sessions(self):
+        def session(index: int) -> float:
+            calculator = Calculator(base=self.base)
+            calculator.execute(f"k = {index}")
+            return sum(calculator.execute("double(1) + k") for _ in range(50))    # type: ignore
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(session, range(64)))
+        self.assertEqual([100 * index for index in range(64)], results)
+        self.assertEqual(2, self.base["k"])
+
+    def test_default_base_is_builtins(self):
+        self.assertEqual(set(BUILTINS), set(NametableManager().name_table))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,6 @@
 from unittest import TestCase, main
 
-from src.operators import BinaryOperator as Op, OperationError
+from src.operators import BinaryOperator as Op, OperationError, MAX_INTEGER_BITS
 
 
 class TestSimpleOperators(TestCase):
@@ -64,6 +64,49 @@ class TestModDiv(TestCase):
             Op.from_symbol("%")(4, 6.5)
 
 
+class TestComparison(TestCase):
+
+    def test_true_is_one(self):
+        self.assertEqual(1.0, Op.from_symbol("<")(1, 2))
+        self.assertEqual(1.0, Op.from_symbol("{")(2, 2))
+        self.assertEqual(1.0, Op.from_symbol("~")(0.5, 0.5))
+
+    def test_false_is_zero(self):
+        self.assertEqual(0.0, Op.from_symbol(">")(1, 2))
+        self.assertEqual(0.0, Op.from_symbol("}")(1, 2))
+        self.assertEqual(0.0, Op.from_symbol("!")(3, 3))
+
+    def test_lowest_precedence(self):
+        self.assertLess(Op.from_symbol("<").precedence, Op.from_symbol("+").precedence)
+
+
+class TestExact(TestCase):
+
+    def test_integers_stay_exact(self):
+        self.assertEqual(2 ** 64 + 1, Op.from_symbol("+").exact(2 ** 64, 1))
+        self.assertIs(int, type(Op.from_symbol("*").exact(3.0, 4)))
+        self.assertEqual(3 ** 100, Op.from_symbol("^").exact(3, 100))
+
+    def test_switches_to_float(self):
+        self.assertEqual(3.5, Op.from_symbol("/").exact(7, 2))
+        self.assertIs(int, type(Op.from_symbol("/").exact(6, 3)))
+        self.assertEqual(0.25, Op.from_symbol("^").exact(2, -2))
+        self.assertEqual(2.75, Op.from_symbol("+").exact(2, 0.75))
+
+    def test_integer_checks(self):
+        with self.assertRaises(OperationError):
+            Op.from_symbol("#").exact(4, 0)
+        with self.assertRaises(OperationError):
+            Op.from_symbol("%").exact(4.5, 2)
+        self.assertEqual(-2, Op.from_symbol("#").exact(-3, 2))
+
+    def test_size_limit(self):
+        with self.assertRaises(OperationError):
+            Op.from_symbol("^").exact(2, MAX_INTEGER_BITS + 1)
+        with self.assertRaises(OperationError):
+            Op.from_symbol("*").exact(2 ** MAX_INTEGER_BITS, 2)
+
+
 class TestExtra(TestCase):
 
     def test_overflow(self):
@@ -0,0 +1,136 @@
+import unittest
+
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+from src.evaluator import EvaluationOptions
+from src.name_tables import BUILTINS
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.optimizer import fold_constants
+from src.parser import Parser
+
+
+def fold(expression: str, params: tuple[str, ...] = ("x", ), **kwargs) -> Node:
+    return fold_constants(Parser(expression).parse(), params, **kwargs)
+
+
+class TestFoldConstants(unittest.TestCase):
+
+    def test_constant_subtree(self):
+        tree = fold("x*(2^10+sqrt(16))-a", name_table=BUILTINS, fold_globals=True)
+        assert isinstance(tree, OperatorChain)
+        product = tree.operands[0]
+        assert isinstance(product, OperatorChain)
+        self.assertIsInstance(product.operands[1], Number)
+        self.assertEqual(1028, product.operands[1].value)    # type: ignore
+        self.assertEqual("(2^10+sqrt(16))", product.operands[1].text)
+        self.assertIsInstance(tree.operands[1], Name)
+
+    def test_whole_body(self):
+        tree = fold("1+2*3")
+        self.assertIsInstance(tree, Number)
+        self.assertEqual(7, tree.value)    # type: ignore
+
+    def test_prefix_of_chain(self):
+        tree = fold("2*3*x/4")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual(3, len(tree.operands))
+        self.assertEqual(6, tree.operands[0].value)    # type: ignore
+
+    def test_suffix_of_right_associative_chain(self):
+        tree = fold("x^2^3")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual(2, len(tree.operands))
+        self.assertEqual(8, tree.operands[1].value)    # type: ignore
+
+    def test_params_not_folded(self):
+        tree = fold("x+1", fold_globals=True, name_table={"x": 5.0})
+        self.assertIsInstance(tree, OperatorChain)
+
+    def test_globals_kept_by_default(self):
+        tree = fold("x+a*2", name_table={"a": 5.0})
+        self.assertIsInstance(tree.operands[1], OperatorChain)    # type: ignore
+
+    def test_fold_globals(self):
+        tree = fold("x+a*2", name_table={"a": 5.0}, fold_globals=True)
+        self.assertEqual(10, tree.operands[1].value)    # type: ignore
+
+    def test_builtins_need_name_table(self):
+        self.assertIsInstance(fold("x+sqrt(16)", fold_globals=True).operands[1], Call)    # type: ignore
+
+    def test_builtins_kept_by_default(self):
+        self.assertIsInstance(fold("x+sqrt(16)", name_table=BUILTINS).operands[1], Call)    # type: ignore
+
+    def test_user_function_calls_not_folded(self):
+        calc = Calculator()
+        calc.execute("g = lambda(y): y + 1")
+        tree = fold("x+g(1)", name_table=calc.nt_manager.name_table, fold_globals=True)
+        self.assertIsInstance(tree.operands[1], Call)    # type: ignore
+
+    def test_error_not_folded(self):
+        tree = fold("x+1/0+4%1.5")
+        self.assertEqual(["x", "1/0", "4%1.5"], [operand.text for operand in tree.operands])    # type: ignore
+
+    def test_compensated_sum_not_partially_folded(self):
+        options = EvaluationOptions(compensated_sum=True)
+        tree = fold("0.001+0.001+x", options=options)
+        self.assertEqual(3, len(tree.operands))    # type: ignore
+
+
+class TestFoldedFunctions(unittest.TestCase):
+
+    calc: Calculator
+
+    def setUp(self):
+        self.calc = Calculator()
+
+    def __assert_same_as_unfolded(self, body: str, *args: float):
+        """
+        Шорткат: сравнивает вызов функции со свернутым телом и вычисление тела без свертки
+        """
+        self.calc.execute(f"f = lambda(x, y): {body}")
+        for x, y in zip(args[::2], args[1::2]):
+            self.calc.execute(f"x = {x}")
+            self.calc.execute(f"y = {y}")
+            self.assertEqual(self.calc.execute(body), self.calc.execute(f"f({x}, {y})"))
+
+    def test_results(self):
+        self.__assert_same_as_unfolded("x*(2**10 + sqrt(16)) - 7.5/3", 3, 0, -1.5, 2)
+        self.__assert_same_as_unfolded("1/3*3*x + 2/3*y - max(1, 2.555, 2)", 1, 2, 7, -3)
+        self.__assert_same_as_unfolded("x**2**0.5 - y//2 + 10%4", 4, 9, 2, 3)
+
+    def test_rebound_builtin(self):
+        self.calc.execute("f = lambda(x): x + max(1, 2)")
+        self.calc.execute("max = lambda(a, b): a * b * 10")
+        self.assertEqual(20, self.calc.execute("f(0)"))
+
+    def test_builtin_shadowed_by_caller_parameter(self):
+        self.calc.execute("g = lambda(x): x + sqrt(16)")
+        self.calc.execute("h = lambda(sqrt): g(0)")
+        with self.assertRaisesRegex(UserFriendlyException, "'sqrt' не является функцией"):
+            self.calc.execute("h(1)")
+
+    def test_error_message_unchanged(self):
+        self.calc.execute("f = lambda(x): x + 7 % 2.5")
+        with self.assertRaises(UserFriendlyException) as folded:
+            self.calc.execute("f(1)")
+        self.calc.execute("x = 1")
+        with self.assertRaises(UserFriendlyException) as direct:
+            self.calc.execute("x + 7 % 2.5")
+        self.assertEqual(str(direct.exception), str(folded.exception).split("\n", 1)[1])
+
+    def test_globals_read_at_call_by_default(self):
+        self.calc.execute("a = 1")
+        self.calc.execute("f = lambda(x): x + a * 2")
+        self.calc.execute("a = 10")
+        self.assertEqual(21, self.calc.execute("f(1)"))
+
+    def test_fold_globals_option(self):
+        calc = Calculator(fold_globals=True)
+        calc.execute("a = 1")
+        calc.execute("f = lambda(x): x + a * 2")
+        calc.execute("a = 10")
+        self.assertEqual(3, calc.execute("f(1)"))
+
+
+if __name__ == '__main__':
+    unittest.main()
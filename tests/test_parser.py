@@ -0,0 +1,139 @@
+import time
+import unittest
+
+from src.functions import FunctionSyntaxError
+from src.nodes import Node, Number, Name, Call, OperatorChain
+from src.operators import BinaryOperator
+from src.parser import Parser, ExpressionSyntaxError, tokenize, NUMBER, NAME, OPERATOR, OPEN_BRACKET, CLOSE_BRACKET, END
+
+
+bop = BinaryOperator.from_symbol
+"""
+Шорткат для BinaryOperator.from_symbol
+"""
+
+
+def parse(expression: str) -> Node:
+    return Parser(expression).parse()
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_kinds(self):
+        kinds = [token.kind for token in tokenize("max(1,a)+2")]
+        self.assertEqual([NAME, OPEN_BRACKET, NUMBER, ",", NAME, CLOSE_BRACKET, OPERATOR, NUMBER, END], kinds)
+
+    def test_numbers(self):
+        values = [token.value for token in tokenize("007+1_000+.5+0")[:-1:2]]
+        self.assertEqual([7, 1000, 0.5, 0], values)
+
+    def test_bracket_pairs(self):
+        tokens = tokenize("((1)+(2))")
+        self.assertEqual(8, tokens[0].value)
+        self.assertEqual(0, tokens[8].value)
+
+    def test_not_closed_brackets(self):
+        with self.assertRaises(ExpressionSyntaxError):
+            tokenize("1+2*(3+(5)-1")
+
+    def test_not_opened_brackets(self):
+        with self.assertRaises(ExpressionSyntaxError):
+            tokenize("1*(2^3)/4)^3")
+
+
+class TestParser(unittest.TestCase):
+
+    def __assert_raises(self, arg: str, raises: type[Exception]):
+        """
+        Шорткат для проверки, что разбор arg вызывает исключение raises
+        """
+        with self.assertRaises(raises):
+            parse(arg)
+
+    def test_basic(self):
+        tree = parse("1+2")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual((bop("+"), ), tree.operators)
+        self.assertEqual([1, 2], [operand.value for operand in tree.operands])    # type: ignore
+
+    def test_flat_chain(self):
+        tree = parse("1-2+3-4")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual(4, len(tree.operands))
+        self.assertTrue(all(isinstance(operand, Number) for operand in tree.operands))
+
+    def test_right_associative(self):
+        tree = parse("2^3^2")
+        assert isinstance(tree, OperatorChain)
+        self.assertTrue(tree.right_associative)
+        self.assertEqual(3, len(tree.operands))
+
+    def test_precedence(self):
+        tree = parse("1*2.456+3/4-5%6^2")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual((bop("+"), bop("-")), tree.operators)
+        self.assertEqual(["1*2.456", "3/4", "5%6^2"], [operand.text for operand in tree.operands])
+        self.assertEqual("6^2", tree.operands[2].operands[1].text)    # type: ignore
+
+    def test_brackets(self):
+        tree = parse("1+(2-3.04)+4")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual("(2-3.04)", tree.operands[1].text)
+
+    def test_alpha(self):
+        tree = parse("1*a/bcd(3,4.1)")
+        assert isinstance(tree, OperatorChain)
+        call = tree.operands[2]
+        assert isinstance(call, Call)
+        self.assertEqual("bcd", call.identifier)
+        self.assertEqual(["3", "4.1"], [arg.text for arg in call.args])
+        self.assertIsInstance(tree.operands[1], Name)
+
+    def test_unary(self):
+        tree = parse("-2*3+1")
+        assert isinstance(tree, OperatorChain)
+        self.assertEqual((bop("-"), bop("+")), tree.operators)
+        self.assertEqual("-2*3+1", tree.text)
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            parse("1+2").operands = ()    # type: ignore
+
+    def test_repeated_op(self):
+        self.__assert_raises("1+-2-2.3", ExpressionSyntaxError)
+
+    def test_empty_input(self):
+        self.__assert_raises("", ExpressionSyntaxError)
+
+    def test_invalid_operand(self):
+        self.__assert_raises("1.+2", ExpressionSyntaxError)
+
+    def test_missing_operator(self):
+        self.__assert_raises("(2+3)(3/4)", ExpressionSyntaxError)
+
+    def test_empty_argument(self):
+        self.__assert_raises("max(1,,2)", FunctionSyntaxError)
+
+    def test_text_after_call(self):
+        self.__assert_raises("max(1,2)abc", FunctionSyntaxError)
+
+    def test_linear_time(self):
+        """
+        Разбор должен занимать линейное время: увеличение ввода в 10 раз не должно замедлять разбор в ~100 раз
+        """
+        small = "+".join(["(1*2-3)"] * 1_500)    # ~10 КБ
+        large = "+".join(["(1*2-3)"] * 15_000)    # ~100 КБ
+
+        started = time.perf_counter()
+        parse(small)
+        small_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        parse(large)
+        large_time = time.perf_counter() - started
+
+        self.assertLess(large_time, small_time * 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import unittest
+
+from src import profiling
+from src.calculator import Calculator
+
+
+class TestProfiling(unittest.TestCase):
+
+    calculator: Calculator
+
+    def setUp(self):
+        self.calculator = Calculator()
+        profiling.PROFILER.reset()
+        profiling.enable()
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.PROFILER.reset()
+
+    def __calls(self, phase: str) -> int:
+        stats = profiling.PROFILER.phases.get(phase)
+        return stats.calls if stats is not None else 0
+
+    def test_disabled_collects_nothing(self):
+        profiling.disable()
+        self.calculator.execute("f = lambda(x): x * 2")
+        self.calculator.execute("f(1) + max(2, 3) - 4")
+        self.assertEqual({}, profiling.PROFILER.phases)
+        self.assertEqual({}, profiling.PROFILER.counters)
+
+    def test_phases(self):
+        self.calculator.execute("a = 2")
+        self.calculator.execute("(a + 1) * 3 - 4 / 2")
+        for phase in (profiling.PREPARE, profiling.TOKENIZE, profiling.PARSE, profiling.DECLARE,
+                      profiling.EVALUATE, profiling.RESOLVE, profiling.OPERATORS):
+            with self.subTest(phase):
+                self.assertGreater(self.__calls(phase), 0)
+
+    def test_operator_count(self):
+        self.calculator.execute("1 + 2 + 3 * 4 ** 2")
+        self.assertEqual(4, self.__calls(profiling.OPERATORS))
+
+    def test_calls(self):
+        self.calculator.execute("f = lambda(x): x + 1")
+        profiling.PROFILER.reset()
+        self.calculator.execute("f(max(1, 2)) + f(3)")
+        self.assertEqual(2, self.__calls(profiling.USER_CALLS))
+        self.assertEqual(1, self.__calls(profiling.BUILTIN_CALLS))
+        self.assertEqual(1, self.__calls(profiling.EVALUATE))
+
+    def test_cached_expression_not_parsed_again(self):
+        self.calculator.execute("1 + 2")
+        self.calculator.execute("1 + 2")
+        self.assertEqual(1, self.__calls(profiling.PARSE))
+        self.assertEqual(2, self.__calls(profiling.EVALUATE))
+        self.assertEqual(1, profiling.PROFILER.counters[profiling.EXPRESSIONS])
+
+    def test_failed_evaluation_recorded(self):
+        with self.assertRaises(Exception):
+            self.calculator.execute("1 / 0")
+        self.assertEqual(1, self.__calls(profiling.EVALUATE))
+
+    def test_json(self):
+        self.calculator.execute("1 + 2")
+        data = json.loads(profiling.PROFILER.to_json())
+        self.assertTrue(data["enabled"])
+        self.assertEqual(1, data["phases"][profiling.OPERATORS]["calls"])
+
+    def test_format(self):
+        self.calculator.execute("1 + 2")
+        self.assertIn(profiling.OPERATORS, profiling.PROFILER.format())
+        profiling.PROFILER.reset()
+        self.assertIn("пуста", profiling.PROFILER.format())
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import pickle
+import unittest
+from unittest import TestCase
+
+from src.calculator import Calculator
+from src.operators import BinaryOperator
+from src.parser import Parser
+from src.scripts import execute_script
+
+
+SCRIPT = [
+    "a = 2",
+    "b = 3",
+    "f = lambda(x): x * k",
+    "k = 10",
+    "a + b",
+    "f(a)",
+    "c = f(b) + a",
+    "a = 1 / 0",
+    "a * 2",
+    "k = 1",
+    "d = f(a) + c",
+    "g = lambda(x): f(x) + 1",
+    "g(b)",
+    "b = b + 1",
+    "max(a, b, c, d)",
+    "unknown + 1",
+]
+
+
+class TestExecuteScript(TestCase):
+
+    def __sequential(self, lines: list[str]) -> tuple[list[str], Calculator]:
+        """
+        Шорткат: результаты последовательного выполнения строк через Calculator.execute
+        """
+        calc = Calculator()
+        results = []
+        for line in lines:
+            try:
+                result = calc.execute(line)
+                results.append("OK" if result is None else str(result))
+            except Exception as e:
+                results.append(str(e))
+        return results, calc
+
+    def __assert_matches_sequential(self, lines: list[str], workers: int):
+        expected, expected_calc = self.__sequential(lines)
+        calc = Calculator()
+        results = execute_script(calc, lines, workers=workers)
+
+        self.assertEqual(expected, [str(result) for result in results])
+        for name in ("a", "b", "c", "d", "k"):
+            self.assertEqual(expected_calc.nt_manager.name_table.get(name), calc.nt_manager.name_table.get(name))
+
+    def test_serial(self):
+        self.__assert_matches_sequential(SCRIPT, workers=1)
+
+    def test_parallel(self):
+        self.__assert_matches_sequential(SCRIPT, workers=4)
+
+    def test_independent_lines(self):
+        lines = [f"x{i} = {i} * 2" for i in range(50)] + ["+".join(f"x{i}" for i in range(50))]
+        self.__assert_matches_sequential(lines, workers=3)
+
+    def test_declared_functions_merged(self):
+        calc = Calculator()
+        execute_script(calc, ["k = 2", "f = lambda(x): x * k"], workers=2)
+        self.assertEqual(6, calc.execute("f(3)"))
+
+    def test_calculator_settings(self):
+        library = Calculator()
+        library.execute("k = 2")
+        library.execute("double = lambda(x): x * k")
+        base = library.nt_manager.name_table.freeze()
+
+        lines = ["a = double(3)", "b = double(4)", "k = 5", "double(1) + a + b"]
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                calc = Calculator(memo_size=8, base=base)
+                self.assertEqual([None, None, None, 19], [result.value for result in execute_script(calc, lines, workers)])
+                self.assertEqual(6, calc.execute("a"))
+
+    def test_formula_mode(self):
+        lines = ["a = 5", "c", "d = c + 1"]
+        sequential = Calculator(formula_mode=True)
+        for line in ["a = 1", "c = a * 2"] + lines:
+            sequential.execute(line)
+
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                calc = Calculator(formula_mode=True)
+                calc.execute("a = 1")
+                calc.execute("c = a * 2")
+                results = execute_script(calc, lines, workers=workers)
+                self.assertEqual(10, results[1].value)
+                for name in ("a", "c", "d"):
+                    self.assertEqual(sequential.nt_manager.name_table[name], calc.nt_manager.name_table[name])
+                calc.execute("a = 0")
+                self.assertEqual(1, calc.execute("d"))
+
+    def test_errors(self):
+        results = execute_script(Calculator(), ["1 / 0", "", "2 + 2"], workers=2)
+        self.assertEqual([False, False, True], [result.ok for result in results])
+
+    def test_fail_fast(self):
+        # b = a + 1 - на втором уровне графа, после ошибки первого уровня, но идет раньше нее
+        lines = ["a = 1", "b = a + 1", "1 / 0", "c = 5", "b + c"]
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                calc = Calculator()
+                results = execute_script(calc, lines, workers=workers, fail_fast=True)
+                self.assertEqual([True, True, False], [result.ok for result in results])
+                self.assertEqual(2, calc.execute("b"))
+                self.assertNotIn("c", calc.nt_manager.name_table)
+
+
+class TestPickle(TestCase):
+
+    def test_operator_flyweight(self):
+        op = BinaryOperator.from_symbol("#")
+        self.assertIs(op, pickle.loads(pickle.dumps(op)))
+
+    def test_tree(self):
+        tree = Parser("1+max(a,2)*3^2").parse()
+        restored = pickle.loads(pickle.dumps(tree))
+        self.assertEqual(tree.text, restored.text)
+        self.assertEqual(repr(tree.operands), repr(restored.operands))    # type: ignore
+        with self.assertRaises(AttributeError):
+            restored.start = 0    # type: ignore
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import unittest
+
+from src.budgets import Budget
+from src.server import CalculatorServer, LINE, LENGTH
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+
+    server: CalculatorServer
+    listener: asyncio.Server
+    port: int
+
+    async def asyncSetUp(self):
+        await self.__start(LINE)
+
+    async def asyncTearDown(self):
+        self.listener.close()
+        await self.listener.wait_closed()
+        self.server.close()
+
+    async def __start(self, framing: str, **kwargs) -> None:
+        self.server = CalculatorServer(framing=framing, **kwargs)
+        self.listener = await self.server.start_tcp("127.0.0.1", 0)
+        self.port = self.listener.sockets[0].getsockname()[1]
+
+    async def __connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        return await asyncio.open_connection("127.0.0.1", self.port)
+
+    async def __request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, line: str) -> str:
+        writer.write(f"{line}\n".encode())
+        return (await reader.readline()).decode().rstrip("\n")
+
+    async def test_results(self):
+        reader, writer = await self.__connect()
+        self.assertEqual("+OK", await self.__request(reader, writer, "x = 2"))
+        self.assertEqual("+6.0", await self.__request(reader, writer, "x * 3"))
+        error = await self.__request(reader, writer, "1 / 0")
+        self.assertTrue(error.startswith("-"))
+        self.assertIn("\\n", error)    # многострочная ошибка занимает одну строку ответа
+        writer.close()
+
+    async def test_pipelined(self):
+        reader, writer = await self.__connect()
+        writer.write(b"".join(f"a = {i}\na + 1\n".encode() for i in range(50)))
+        responses = [(await reader.readline()).decode().rstrip("\n") for _ in range(100)]
+        self.assertEqual([f"+{i + 1.0}" for i in range(50)], responses[1::2])
+        writer.close()
+
+    async def test_sessions_isolated(self):
+        first = await self.__connect()
+        second = await self.__connect()
+        await self.__request(*first, "x = 1")
+        self.assertTrue((await self.__request(*second, "x")).startswith("-"))
+        self.assertEqual("+1.0", await self.__request(*first, "x"))
+        first[1].close()
+        second[1].close()
+
+    async def test_slow_client_does_not_block_others(self):
+        slow = await self.__connect()
+        fast = await self.__connect()
+        slow[1].write(("+".join(["1"] * 50_000) + "\n").encode())
+        self.assertEqual("+3.0", await asyncio.wait_for(self.__request(*fast, "1+2"), timeout=30))
+        self.assertEqual("+50000.0", (await slow[0].readline()).decode().rstrip("\n"))
+        slow[1].close()
+        fast[1].close()
+
+    async def test_metrics(self):
+        reader, writer = await self.__connect()
+        await self.__request(reader, writer, "1 + 1")
+        await self.__request(reader, writer, "1 / 0")
+        metrics = json.loads((await self.__request(reader, writer, ":metrics"))[1:])
+        self.assertEqual((1, 1), (metrics["connections_total"], metrics["connections_active"]))
+        self.assertEqual((2, 1), (metrics["requests"], metrics["errors"]))
+        self.assertGreaterEqual(metrics["latency_p99_ms"], metrics["latency_p50_ms"])
+        writer.close()
+        await writer.wait_closed()
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(0, self.server.metrics.connections_active)
+
+    async def test_repl_commands_rejected(self):
+        reader, writer = await self.__connect()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stats.json")
+            self.assertTrue((await self.__request(reader, writer, f":stats json {path}")).startswith("-"))
+            self.assertFalse(os.path.exists(path))
+        for command in (":stats on", ":stats reset", ":stats"):
+            self.assertTrue((await self.__request(reader, writer, command)).startswith("-"))
+        self.assertEqual("+3.0", await self.__request(reader, writer, "1 + 2"))
+        writer.close()
+
+    async def test_length_prefixed(self):
+        await self.asyncTearDown()
+        await self.__start(LENGTH)
+        reader, writer = await self.__connect()
+
+        for line in ("f = lambda(x): x * 2", "f(21)"):
+            encoded = line.encode()
+            writer.write(struct.pack(">I", len(encoded)) + encoded)
+        responses = []
+        for _ in range(2):
+            (size, ) = struct.unpack(">I", await reader.readexactly(4))
+            responses.append((await reader.readexactly(size)).decode())
+        self.assertEqual(["+OK", "+42.0"], responses)
+        writer.close()
+
+    async def test_budget(self):
+        await self.asyncTearDown()
+        await self.__start(LINE, budget_factory=lambda: Budget(max_operations=5))
+        reader, writer = await self.__connect()
+        self.assertIn("Превышен лимит операций", await self.__request(reader, writer, "1+1+1+1+1+1+1"))
+        self.assertEqual("+6.0", await self.__request(reader, writer, "1+1+1+1+1+1"))
+        writer.close()
+
+    @unittest.skipUnless(hasattr(asyncio, "start_unix_server") and os.name == "posix", "нужны Unix сокеты")
+    async def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "calc.sock")
+            listener = await self.server.start_unix(path)
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b"2 ** 10\n")
+            self.assertEqual(b"+1024.0\n", await reader.readline())
+            writer.close()
+            listener.close()
+            await listener.wait_closed()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
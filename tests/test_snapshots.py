@@ -0,0 +1,198 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from src import snapshots
+from src.calculator import Calculator
+from src.functions import CodeBasedFunction
+from src.name_tables import NametableManager
+from src.snapshots import SnapshotError
+from src.user_functions import UserDefinedFunction
+
+
+class TestSnapshots(unittest.TestCase):
+
+    path: str
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".bin")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def __round_trip(self, manager: NametableManager, **kwargs) -> NametableManager:
+        """
+        Шорткат: сохраняет manager и загружает снимок в новый NametableManager(**kwargs)
+        """
+        snapshots.save(manager, self.path)
+        loaded = NametableManager(**kwargs)
+        snapshots.load(loaded, self.path)
+        return loaded
+
+    def test_variables(self):
+        manager = NametableManager()
+        manager.declare_from_string("x=2.5")
+        manager.declare_from_string("y=-1e300")
+        manager.assign("n", 7)
+
+        loaded = self.__round_trip(manager)
+        self.assertEqual({"x": 2.5, "y": -1e300, "n": 7}, {name: loaded.name_table[name] for name in ("x", "y", "n")})
+        self.assertIsInstance(loaded.name_table["n"], int)
+        self.assertIsInstance(loaded.name_table["x"], float)
+
+    def test_big_integers(self):
+        calculator = Calculator(exact_integers=True)
+        calculator.execute("big = 3 ** 200 + 1")
+        calculator.execute("f = lambda(x): x + 2 ** 100 * 3")
+
+        loaded = self.__round_trip(calculator.nt_manager, options=calculator.options)
+        self.assertEqual(3 ** 200 + 1, loaded.name_table["big"])
+        self.assertEqual(2 ** 100 * 3 + 1, loaded.name_table["f"](1, name_table=loaded.name_table,    # type: ignore
+                                                                  options=calculator.options))
+
+    def test_interned_subtrees(self):
+        calculator = Calculator()
+        calculator.execute("x = 3")
+        calculator.execute("sqrt(x*x+1)")
+        # sqrt(x*x+1) взят из другого выражения, второй (a+1) - повтор первого
+        calculator.execute("f = lambda(a): sqrt(x*x+1)*a+(a+1)*(a+1)")
+
+        loaded = self.__round_trip(calculator.nt_manager, interner=calculator.interner)
+        body = loaded.name_table["f"].body    # type: ignore
+        self.assertEqual("sqrt(x*x+1)*a+(a+1)*(a+1)", body.text)
+        self.assertEqual(["(a+1)", "(a+1)"], [operand.text for operand in body.operands[1].operands])
+        self.assertIs(calculator.nt_manager.name_table["f"].body, body)    # type: ignore
+
+    def test_functions(self):
+        manager = NametableManager()
+        manager.declare_from_string("k=3")
+        manager.declare_from_string(Calculator.prepare("g=lambda(x):x**2**k"))
+        manager.declare_from_string(Calculator.prepare("f=lambda(a,b):max(a,b)//2+g(1)-(a%b)"))
+
+        loaded = self.__round_trip(manager)
+        function = loaded.name_table["f"]
+        assert isinstance(function, UserDefinedFunction)
+        self.assertEqual(["a", "b"], function.arg_names)
+        self.assertEqual(manager.name_table["f"](9, 4, name_table=manager.name_table),    # type: ignore
+                         function(9, 4, name_table=loaded.name_table))
+        self.assertEqual(manager.name_table["f"].body.source, function.body.source)    # type: ignore
+
+    def test_function_error_keeps_source(self):
+        manager = NametableManager()
+        manager.declare_from_string("f=lambda(x):1/x")
+
+        loaded = self.__round_trip(manager)
+        with self.assertRaises(Exception) as original:
+            manager.name_table["f"](0, name_table=manager.name_table)    # type: ignore
+        with self.assertRaises(Exception) as restored:
+            loaded.name_table["f"](0, name_table=loaded.name_table)    # type: ignore
+        self.assertEqual(str(original.exception), str(restored.exception))
+
+    def test_builtins_not_saved(self):
+        manager = NametableManager()
+        manager.declare_from_string("abs=5")
+
+        loaded = self.__round_trip(manager)
+        self.assertEqual(5, loaded.name_table["abs"])
+        self.assertIsInstance(loaded.name_table["max"], CodeBasedFunction)
+
+    def test_shared_base_not_saved(self):
+        library = NametableManager()
+        library.declare_from_string("k=2")
+        manager = NametableManager(base=library.name_table.freeze())
+        manager.declare_from_string("x=k+1")
+
+        snapshots.save(manager, self.path)
+        loaded = NametableManager()
+        snapshots.load(loaded, self.path)
+        self.assertEqual(3, loaded.name_table["x"])
+        self.assertNotIn("k", loaded.name_table)
+
+    def test_replaces_declarations(self):
+        manager = NametableManager()
+        manager.declare_from_string("x=1")
+        loaded = NametableManager()
+        loaded.declare_from_string("stale=2")
+
+        snapshots.save(manager, self.path)
+        snapshots.load(loaded, self.path)
+        self.assertNotIn("stale", loaded.name_table)
+        self.assertEqual(1, loaded.name_table["x"])
+
+    def test_formulas(self):
+        manager = NametableManager(formula_mode=True)
+        manager.declare_from_string("a=2")
+        manager.declare_from_string("f=lambda(x):x*a")
+        manager.declare_from_string("b=f(3)+1")
+
+        loaded = self.__round_trip(manager, formula_mode=True)
+        self.assertEqual(7, loaded.name_table["b"])
+        loaded.declare_from_string("a=10")
+        self.assertEqual(31, loaded.name_table["b"])
+
+    def test_memo_size_of_manager(self):
+        manager = NametableManager()
+        manager.declare_from_string("f=lambda(x):x+1")
+
+        loaded = self.__round_trip(manager, memo_size=8)
+        loaded.name_table["f"](1, name_table=loaded.name_table)    # type: ignore
+        self.assertIn("f", loaded.memo_stats())
+
+    def test_code_based_function_rejected(self):
+        manager = NametableManager()
+        manager.assign("twice", CodeBasedFunction(lambda x: x * 2))
+        with self.assertRaises(SnapshotError):
+            snapshots.save(manager, self.path)
+
+    def test_bad_magic(self):
+        with open(self.path, "wb") as file:
+            file.write(b"not a snapshot at all, definitely not" * 2)
+        with self.assertRaises(SnapshotError):
+            snapshots.load(NametableManager(), self.path)
+
+    def test_bad_version(self):
+        snapshots.save(NametableManager(), self.path)
+        with open(self.path, "r+b") as file:
+            file.seek(len(snapshots.MAGIC))
+            file.write(struct.pack("<H", snapshots.VERSION + 1))
+        with self.assertRaises(SnapshotError):
+            snapshots.load(NametableManager(), self.path)
+
+    def test_empty_file(self):
+        with self.assertRaises(SnapshotError):
+            snapshots.load(NametableManager(), self.path)
+
+    def test_truncated(self):
+        manager = NametableManager()
+        manager.declare_from_string("x=1")
+        snapshots.save(manager, self.path)
+        with open(self.path, "r+b") as file:
+            file.truncate(os.path.getsize(self.path) - 4)
+        with self.assertRaises(SnapshotError):
+            snapshots.load(NametableManager(), self.path)
+
+    def test_corrupted(self):
+        manager = NametableManager(formula_mode=True)
+        for line in ("x=2.5", "n=12345678901234567890123", "f=lambda(a,b):a*2+max(a,b)^2^x", "y=f(1,2)-x"):
+            manager.declare_from_string(line)
+        snapshots.save(manager, self.path)
+        with open(self.path, "rb") as file:
+            data = file.read()
+
+        # любой испорченный байт: либо снимок загружается, либо SnapshotError - но не IndexError, KeyError и т. п.
+        for offset in range(struct.calcsize("<6sH"), len(data)):
+            for value in (0x00, 0x01, 0x7F, 0xFF):
+                corrupted = bytearray(data)
+                corrupted[offset] = value
+                with open(self.path, "wb") as file:
+                    file.write(corrupted)
+                try:
+                    snapshots.load(NametableManager(formula_mode=True), self.path)
+                except SnapshotError:
+                    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import os
+import random
+import tempfile
+import unittest
+
+from src.budgets import Budget, BudgetExceededError
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+from src.operators import as_integer
+from src.streaming import evaluate_buffer
+from tests.test_codegen import random_expression
+from tests.test_vm import SETUP, LINES
+
+
+class TestDifferential(unittest.TestCase):
+    """
+    Потоковое вычисление должно давать те же результаты (включая тип), что и обычное, и ошибку там же, где и обычное
+    """
+
+    @staticmethod
+    def __outcome(run, line: str) -> tuple:
+        try:
+            result = run(line)
+            return "ok", type(result), repr(result)
+        except RecursionError:
+            return "recursion",
+        except Exception:
+            # сообщения отличаются: вместо текста выражения - позиция, а из нескольких ошибок сообщается первая по тексту
+            return "error",
+
+    def __assert_same(self, lines: list[str], **kwargs) -> None:
+        calculator = Calculator(**kwargs)
+        for line in SETUP:
+            calculator.execute(line)
+
+        def stream(line: str) -> float:
+            result = evaluate_buffer(line.encode(), calculator.nt_manager.name_table, calculator.options)
+            integer = as_integer(result)
+            if calculator.options.exact_integers and integer is not None:
+                return integer    # как в Calculator.execute
+            return result
+
+        for line in lines:
+            with self.subTest(line[:50]):
+                expected = self.__outcome(calculator.execute, line)
+                actual = self.__outcome(stream, line)
+                self.assertEqual(expected, actual)
+
+    def test_lines(self):
+        self.__assert_same(LINES)
+
+    def test_random(self):
+        rng = random.Random(24)
+        self.__assert_same([random_expression(rng) for _ in range(2000)])
+
+    def test_compensated_sum(self):
+        rng = random.Random(25)
+        lines = LINES + ["1e308 + 1e308 - 1e308", "0.1 - 0.3 + 0.2 + 1e-3 * 5"]
+        self.__assert_same(lines + [random_expression(rng) for _ in range(500)], compensated_sum=True)
+
+    def test_exact_integers(self):
+        rng = random.Random(26)
+        lines = LINES + ["2 ** 100 + 1", "10 ** 20 // 3 - 10 ** 19 / 2 + 0.5"]
+        self.__assert_same(lines + [random_expression(rng) for _ in range(500)], exact_integers=True)
+        self.__assert_same(["2 ** 100 + 1 - 2 ** 100", "2 ** 2000 + 0.5", "9007199254740993 + 1"],
+                           exact_integers=True, compensated_sum=True)
+
+    def test_syntax_errors(self):
+        self.__assert_same(["", "1 +", "(1", "1)", "()", "f()", "max(1,)", "max(,1)", "(1)(2)", "--1", "1, 2", "2. + 1",
+                            "if(1, 2, (3)"])
+
+    def test_syntax_error_after_evaluation_error(self):
+        self.__assert_same(["1 / 0 + (", "1 / 0 + x_", "0**pow(-1,3)%-1*2", "unknown + 1 2 +", "f(1 / 0) + 1.",
+                            "if(0, 1, 2) 3 / 0"])
+
+    def test_literals_and_wrapped_arguments(self):
+        self.__assert_same(["1 2", "-0", "1e-5", "(-2.)", "max(-1e-5, 2)", "x_ + 1", "1. + 2", "-2.", "2 // 3 ** 2",
+                            "max((1, 2))", "max(((1, 2)))", "max((1), 2)", "max(((1)), 2)", "max((1, 2), 3)",
+                            "max((1 + 2, 3))", "max(((1), 2))", "max((1, 2) + 3)", "max((-1e-5, 2))", "if((0, 1, 2))"])
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_whitespace_and_spellings(self):
+        self.assertEqual(3.0, evaluate_buffer(b"\t1 +\n2\r\n", {}))
+        self.assertEqual(1.0, evaluate_buffer(b"2 ** 3 // 3 == 2\n", {}))
+        self.assertEqual(1.0, evaluate_buffer(b"1 <= 2 != 0", {}))
+
+    def test_separated_words(self):
+        # пробелы убираются, как в Calculator.prepare
+        self.assertEqual(12, evaluate_buffer(b"1 2", {}))
+        self.assertEqual(9, evaluate_buffer(b"3 * * 2", {}))
+
+    def test_long_normalized_input(self):
+        # лексемы и многосимвольные операторы на границах частей, которые нормализуются по отдельности
+        line = " + ".join(f"{i} ** 1 // 1 * 12{i}5 <= 1e9" for i in range(5000))
+        expected = Calculator().execute(line)
+        for shift in range(4):
+            with self.subTest(shift):
+                self.assertEqual(expected, evaluate_buffer((" " * shift + line).encode(), {}))
+
+    def test_declaration(self):
+        with self.assertRaisesRegex(UserFriendlyException, "Объявления"):
+            evaluate_buffer(b"x = 1", {})
+
+    def test_conditional_branch_skipped(self):
+        calculator = Calculator()
+        calculator.execute("fact = lambda(n): if(n < 1, 1, n * fact(n - 1))")
+        name_table = calculator.nt_manager.name_table
+        self.assertEqual(120, evaluate_buffer(b"if(0, unknown(1 / 0, (2)), fact(5))", name_table))
+        self.assertEqual(2, evaluate_buffer(b"if(1, if(0, 1 / 0, 2), max(1 / 0))", name_table))
+
+    def test_conditional_arguments(self):
+        for line in (b"if(1)", b"if(1, 2)", b"if(0, 2)", b"if(1, 2, 3, 4)", b"if(0, 2, 3, 4)"):
+            with self.subTest(line):
+                with self.assertRaisesRegex(UserFriendlyException, "if принимает"):
+                    evaluate_buffer(line, {"if": Calculator().nt_manager.name_table["if"]})
+
+    def test_error_position(self):
+        with self.assertRaisesRegex(UserFriendlyException, r"позиция 3\)\n.*деление на ноль"):
+            evaluate_buffer(b"1 + 2 / 0", {})
+
+    def test_max_depth(self):
+        with self.assertRaisesRegex(UserFriendlyException, "глубина вложенности"):
+            evaluate_buffer(b"((1))", {}, max_depth=1)
+        self.assertEqual(1, evaluate_buffer(b"((1))", {}, max_depth=2))
+
+    def test_long_sum(self):
+        terms = 100_000
+        self.assertEqual(terms * 2.0, evaluate_buffer(b"+".join([b"1 * 2"] * terms), {}))
+
+    def test_budget(self):
+        with self.assertRaises(BudgetExceededError):
+            with Budget(max_operations=10):
+                evaluate_buffer(b"+".join([b"1"] * 100), {})
+
+
+class TestCalculatorEvaluateFile(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def __write(self, text: str) -> None:
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(text)
+
+    def test_evaluate(self):
+        calculator = Calculator()
+        calculator.execute("x = 2")
+        self.__write("x * 3 +\n" + " + ".join(["x"] * 10) + "\n")
+        self.assertEqual(26, calculator.evaluate_file(self.path))
+
+    def test_exact_integers(self):
+        self.__write("2 ** 64 // 2")
+        self.assertEqual(2 ** 63, Calculator(exact_integers=True).evaluate_file(self.path))
+
+    def test_empty(self):
+        for text in ("", " \n"):
+            with self.subTest(repr(text)):
+                self.__write(text)
+                with self.assertRaisesRegex(UserFriendlyException, "Пустой ввод"):
+                    Calculator().evaluate_file(self.path)
+
+    def test_recursion_limit(self):
+        calculator = Calculator(max_call_depth=100)
+        calculator.execute("r = lambda(a): r(a) + 1")
+        self.__write("r(1)")
+        with self.assertRaisesRegex(UserFriendlyException, "лимит рекурсии"):
+            calculator.evaluate_file(self.path)
+
+    def test_budget(self):
+        self.__write("1 + 2 + 3")
+        with self.assertRaises(BudgetExceededError):
+            Calculator().evaluate_file(self.path, Budget(max_operations=1))
+
+    def test_missing_file(self):
+        with self.assertRaises(OSError):
+            Calculator().evaluate_file(self.path + ".missing")
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+import unittest
+
+from src.calculator import Calculator
+from src.common import UserFriendlyException, Scope
+from src.evaluator import BACKENDS, TREE, VM, PYTHON, TRACE_REPEATS
+from src.functions import FunctionSyntaxError
+from src.name_tables import NametableManager
+from src.nodes import Node
+from src.user_functions import UserFunctionDefiner, UserDefinedFunction
+
+
+class TestBuildFunction(unittest.TestCase):
+
+    def test_body_parsed_at_definition(self):
+        function = UserFunctionDefiner.build_function_from_string("lambda(x,y):x*x+y")
+        assert isinstance(function, UserDefinedFunction)
+        self.assertIsInstance(function.body, Node)
+        self.assertEqual(["x", "y"], function.arg_names)
+
+    def test_call(self):
+        function = UserFunctionDefiner.build_function_from_string("lambda(x,y):x*x+y-a")
+        self.assertEqual(30, function(5, 10, name_table={"a": 5.0}))
+        self.assertEqual(3, function(1, 7, name_table={"a": 5.0}))
+
+    def test_body_syntax_error(self):
+        with self.assertRaises(UserFriendlyException):
+            UserFunctionDefiner.build_function_from_string("lambda(x):x+*2")
+
+    def test_body_brackets_error(self):
+        with self.assertRaises(UserFriendlyException):
+            UserFunctionDefiner.build_function_from_string("lambda(x):(x+2")
+
+
+class TestCallScope(unittest.TestCase):
+
+    def test_globals_not_mutated(self):
+        function = UserFunctionDefiner.build_function_from_string("lambda(x):x+1")
+        name_table = {"y": 2.0}
+        function(5, name_table=name_table)
+        self.assertEqual({"y": 2.0}, name_table)
+
+    def test_argument_shadows_global(self):
+        function = UserFunctionDefiner.build_function_from_string("lambda(x):x*y")
+        self.assertEqual(15, function(5, name_table={"x": 100.0, "y": 3.0}))
+
+    def test_nested_scope_does_not_grow(self):
+        outer = Scope.extend({"g": 1.0}, {"x": 2.0})
+        inner = Scope.extend(outer, {"y": 3.0})
+        self.assertEqual({"x": 2.0, "y": 3.0}, inner.local_names)
+        self.assertEqual((1.0, 2.0, 3.0), (inner["g"], inner["x"], inner["y"]))
+        self.assertEqual({"x": 2.0}, outer.local_names)
+
+    def test_wrong_argument_count(self):
+        function = UserFunctionDefiner.build_function_from_string("lambda(x,y):x+y")
+        with self.assertRaises(FunctionSyntaxError):
+            function(1)
+        with self.assertRaises(FunctionSyntaxError):
+            function(1, 2, 3)
+
+
+class TestMemo(unittest.TestCase):
+
+    nt_manager: NametableManager
+
+    def setUp(self):
+        self.nt_manager = NametableManager(memo_size=16)
+
+    def __call(self, name: str, *args: float) -> float:
+        """
+        Шорткат для вызова функции из таблицы имен
+        """
+        return self.nt_manager.name_table[name](*args, name_table=self.nt_manager.name_table)    # type: ignore
+
+    def test_disabled_by_default(self):
+        function = UserFunctionDefiner.build_function_from_string("lambda(x):x+1")
+        assert isinstance(function, UserDefinedFunction)
+        self.assertIsNone(function.memo)
+
+    def test_hits(self):
+        self.nt_manager.declare_from_string("f=lambda(x,y):x*y")
+        for _ in range(10):
+            self.assertEqual(12, self.__call("f", 3, 4))
+        self.__call("f", 4, 3)
+
+        memo = self.nt_manager.memo_stats()["f"]
+        self.assertEqual((9, 2), (memo.hits, memo.misses))
+        self.assertAlmostEqual(9 / 11, memo.hit_rate)
+
+    def test_size_cap(self):
+        self.nt_manager.declare_from_string("f=lambda(x):x*2")
+        for x in range(100):
+            self.__call("f", x)
+        self.assertEqual(16, len(self.nt_manager.memo_stats()["f"]))
+
+    def test_invalidated_by_global(self):
+        self.nt_manager.declare_from_string("k=2")
+        self.nt_manager.declare_from_string("f=lambda(x):x*k")
+        self.assertEqual(6, self.__call("f", 3))
+        self.nt_manager.declare_from_string("k=10")
+        self.assertEqual(30, self.__call("f", 3))
+
+    def test_invalidated_transitively(self):
+        self.nt_manager.declare_from_string("k=2")
+        self.nt_manager.declare_from_string("g=lambda(x):x+k")
+        self.nt_manager.declare_from_string("f=lambda(x):g(x)*2")
+        self.assertEqual(10, self.__call("f", 3))
+        self.nt_manager.declare_from_string("k=0")
+        self.assertEqual(6, self.__call("f", 3))
+        self.nt_manager.declare_from_string("g=lambda(x):x")
+        self.assertEqual(6, self.__call("f", 3))
+
+    def test_unrelated_declaration_keeps_memo(self):
+        self.nt_manager.declare_from_string("f=lambda(x):x*2")
+        self.__call("f", 3)
+        self.nt_manager.declare_from_string("z=1")
+        self.__call("f", 3)
+        self.assertEqual(1, self.nt_manager.memo_stats()["f"].hits)
+
+    def test_caller_arguments_not_memoized(self):
+        """
+        Тело функции видит аргументы вызывающей функции, поэтому результат зависит не только от своих аргументов
+        """
+        self.nt_manager.declare_from_string("a=0")
+        self.nt_manager.declare_from_string("g=lambda(x):x+a")
+        self.nt_manager.declare_from_string("f=lambda(a):g(1)")
+        self.assertEqual(2, self.__call("f", 1))
+        self.assertEqual(3, self.__call("f", 2))
+
+
+class TestRecursion(unittest.TestCase):
+    """
+    Тела пользовательских функций вычисляются без стека Python, поэтому глубина рекурсии ограничена max_call_depth
+    """
+
+    @staticmethod
+    def __calculator(backend: str, **kwargs) -> Calculator:
+        calculator = Calculator(backend=backend, **kwargs)
+        calculator.execute("fact = lambda(n): if(n < 1, 1, n * fact(n - 1))")
+        calculator.execute("total = lambda(n): if(n < 1, 0, n + total(n - 1))")
+        calculator.execute("loop = lambda(n, acc): if(n < 1, acc, loop(n - 1, acc + n))")
+        return calculator
+
+    def test_small(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                self.assertEqual(120, self.__calculator(backend).execute("fact(5)"))
+
+    def test_deep(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                self.assertEqual(1250025000, self.__calculator(backend).execute("total(50000)"))
+
+    def test_tail_calls(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                self.assertEqual(1250025000, self.__calculator(backend).execute("loop(50000, 0)"))
+
+    def test_depth_limit(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                calculator = self.__calculator(backend, max_call_depth=100)
+                self.assertEqual(4951, calculator.execute("loop(99, 1)"))
+                with self.assertRaisesRegex(UserFriendlyException, "Достигнут лимит рекурсии"):
+                    calculator.execute("loop(100, 1)")
+                with self.assertRaisesRegex(UserFriendlyException, "Достигнут лимит рекурсии"):
+                    calculator.execute("fact(1000)")
+
+    def test_error_trace_collapsed(self):
+        messages = set()
+        for backend in BACKENDS:
+            calculator = self.__calculator(backend)
+            calculator.execute("bad = lambda(n): if(n < 1, 1 / 0, bad(n - 1))")
+            with self.assertRaises(UserFriendlyException) as error:
+                calculator.execute("bad(1000)")
+            messages.add(str(error.exception))
+
+        self.assertEqual(1, len(messages))
+        lines = messages.pop().split("\n")
+        self.assertEqual("Ошибка в вызове функции: bad(1000)", lines[0])
+        self.assertEqual(["Ошибка в вызове функции: bad(n-1)"] * TRACE_REPEATS, lines[1:TRACE_REPEATS + 1])
+        self.assertEqual(f"[вызов повторяется еще {1000 - TRACE_REPEATS} раз]", lines[TRACE_REPEATS + 1])
+        self.assertIn("деление на ноль", lines[-1])
+
+    def test_memo(self):
+        for backend in BACKENDS:
+            with self.subTest(backend):
+                calculator = Calculator(backend=backend, memo_size=128)
+                calculator.execute("fib = lambda(n): if(n < 2, n, fib(n - 1) + fib(n - 2))")
+                self.assertEqual(1548008755920, calculator.execute("fib(60)"))
+
+    def test_redefined_if(self):
+        for backend in (TREE, VM, PYTHON):
+            with self.subTest(backend):
+                calculator = Calculator(backend=backend)
+                calculator.execute("if = lambda(a, b, c): a + b + c")
+                self.assertEqual(6, calculator.execute("if(1, 2, 3)"))
+
+
+if __name__ == '__main__':
+    unittest.main()
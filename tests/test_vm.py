@@ -0,0 +1,165 @@
+import unittest
+from array import array
+
+from src.budgets import Budget, BudgetExceededError
+from src.calculator import Calculator
+from src.common import UserFriendlyException
+from src.evaluator import EvaluationOptions, TREE, VM
+from src.expressions import Expression
+from src.name_tables import BUILTINS
+from src.vm import compile_tree, CONST, OBJECT, NAME, BINOP, FOLD, RESOLVE, CALL, TEST, SKIP
+
+
+SETUP = [
+    "x = 5 * 2",
+    "y = x - 8",
+    "zero = 0",
+    "sq = lambda(a): a * a",
+    "hyp = lambda(a, b): sq(a) + sq(b)",
+    "r = lambda(a): r(a) + 1",
+    "fact = lambda(n): if(n < 1, 1, n * fact(n - 1))",
+]
+
+LINES = [
+    "5.2 - 2*3/0.5**2 + 7%4//2",
+    "5 + (-1)*((2+3/(2-1)))/(2-4)",
+    "-1 + (+2*3) - (-(+(-1)))",
+    "2 ** 3 ** 2",
+    "(x + 2) * y",
+    "1 + max(abs(y), 12*0.5)",
+    "hyp(3, 4) - sq(x)",
+    "0",
+    "zero",
+    "zero * x",
+    "0.1 + 0.2 + 0.3 - 0.6",
+    "+".join(["0.1"] * 100),
+    "(" * 200 + "1+2" + ")" * 200,
+    "max(" + ",".join(str(i % 17) for i in range(300)) + ")",
+    "x >= 10 == 1",
+    "if(x > y, x, y) + if(zero, 1 / 0, 2) * if(1, 3, 1 / 0)",
+    "if(if(y < x, 0, 1), 1 / 0, if(zero == 0, fact(5), 1 / 0))",
+    "fact(20) / fact(18)",
+    # ошибки
+    "1 / 0",
+    "1 / 0 / unknown",
+    "10 ** 10 ** 10",
+    "unknown + 1",
+    "sq + 1",
+    "x(1)",
+    "nofunc(1 / 0)",
+    "sq(1, 2)",
+    "hyp(1 / 0, 2)",
+    "if(1, 2)",
+    "if(1 / 0, 1, 2)",
+    "if(unknown, 1, 2)",
+    "if(1, 2, 3, 4)",
+    "fact(1 / 0 + 1)",
+    "fact(sq)",
+]
+
+
+class TestDifferential(unittest.TestCase):
+    """
+    Стековая машина должна давать те же результаты и те же сообщения об ошибках, что и обход дерева
+    """
+
+    @staticmethod
+    def __outcome(calculator: Calculator, line: str) -> tuple[str, object]:
+        try:
+            return "ok", calculator.execute(line)
+        except UserFriendlyException as e:
+            return "error", str(e)
+
+    def __assert_same(self, setup: list[str], lines: list[str], **kwargs) -> None:
+        tree, vm = Calculator(backend=TREE, **kwargs), Calculator(backend=VM, **kwargs)
+        for line in setup:
+            tree.execute(line)
+            vm.execute(line)
+
+        for line in lines:
+            with self.subTest(line[:50]):
+                expected = self.__outcome(tree, line)
+                actual = self.__outcome(vm, line)
+                self.assertEqual(expected, actual)
+                self.assertIs(type(expected[1]), type(actual[1]))
+
+    def test_lines(self):
+        self.__assert_same(SETUP, LINES)
+
+    def test_compensated_sum(self):
+        self.__assert_same(SETUP, LINES, compensated_sum=True)
+
+    def test_recursion_limit(self):
+        self.__assert_same(SETUP, ["r(1)"])
+
+    def test_declarations(self):
+        self.__assert_same(SETUP + ["z = hyp(x, y) / 2", "f = lambda(a): z * a"], ["z", "f(2)"])
+
+
+class TestProgram(unittest.TestCase):
+
+    @staticmethod
+    def __compile(expression: str, compensated_sum: bool = False):
+        return compile_tree(Expression(Calculator.prepare(expression)).parse(), compensated_sum)
+
+    def test_storage(self):
+        program = self.__compile("x * 2.5 + 2.5")
+        self.assertIsInstance(program.code, array)
+        self.assertEqual("B", program.code.typecode)
+        self.assertEqual("d", program.constants.typecode)
+        self.assertEqual([2.5], list(program.constants))    # одинаковые константы хранятся один раз
+
+    def test_instructions(self):
+        program = self.__compile("max(x, 1) - 2 * y")
+        self.assertEqual([RESOLVE, NAME, CONST, CALL, CONST, NAME, BINOP, BINOP], list(program.code))
+
+    def test_conditional_jumps(self):
+        program = self.__compile("if(x, 1, 2) + 3")
+        self.assertEqual([RESOLVE, NAME, TEST, CONST, SKIP, CONST, CALL, CONST, BINOP], list(program.code))
+        self.assertEqual(5, program.jumps[program.args[2]])    # ложь - ко второму варианту
+        self.assertEqual(7, program.jumps[program.args[4]])    # после первого варианта - за CALL
+        self.assertEqual(4, program.run({"x": 1.0, "if": BUILTINS["if"]}))
+        self.assertEqual(5, program.run({"x": 0.0, "if": BUILTINS["if"]}))
+
+    def test_long_chain_folds(self):
+        self.assertEqual([CONST, CONST, CONST, FOLD], list(self.__compile("1 + 2 + 3").code))
+
+    def test_compensated_additive_folds(self):
+        self.assertEqual([CONST, CONST, FOLD], list(self.__compile("1 + 2", compensated_sum=True).code))
+        self.assertEqual([CONST, CONST, BINOP], list(self.__compile("1 * 2", compensated_sum=True).code))
+
+    def test_zero_keeps_type(self):
+        program = self.__compile("0")
+        self.assertEqual([OBJECT], list(program.code))
+        self.assertIs(int, type(program.run({})))
+
+    def test_names_interned(self):
+        program = self.__compile("value + value")
+        self.assertIs(program.names[0], program.names[1])
+
+    def test_cached_in_expression(self):
+        expression = Expression("1+x")
+        self.assertIs(expression.compile(), expression.compile())
+        self.assertIsNot(expression.compile(), expression.compile(compensated_sum=True))
+        self.assertEqual(3, expression.evaluate({"x": 2.0}, EvaluationOptions(backend=VM)))
+
+
+class TestBackendOption(unittest.TestCase):
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            Calculator(backend="jit")
+
+    def test_budget(self):
+        calculator = Calculator(backend=VM)
+        calculator.execute("f = lambda(a): a + 1")
+        self.assertEqual(50, calculator.execute("+".join(["1"] * 50), Budget(max_operations=49)))
+        with self.assertRaises(BudgetExceededError):
+            calculator.execute("+".join(["1"] * 51), Budget(max_operations=49))
+        with self.assertRaises(BudgetExceededError):
+            calculator.execute("f(f(f(1)))", Budget(max_calls=2))
+
+
+
+if __name__ == '__main__':
+    unittest.main()